@@ -0,0 +1,212 @@
+"""
+Benchmarks of VM on representative programs, every one is run by `VirtualMachine` and natively by cpython.
+
+    python benchmark.py                                  # all programs
+    python benchmark.py --filter loops --scale 0.1 --top 5
+    python benchmark.py --json results.json
+
+For every program there are the best times of VM and native runs, slowdown of VM, number of instructions
+executed by VM and its throughput in instructions per second. Instructions are counted by a separate run
+with `VMProfiler`, which also gives opcodes taking the most of VM time: self time of opcode excludes time of code
+called by it, so CALL is not charged for the whole callee.
+"""
+import argparse
+import builtins
+import collections
+import contextlib
+import dataclasses
+import io
+import json
+import sys
+import time
+import types
+import typing as tp
+
+from vm import VirtualMachine, VMProfiler
+
+
+@dataclasses.dataclass
+class Program:
+    """Source of program, `N` is defined in its globals as size scaled by `--scale`"""
+    name: str
+    source: str
+    size: int
+
+    def compile(self, scale: float) -> types.CodeType:
+        return compile(f"N = {max(1, round(self.size * scale))}\n{self.source}", self.name, "exec")
+
+
+PROGRAMS = [
+    Program("loops", """
+def main():
+    total = 0
+    for i in range(N):
+        j = 0
+        while j < 10:
+            total += i * j - j
+            j += 1
+    return total
+
+main()
+""", 10000),
+    Program("recursion", """
+def fib(n):
+    return n if n < 2 else fib(n - 1) + fib(n - 2)
+
+fib(N)
+""", 17),
+    Program("comprehensions", """
+def main():
+    squares = [i * i for i in range(N)]
+    evens = {i: square for i, square in enumerate(squares) if square % 2 == 0}
+    residues = {square % 1000 for square in squares}
+    return sum(square for square in squares if square % 3), len(evens), len(residues)
+
+main()
+""", 30000),
+    Program("strings", """
+def main():
+    parts = []
+    line = ''
+    for i in range(N):
+        parts.append(f'{i:05d}:{i % 7!r}')
+        line += str(i)
+        if len(line) > 100:
+            line = ''
+    text = ','.join(parts)
+    return text.upper().count('0'), len(line)
+
+main()
+""", 20000),
+    Program("dicts", """
+def main():
+    words = ['alpha', 'beta', 'gamma', 'delta', 'epsilon']
+    counts = {}
+    for i in range(N):
+        word = words[i % 5] + str(i % 13)
+        counts[word] = counts.get(word, 0) + 1
+    inverted = {}
+    for word, count in counts.items():
+        inverted.setdefault(count, []).append(word)
+    return sorted(inverted)
+
+main()
+""", 20000),
+    Program("objects", """
+class Point:
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+    def shifted(self, dx):
+        return Point(self.x + dx, self.y)
+
+    def norm(self):
+        return abs(self.x) + abs(self.y)
+
+def main():
+    point = Point(0, 1)
+    total = 0
+    for i in range(N):
+        point = point.shifted(1)
+        total += point.norm()
+    return total
+
+main()
+""", 10000),
+]
+
+
+@dataclasses.dataclass
+class Result:
+    """
+    Times are the best of repeated runs in seconds,
+    opcodes are (name, count, time, self time) by `VMProfiler.opcodes` with the slowest first
+    """
+    instructions: int
+    vm_seconds: float
+    native_seconds: float
+    opcodes: list[tuple[str, int, float, float]]
+
+    @property
+    def slowdown(self) -> float:
+        return self.vm_seconds / max(self.native_seconds, 1e-9)
+
+    @property
+    def instructions_per_second(self) -> float:
+        return self.instructions / max(self.vm_seconds, 1e-9)
+
+
+def _best_time(run: tp.Callable[[], tp.Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def measure(program: Program, scale: float = 1.0, repeat: int = 3) -> Result:
+    code = program.compile(scale)
+    with contextlib.redirect_stdout(io.StringIO()):
+        native_seconds = _best_time(lambda: exec(code, {"__name__": "__benchmark__", "__builtins__": builtins}),
+                                    repeat)
+        vm_seconds = _best_time(lambda: VirtualMachine().run(code), repeat)
+        profiler = VMProfiler()
+        VirtualMachine(profiler=profiler).run(code)
+    opcodes = profiler.opcodes()
+    return Result(sum(count for _, count, _, _ in opcodes), vm_seconds, native_seconds, opcodes)
+
+
+def hotspots(results: tp.Iterable[Result]) -> list[tuple[str, int, float]]:
+    """Opcodes of all programs with total numbers of executions and self times, the slowest first"""
+    counts: collections.Counter[str] = collections.Counter()
+    times: collections.defaultdict[str, float] = collections.defaultdict(float)
+    for result in results:
+        for name, count, _, self_spent in result.opcodes:
+            counts[name] += count
+            times[name] += self_spent
+    return sorted(((name, counts[name], times[name]) for name in counts), key=lambda item: -item[2])
+
+
+def to_json(results: dict[str, Result]) -> dict[str, tp.Any]:
+    return {name: {"instructions": result.instructions, "vm_seconds": result.vm_seconds,
+                   "native_seconds": result.native_seconds, "slowdown": result.slowdown,
+                   "instructions_per_second": result.instructions_per_second,
+                   "opcodes": [{"opname": opname, "count": count, "time": spent, "self_time": self_spent}
+                               for opname, count, spent, self_spent in result.opcodes]}
+            for name, result in results.items()}
+
+
+def main(argv: tp.Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplier of sizes of programs")
+    parser.add_argument("--repeat", type=int, default=3, help="number of runs of every program")
+    parser.add_argument("--filter", default="", help="run only programs with this substring in name")
+    parser.add_argument("--top", type=int, default=10, help="number of the slowest opcodes to report")
+    parser.add_argument("--json", help="file to save results with opcodes of every program to")
+    args = parser.parse_args(argv)
+
+    results = {}
+    print(f'{"program":<20}{"native, ms":>12}{"vm, ms":>12}{"slowdown":>10}{"instructions":>14}{"instr/s":>12}')
+    for program in PROGRAMS:
+        if args.filter not in program.name:
+            continue
+        result = results[program.name] = measure(program, args.scale, args.repeat)
+        print(f"{program.name:<20}{result.native_seconds * 1000:>12.2f}{result.vm_seconds * 1000:>12.1f}"
+              f"{result.slowdown:>10.0f}{result.instructions:>14}{result.instructions_per_second:>12.0f}")
+
+    opcodes = hotspots(results.values())
+    total_time = sum(spent for _, _, spent in opcodes if spent > 0) or 1.0
+    print(f'\n{"opcode":<32}{"count":>12}{"self, ms":>12}{"share":>8}')
+    for name, count, spent in opcodes[:args.top]:
+        print(f"{name:<32}{count:>12}{spent * 1000:>12.1f}{spent / total_time:>8.1%}")
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(to_json(results), file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,429 @@
+import builtins
+import contextlib
+import dataclasses
+import dis
+import functools
+import gc
+import io
+import json
+import pathlib
+import pstats
+import re
+import types
+import typing as tp
+
+import pytest
+
+import benchmark
+import vm
+
+
+@dataclasses.dataclass
+class Case:
+    name: str
+    source: str
+
+    def __str__(self) -> str:
+        return self.name
+
+
+def _output(run: tp.Callable[[], tp.Any]) -> str:
+    with contextlib.redirect_stdout(io.StringIO()) as out:
+        run()
+    return out.getvalue()
+
+
+def _codes(code: types.CodeType) -> list[types.CodeType]:
+    """Code object with all code objects nested in it"""
+    nested = [const for const in code.co_consts if isinstance(const, types.CodeType)]
+    return [code] + [inner for const in nested for inner in _codes(const)]
+
+
+TEST_CASES = [
+    Case("repeated_calls", """
+def square(x):
+    return x * x
+
+print([square(i) for i in range(5)], sum(map(square, range(5))))
+for source in ['1 + 1', '2 * 3']:
+    print(eval(compile(source, 'inner', 'eval')))
+"""),
+    Case("jumps", """
+result = []
+i = 0
+while i < 20:
+    i += 1
+    if i % 3 == 0:
+        continue
+    if i > 15:
+        break
+    result.append(i if i % 2 else -i)
+print(result, i)
+print([x for x in range(10) if x % 2 and x > 3], 0 or [] or 'last', 1 and 2 and 0, None or 5)
+for x in [None, 0, 1]:
+    print(x is None, x is not None, 'yes' if x else 'no')
+else:
+    print('done')
+"""),
+    Case("closures_and_kwargs", """
+def counter(start):
+    count = start
+    def increment(step=1):
+        nonlocal count
+        count += step
+        return count
+    return increment
+
+inc = counter(10)
+print(inc(), inc(5), inc(step=-3))
+
+def adders():
+    return [lambda x, i=i: x + i for i in range(3)]
+
+print([add(10) for add in adders()])
+
+def bind(a, b=2, /, c=3, *args, d, e=5, **kwargs):
+    return a, b, c, args, d, e, sorted(kwargs.items())
+
+print(bind(1, d=4))
+print(bind(1, 2, 3, 4, 5, d=6, f=7, c_=8))
+print(bind(*[1, 2], **{'c': 30, 'd': 40}))
+for args, kwargs in [((), {}), ((1,), {}), ((1,), {'d': 1, 'a': 2}), ((1, 2, 3), {'c': 1, 'd': 1})]:
+    try:
+        bind(*args, **kwargs)
+    except TypeError as error:
+        print(type(error).__name__, args, kwargs)
+"""),
+    Case("method_cache", """
+class Base:
+    def get(self):
+        return 'base'
+
+class Child(Base):
+    pass
+
+child = Child()
+result = []
+for i in range(30):
+    if i == 5:
+        setattr(Base, 'get', lambda self: 'native')
+    if i == 10:
+        Base.get = lambda self: 'vm'
+    if i == 15:
+        setattr(Child, 'get', lambda self: 'child')
+    if i == 20:
+        child.get = lambda: 'instance'
+    if i == 25:
+        del child.get
+        delattr(Child, 'get')
+    bound = child.get
+    result.append((child.get(), bound()))
+print(result)
+print([str.upper(s) for s in 'ab'], [s.upper() for s in 'ab'])
+
+def lookup():
+    return scale * len('ab')
+
+scale = 1
+values = []
+for i in range(12):
+    if i == 4:
+        scale = 10
+    if i == 6:
+        len = lambda value: -1
+    if i == 8:
+        del len
+    values.append(lookup())
+print(values)
+"""),
+    Case("quickening", """
+def add(a, b):
+    return a + b
+
+class Int(int):
+    def __add__(self, other):
+        return 'Int'
+
+print([add(i, i) for i in range(20)])
+print(add(0.5, 0.25), add('a', 'b'), add(Int(1), 2), add([1], [2]))
+print([add(i, 1) for i in range(20)], [add(i / 2, 1.0) for i in range(20)])
+for value in [1, 1.5, 'x'] * 10:
+    print(add(value, value), end=' ')
+"""),
+    Case("generators", """
+def echo():
+    received = []
+    try:
+        while True:
+            try:
+                value = yield len(received)
+                received.append(value)
+            except KeyError as error:
+                received.append('caught ' + str(error))
+    finally:
+        print('closed with', received)
+
+gen = echo()
+print(next(gen), gen.send('a'), gen.throw(KeyError('k')), gen.send('b'))
+gen.close()
+gen.close()
+
+def inner():
+    try:
+        yield 1
+        yield 2
+    except ValueError:
+        yield 'inner caught'
+    return 'result'
+
+def outer():
+    result = yield from inner()
+    yield result
+
+gen = outer()
+print(next(gen), gen.throw(ValueError), next(gen))
+try:
+    next(gen)
+except StopIteration as stop:
+    print('stop', stop.value)
+
+gen = inner()
+next(gen)
+try:
+    gen.throw(TypeError('unhandled'))
+except TypeError as error:
+    print('propagated', error)
+print(list(gen))
+print(sum(x * x for x in range(10)), list(zip(range(3), (c for c in 'abc'))))
+"""),
+    Case("generator_collected", """
+import gc
+
+def resource(name):
+    try:
+        yield name
+    finally:
+        print('released', name)
+
+for name in ['a', 'b']:
+    gen = resource(name)
+    print(next(gen))
+    del gen
+    gc.collect()
+    print('collected', name)
+unstarted = resource('c')
+del unstarted
+gc.collect()
+print('unstarted is not run')
+"""),
+    Case("try_except_finally", """
+def nested(kind):
+    log = []
+    try:
+        try:
+            log.append('body')
+            if kind == 'value':
+                raise ValueError(kind)
+            if kind == 'key':
+                raise KeyError(kind)
+            if kind == 'return':
+                return log
+        except ValueError as error:
+            log.append('inner ' + str(error))
+            raise RuntimeError('wrapped') from error
+        finally:
+            log.append('inner finally')
+    except RuntimeError as error:
+        log.append(f'outer {error} from {error.__cause__!r}')
+    except KeyError as error:
+        log.append(f'outer key, context {error.__context__!r}')
+    else:
+        log.append('else')
+    finally:
+        log.append('outer finally')
+    return log
+
+for kind in ['none', 'value', 'key', 'return']:
+    print(nested(kind))
+
+def finally_overrides():
+    for i in range(5):
+        try:
+            if i == 1:
+                continue
+            if i == 3:
+                break
+        finally:
+            print('finally', i)
+    try:
+        return 'try'
+    finally:
+        return 'finally'
+
+print(finally_overrides())
+
+try:
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        [][1]
+except IndexError as error:
+    print(type(error.__context__).__name__)
+
+class Manager:
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc_info):
+        print('exit', exc_info[0])
+        return exc_info[0] is KeyError
+
+with Manager():
+    raise KeyError
+try:
+    with Manager():
+        raise ValueError
+except ValueError:
+    print('not suppressed')
+"""),
+]
+
+
+@pytest.mark.parametrize("test_case", TEST_CASES, ids=str)
+def test_vm(test_case: Case) -> None:
+    code = compile(test_case.source, test_case.name, "exec")
+    expected = _output(lambda: exec(code, {"__name__": "__main__", "__builtins__": builtins}))
+    assert _output(lambda: vm.VirtualMachine().run(code)) == expected
+
+
+@pytest.mark.parametrize("args, kwargs, error", [
+    ((), {"d": 4}, vm.ERR_MISSING_POS_ARGS),
+    ((1, 2, 3, 4), {"d": 4}, vm.ERR_TOO_MANY_POS_ARGS),
+    ((1,), {}, vm.ERR_MISSING_KWONLY_ARGS),
+    ((1,), {"d": 4, "f": 6}, vm.ERR_TOO_MANY_KW_ARGS),
+    ((1,), {"b": 2, "d": 4}, vm.ERR_POSONLY_PASSED_AS_KW),
+    ((1, 2, 3), {"c": 3, "d": 4}, vm.ERR_MULT_VALUES_FOR_ARG),
+])
+def test_binding_errors(args: tuple[tp.Any, ...], kwargs: dict[str, tp.Any], error: str) -> None:
+    code, = [const for const in compile("def f(a, b=2, /, c=3, *, d, e=5): pass", "bind", "exec").co_consts
+             if isinstance(const, types.CodeType)]
+    function = vm.Function(code, vm.Namespace(), builtins.__dict__, vm.VirtualMachine(), (2, 3), {"e": 5})
+    assert function(1, d=4) is None
+    with pytest.raises(TypeError, match=error):
+        function(*args, **kwargs)
+
+
+def test_quickening_and_deoptimization(monkeypatch: pytest.MonkeyPatch) -> None:
+    code = compile("""
+def add(a, b):
+    return a + b
+
+def attr(o):
+    return o.method
+
+class C:
+    def method(self):
+        return 1
+
+for _ in range(20):
+    add(1, 2)
+    attr(C())
+checkpoint()
+add(0.5, 1.0)
+C.method = lambda self: 2
+print(attr(C())())
+checkpoint()
+""", "quickening", "exec")
+    functions = {const.co_name: const for const in code.co_consts if isinstance(const, types.CodeType)}
+    handlers: list[set[str]] = []
+    monkeypatch.setattr(builtins, "checkpoint", lambda: handlers.append(
+        {handler.__name__ for name in ("add", "attr") for handler, _ in vm.decode(functions[name]).handlers}),
+        raising=False)
+
+    assert _output(lambda: vm.VirtualMachine().run(code)) == "2\n"
+    quickened, deoptimized = handlers
+    assert {"binary_op_add_int_op", "load_attr_function_op"} <= quickened
+    assert {"binary_op_op", "load_attr_op"} <= deoptimized
+    assert not {"binary_op_add_int_op", "load_attr_function_op"} & deoptimized
+
+
+def test_decoded_code_is_dropped_with_code() -> None:
+    code = compile("print([i * i for i in range(3)])", "decode_cache", "exec")
+    assert _output(functools.partial(vm.VirtualMachine().run, code)) == "[0, 1, 4]\n"
+    keys = [id(nested) for nested in _codes(code)]
+    assert all(key in vm._decoded for key in keys)
+
+    del code
+    gc.collect()
+    assert not any(key in vm._decoded for key in keys)
+
+
+def test_trace() -> None:
+    code = compile("print(sum(i for i in range(3)))", "trace", "exec")
+    trace = io.StringIO()
+    assert _output(lambda: vm.VirtualMachine(trace=trace).run(code)) == "3\n"
+    assert "opname='RETURN_VALUE'" in trace.getvalue()
+    assert "stack: " in trace.getvalue()
+
+
+def test_jump_targets_are_indexed_by_offset() -> None:
+    source = next(case.source for case in TEST_CASES if case.name == "jumps")
+    for nested in _codes(compile(source, "jumps", "exec")):
+        decoded = vm.decode(nested)
+        assert [decoded.indices[instruction.offset] for instruction in decoded.instructions] == \
+            list(range(len(decoded.instructions)))
+        targets = [instruction.argval for instruction in decoded.instructions if instruction.opcode in dis.hasjrel]
+        assert targets and all(decoded.instructions[decoded.indices[target]].offset == target for target in targets)
+
+
+def test_profiler_exports(tmp_path: pathlib.Path) -> None:
+    code = compile("""
+def fib(n):
+    return n if n < 2 else fib(n - 1) + fib(n - 2)
+
+def countdown(n):
+    while n:
+        yield n
+        n -= 1
+
+print(fib(10), list(countdown(3)))
+""", "profiled", "exec")
+    profiler = vm.VMProfiler()
+    assert _output(lambda: vm.VirtualMachine(profiler=profiler).run(code)) == "55 [3, 2, 1]\n"
+
+    profiler.dump_stats(str(tmp_path / "vm.prof"))
+    profile = pstats.Stats(str(tmp_path / "vm.prof")).get_stats_profile()
+    # calls as total/primitive, recursive calls are not primitive, resumptions of generator are not calls
+    assert {name: function.ncalls for name, function in profile.func_profiles.items()} == \
+        {"<module>": "1", "fib": "177/1", "countdown": "1"}
+
+    profiler.dump_json(str(tmp_path / "vm.json"))
+    with open(tmp_path / "vm.json") as file:
+        result = json.load(file)
+    assert {function["name"]: function["calls"] for function in result["functions"]} == \
+        {"<module>": 1, "fib": 177, "countdown": 1}
+    opcodes = {opcode["opname"]: opcode["count"] for opcode in result["opcodes"]}
+    assert opcodes["YIELD_VALUE"] == 3 and opcodes["BINARY_OP"] >= 3 * 88
+    assert "fib" in profiler.report()
+
+
+def test_exception_table() -> None:
+    source = next(case.source for case in TEST_CASES if case.name == "try_except_finally")
+    tables = {}
+    for code in _codes(compile(source, "try_except_finally", "exec")):
+        # disassembly lists entries as "start to last covered offset -> target [depth] lasti"
+        listed = re.findall(r"^ +(\d+) to (\d+) -> (\d+) \[(\d+)\]( lasti)?$", dis.Bytecode(code).dis(), re.MULTILINE)
+        expected = [(int(start), int(last) + 2, int(target), int(depth), bool(lasti))
+                    for start, last, target, depth, lasti in listed]
+        assert vm._exception_table(code) == expected
+        tables[code.co_name] = expected
+    assert tables["<module>"] and tables["nested"] and tables["finally_overrides"]
+
+
+def test_benchmark(tmp_path: pathlib.Path) -> None:
+    argv = ["--scale", "0.01", "--repeat", "1", "--json", str(tmp_path / "bench.json")]
+    output = _output(lambda: benchmark.main(argv))
+    with open(tmp_path / "bench.json") as file:
+        result = json.load(file)
+    assert set(result) == {program.name for program in benchmark.PROGRAMS}
+    for name, program in result.items():
+        assert name in output and program["instructions"] > 0 and program["opcodes"]
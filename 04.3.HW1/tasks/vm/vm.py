@@ -1,20 +1,26 @@
 """
-Simplified VM code which works for some cases.
-You need extend/rewrite code to pass all cases.
+Virtual machine running bytecode of cpython 3.11 with frames, generators and exceptions implemented in python.
+Instructions of every code object are decoded once into handlers with operands, some of them are specialized
+(quickened) while running and are reverted when their assumptions fail. `VMProfiler` counts and times instructions.
 """
 
+import bisect
 import builtins
+import collections
 import dis
+import itertools
+import json
+import marshal
+import operator
+import time
 import types
 import typing as tp
-
-# def eprint(*args, **kwargs):
-#     print(*args, file=sys.stderr, **kwargs)
-
-fl = open("debug_n", "w")
+import weakref
 
 CO_VARARGS = 4
 CO_VARKEYWORDS = 8
+CO_COROUTINE = 128
+CO_ASYNC_GENERATOR = 512
 
 ERR_TOO_MANY_POS_ARGS = 'Too many positional arguments'
 ERR_TOO_MANY_KW_ARGS = 'Too many keyword arguments'
@@ -24,6 +30,77 @@ ERR_MISSING_KWONLY_ARGS = 'Missing keyword-only arguments'
 ERR_POSONLY_PASSED_AS_KW = 'Positional-only argument passed as keyword argument'
 
 
+class Null:
+    """Marker of empty stack slots and unbound local variables, like NULL in cpython"""
+
+    def __repr__(self) -> str:
+        return "NULL"
+
+
+NULL = Null()
+
+_versions = itertools.count(1)
+# changed when VM code modifies attributes of some class, invalidates caches of method lookups;
+# methods changed by native code (like `setattr` builtin) are found by `InlineCache.moved`
+_types_version = 0
+
+
+class Namespace(dict):  # type: ignore
+    """
+    Globals of code run in VM; `version` identifies set of its keys, it is unique among all namespaces
+    and changes when VM code adds or deletes a key (modifications by native code are not tracked)
+    """
+
+    def __init__(self, *args: tp.Any, **kwargs: tp.Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.version = next(_versions)
+
+    def keys_changed(self) -> None:
+        self.version = next(_versions)
+
+
+class InlineCache:
+    """
+    State kept between executions of one instruction, like inline caches of cpython 3.11;
+    handlers taking `cache` get their own instance for every instruction
+    """
+    __slots__ = ("key", "version", "value", "flag", "owner", "shadows", "misses")
+
+    def __init__(self) -> None:
+        self.key: tp.Any = None
+        self.version = 0
+        self.value: tp.Any = NULL
+        self.flag = False
+        # namespace of class where cached value is found and namespaces of classes preceding it in MRO
+        self.owner: tp.Mapping[str, tp.Any] = {}
+        self.shadows: tuple[tp.Mapping[str, tp.Any], ...] = ()
+        self.misses = 0
+
+    def moved(self, name: str) -> bool:
+        """Whether cached value is not found by name in class anymore since the class or its MRO is changed"""
+        return self.owner.get(name) is not self.value or any(name in namespace for namespace in self.shadows)
+
+
+# BINARY_OP argument is index in this table, see `dis._nb_ops`
+_BINARY_OPS: list[tp.Callable[[tp.Any, tp.Any], tp.Any]] = [
+    operator.add, operator.and_, operator.floordiv, operator.lshift, operator.matmul, operator.mul,
+    operator.mod, operator.or_, operator.pow, operator.rshift, operator.sub, operator.truediv, operator.xor,
+    operator.iadd, operator.iand, operator.ifloordiv, operator.ilshift, operator.imatmul, operator.imul,
+    operator.imod, operator.ior, operator.ipow, operator.irshift, operator.isub, operator.itruediv, operator.ixor,
+]
+# COMPARE_OP argument is index in this table, see `dis.cmp_op`
+_COMPARE_OPS: list[tp.Callable[[tp.Any, tp.Any], tp.Any]] = [
+    operator.lt, operator.le, operator.eq, operator.ne, operator.gt, operator.ge,
+]
+# BINARY_OP is quickened after this number of executions with operands of the same type
+QUICKEN_AFTER = 8
+# and is not quickened anymore after this number of deoptimizations
+MAX_DEOPTIMIZATIONS = 4
+
+# types of descriptors which are bound to instance as methods, so LOAD_METHOD may skip creation of bound method
+_METHOD_TYPES = (types.FunctionType, types.MethodDescriptorType, types.WrapperDescriptorType)
+
+
 def bind_args(pos_defaults: tuple[tp.Any], code: tp.Any, *args: tp.Any, **kwargs: tp.Any) -> dict[str, tp.Any]:
     """Bind values from `args` and `kwargs` to corresponding arguments of `func`
 
@@ -136,6 +213,111 @@ def bind_args(pos_defaults: tuple[tp.Any], code: tp.Any, *args: tp.Any, **kwargs
     return result
 
 
+def _exception_table(code: types.CodeType) -> list[tuple[int, int, int, int, bool]]:
+    """
+    Entries of exception table of code object, format is described in
+        https://github.com/python/cpython/blob/3.11/Objects/exception_handling_notes.txt
+    :return: (start offset, end offset, offset of handler, depth of stack, lasti) for every entry
+    """
+    table = code.co_exceptiontable
+    position = 0
+
+    def varint() -> int:
+        # numbers are written by 6 bits, the most significant first, bit 6 tells that more bits follow
+        nonlocal position
+        value = 0
+        while True:
+            byte = table[position]
+            position += 1
+            value = value << 6 | byte & 63
+            if not byte & 64:
+                return value
+
+    entries = []
+    while position < len(table):
+        start = varint() * 2
+        end = start + varint() * 2
+        target = varint() * 2
+        depth_and_lasti = varint()
+        entries.append((start, end, target, depth_and_lasti >> 1, bool(depth_and_lasti & 1)))
+    return entries
+
+
+class Decoded:
+    """
+    Instructions of code object decoded once for all frames running it:
+    for every instruction there is its handler (unbound method of `Frame`) and operands to call it with.
+    Also layout of fast locals and plan of binding arguments to them.
+    """
+
+    def __init__(self, code: types.CodeType) -> None:
+        self.instructions = list(dis.get_instructions(code))
+        # jumps refer to offsets of instructions
+        self.indices = {instruction.offset: index for index, instruction in enumerate(self.instructions)}
+        self.handlers: list[tuple[tp.Callable[..., None], tuple[tp.Any, ...]]] = []
+        for instruction in self.instructions:
+            handler = getattr(Frame, instruction.opname.lower() + "_op", None)
+            if handler is None:
+                self.handlers.append((Frame.unknown_op, (instruction.opname,)))
+                continue
+            # handlers take `argval`, `arg` and/or `cache` (or nothing) besides self
+            parameters = handler.__code__.co_varnames[1:handler.__code__.co_argcount]
+            operands = tuple(instruction.argval if parameter == "argval" else
+                             instruction.arg if parameter == "arg" else InlineCache()
+                             for parameter in parameters)
+            self.handlers.append((handler, operands))
+
+        # fast locals are variables, then cells which are not arguments, then free variables
+        self.names = list(code.co_varnames)
+        self.names += [name for name in code.co_cellvars if name not in code.co_varnames]
+        self.names += code.co_freevars
+        self.nulls = [NULL] * (len(self.names) - code.co_argcount)
+        self.argcount = code.co_argcount
+        self.kwonlyargcount = code.co_kwonlyargcount
+        index = code.co_argcount + code.co_kwonlyargcount
+        self.varargs_index = self.varkwargs_index = -1
+        if code.co_flags & CO_VARARGS:
+            self.varargs_index, index = index, index + 1
+        if code.co_flags & CO_VARKEYWORDS:
+            self.varkwargs_index = index
+        # positional calls of functions without *args, **kwargs and keyword-only arguments just copy arguments
+        self.simple = self.varargs_index < 0 and self.varkwargs_index < 0 and not code.co_kwonlyargcount
+        self.keyword_indices = {name: index for index, name in enumerate(code.co_varnames[:index])
+                                if index >= code.co_posonlyargcount}
+        self.positional_only = set(code.co_varnames[:code.co_posonlyargcount])
+
+        # exception table with offsets converted to indices of instructions, entries do not overlap and are sorted,
+        # so handler is found by binary search over starts and nothing is done until some instruction raises
+        offsets = [instruction.offset for instruction in self.instructions]
+        entries = _exception_table(code)
+        self.handler_starts = [bisect.bisect_left(offsets, start) for start, _, _, _, _ in entries]
+        self.exception_handlers = [(bisect.bisect_left(offsets, end), self.indices[target], depth, lasti)
+                                   for _, end, target, depth, lasti in entries]
+
+    def exception_handler(self, index: int) -> tuple[int, int, int, bool] | None:
+        """
+        Entry of exception table covering instruction
+        :return: (index of the first instruction after covered ones, index of handler, depth of stack, lasti) or None
+        """
+        position = bisect.bisect_right(self.handler_starts, index) - 1
+        if position >= 0 and index < self.exception_handlers[position][0]:
+            return self.exception_handlers[position]
+        return None
+
+
+# keyed by identity: hashing code objects hashes all of their contents. Entries are dropped with their code objects,
+# so code compiled again and again does not leak and identities of dead code objects are never looked up
+_decoded: dict[int, Decoded] = {}
+
+
+def decode(code: types.CodeType) -> Decoded:
+    """Decoded instructions of code object, cached while it is alive"""
+    decoded = _decoded.get(id(code))
+    if decoded is None:
+        decoded = _decoded[id(code)] = Decoded(code)
+        weakref.finalize(code, _decoded.pop, id(code), None).atexit = False
+    return decoded
+
 
 class Frame:
     """
@@ -149,20 +331,37 @@ class Frame:
     def __init__(self,
                  frame_code: types.CodeType,
                  frame_builtins: dict[str, tp.Any],
-                 frame_globals: dict[str, tp.Any],
+                 frame_globals: Namespace,
                  frame_locals: dict[str, tp.Any],
-                 frame_nested: list[dict[str, tp.Any]] | None = None) -> None:
+                 vm: 'VirtualMachine',
+                 fast_locals: list[tp.Any] | None = None,
+                 closure: tuple[types.CellType, ...] = ()) -> None:
+        """
+        :param fast_locals: values of arguments followed by NULLs, see `Decoded.names`
+        :param closure: cells of free variables
+        """
         self.code = frame_code
+        self.decoded = decode(frame_code)
+        self.vm = vm
         self.ptr = -1
         self.builtins = frame_builtins
         self.globals = frame_globals
         self.locals = frame_locals
+        self.fast_locals: list[tp.Any] = fast_locals if fast_locals is not None else [NULL] * len(self.decoded.names)
+        self.closure = closure
+        self.kw_names: tuple[str, ...] = ()
         self.data_stack: tp.Any = []
-        self.return_value = None
+        # generator or coroutine of frame just created by call of generator function, then value yielded or returned
+        self.return_value: tp.Any = None
         self.returned = False
-        if frame_nested is None:
-            frame_nested = []
-        self.frame_nested = frame_nested
+        # frame of generator is suspended by yield with `returned` set, this flag tells yield from return
+        self.yielded = False
+
+    @property
+    def f_lineno(self) -> int | None:
+        """Line of the current instruction, as in frames of cpython"""
+        instruction = self.decoded.instructions[max(self.ptr, 0)]
+        return instruction.positions.lineno if instruction.positions else None
 
     def top(self) -> tp.Any:
         return self.data_stack[-1]
@@ -186,20 +385,125 @@ class Frame:
             return []
 
     def run(self) -> tp.Any:
-        # TODO-JUMP
-        instructions = list(dis.get_instructions(self.code))
-        while self.ptr < len(instructions) - 1:
-            self.ptr += 1
-            instruction = instructions[self.ptr]
-            fl.write(instruction.__str__() + "\n")
-            getattr(self, instruction.opname.lower() + "_op")(argval=instruction.argval, arg=instruction.arg)
-            fl.write(f"stack: {self.data_stack}, globals: {self.globals}, locals: {self.locals}\n\n")
-            if self.returned:
+        if self.vm.trace is not None:
+            return self.run_traced(self.vm.trace)
+        if self.vm.profiler is not None:
+            return self.run_profiled(self.vm.profiler)
+        handlers = self.decoded.handlers
+        while True:
+            try:
+                while not self.returned:
+                    self.ptr += 1
+                    handler, operands = handlers[self.ptr]
+                    handler(self, *operands)
                 return self.return_value
+            except BaseException as exc:
+                if not self.unwind(exc):
+                    raise
+
+    def run_traced(self, trace: tp.TextIO) -> tp.Any:
+        """Same as `run`, but every instruction and the state after it are written to trace"""
+        instructions, handlers = self.decoded.instructions, self.decoded.handlers
+        while True:
+            try:
+                while not self.returned:
+                    self.ptr += 1
+                    trace.write(f"{instructions[self.ptr]}\n")
+                    handler, operands = handlers[self.ptr]
+                    handler(self, *operands)
+                    trace.write(f"stack: {self.data_stack}, globals: {self.globals}, locals: {self.locals}\n\n")
+                return self.return_value
+            except BaseException as exc:
+                trace.write(f"raised: {exc!r}\n\n")
+                if not self.unwind(exc):
+                    raise
+
+    def run_profiled(self, profiler: 'VMProfiler') -> tp.Any:
+        """Same as `run`, but number of executions and time of every instruction are collected by profiler"""
+        handlers = self.decoded.handlers
+        # resumption of generator frame is not another call
+        run = profiler.enter(self.code, resumed=self.ptr >= 0)
+        counts, times, self_times = run[0].counts, run[0].times, run[0].self_times
+        clock = time.perf_counter
+        try:
+            while True:
+                try:
+                    while not self.returned:
+                        self.ptr += 1
+                        index = self.ptr
+                        handler, operands = handlers[index]
+                        called = run[2]
+                        start = clock()
+                        handler(self, *operands)
+                        spent = clock() - start
+                        times[index] += spent
+                        self_times[index] += spent - (run[2] - called)
+                        counts[index] += 1
+                    return self.return_value
+                except BaseException as exc:
+                    if not self.unwind(exc):
+                        raise
+        finally:
+            profiler.exit()
+
+    def unwind(self, exc: BaseException) -> bool:
+        """
+        Jump to handler of exception raised by the current instruction, as cpython does by exception table
+            https://github.com/python/cpython/blob/3.11/Objects/exception_handling_notes.txt
+        :return: False if the instruction is not covered by any handler, so exception leaves the frame
+        """
+        # exception raised while other one is handled by VM code gets it as context, like raise in except block;
+        # it is done in the frame where exception is raised, whether it is handled here or leaves the frame
+        handled = self.vm.exception
+        if handled is not None and handled is not exc and exc.__context__ is None:
+            exc.__context__ = handled
+        entry = self.decoded.exception_handler(self.ptr)
+        if entry is None:
+            return False
+        _, target, depth, lasti = entry
+        del self.data_stack[depth:]
+        if lasti:
+            self.push(self.ptr)
+        self.push(exc)
+        self.ptr = target - 1
+        return True
+
+    def throw(self, exc: BaseException) -> tp.Any:
+        """Raise exception at the current instruction of suspended frame and run it further if it is handled"""
+        if not self.unwind(exc):
+            raise exc
+        return self.run()
+
+    def unknown_op(self, opname: str) -> None:
+        raise NotImplementedError(f"Instruction {opname} is not supported")
+
+    def call(self, func: tp.Any, args: tp.Sequence[tp.Any], kwargs: dict[str, tp.Any]) -> tp.Any:
+        if type(func) is Function:
+            return func.call(args, kwargs)
+        if func is builtins.__build_class__ and args and type(args[0]) is Function:
+            return self.vm.build_class(*args, **kwargs)
+        if func is builtins.super and not args:
+            # super() looks for class and self in frame of caller, which is not a real frame here
+            return super(self.class_cell().cell_contents, self.first_argument())
+        return func(*args, **kwargs)
+
+    def class_cell(self) -> types.CellType:
+        if "__class__" not in self.code.co_freevars:
+            raise RuntimeError("super(): __class__ cell not found")
+        cell = self.fast_locals[self.decoded.names.index("__class__")]
+        assert isinstance(cell, types.CellType)
+        return cell
+
+    def first_argument(self) -> tp.Any:
+        if not self.code.co_argcount or self.fast_locals[0] is NULL:
+            raise RuntimeError("super(): no arguments")
+        if self.code.co_varnames[0] in self.code.co_cellvars:
+            return self.fast_locals[0].cell_contents
+        return self.fast_locals[0]
 
     def import_name_op(self, argval: str, **kwargs: tp.Any) -> None:
         level, from_list = self.popn(2)
-        self.push(builtins.__import__(argval, globals(), locals(), from_list, level))
+        self.push(builtins.__import__(argval, self.globals, self.locals, from_list, level))
 
     def import_from_op(self, argval: str, **kwargs: tp.Any) -> None:
         mod = self.top()
@@ -213,21 +517,23 @@ class Frame:
         for item in dir(mod_val):
             if item[0] != "_":
                 self.globals[item] = getattr(mod_val, item)
+        self.globals.keys_changed()
 
     def extended_arg_op(self, **kwargs: tp.Any) -> None:
         pass
 
     def load_assertion_error_op(self, **kwargs: tp.Any) -> None:
-        self.push(Exception)
+        self.push(AssertionError)
 
-    def kw_names_op(self, arg: str, **kwargs: tp.Any) -> None:
-        raise NameError(arg)
+    def kw_names_op(self, arg: int, **kwargs: tp.Any) -> None:
+        self.kw_names = self.code.co_consts[arg]
 
     def delete_global_op(self, argval: str, **kwargs: tp.Any) -> None:
         if argval in self.globals:
             del self.globals[argval]
+            self.globals.keys_changed()
         else:
-            raise NameError
+            raise NameError(f"name '{argval}' is not defined")
 
     def get_iter_op(self, **kwargs: tp.Any) -> None:
         self.push(iter(self.pop()))
@@ -235,27 +541,50 @@ class Frame:
     def jump_forward_op(self, argval: int, **kwargs: tp.Any) -> None:
         self.ptr = self.__find_instruction(argval)
 
-    def store_fast_op(self, argval: str, **kwargs: tp.Any) -> None:
-        if argval in self.locals:
-            self.push(self.locals[argval])
+    def store_fast_op(self, arg: int, **kwargs: tp.Any) -> None:
+        self.fast_locals[arg] = self.pop()
+
+    def delete_fast_op(self, arg: int, **kwargs: tp.Any) -> None:
+        if self.fast_locals[arg] is NULL:
+            raise UnboundLocalError(f"local variable '{self.decoded.names[arg]}' referenced before assignment")
+        self.fast_locals[arg] = NULL
+
+    def make_cell_op(self, arg: int, **kwargs: tp.Any) -> None:
+        value = self.fast_locals[arg]
+        self.fast_locals[arg] = types.CellType() if value is NULL else types.CellType(value)
+
+    def copy_free_vars_op(self, arg: int, **kwargs: tp.Any) -> None:
+        self.fast_locals[len(self.fast_locals) - arg:] = self.closure
+
+    def load_closure_op(self, arg: int, **kwargs: tp.Any) -> None:
+        self.push(self.fast_locals[arg])
+
+    def load_deref_op(self, arg: int, **kwargs: tp.Any) -> None:
+        try:
+            self.push(self.fast_locals[arg].cell_contents)
+        except ValueError:
+            raise NameError(f"free variable '{self.decoded.names[arg]}' referenced before assignment") from None
+
+    def load_classderef_op(self, arg: int, **kwargs: tp.Any) -> None:
+        name = self.decoded.names[arg]
+        if name in self.locals:
+            self.push(self.locals[name])
         else:
-            for i in self.frame_nested:
-                if argval in i:
-                    self.push(i[argval])
-                    break
-        raise UnboundLocalError
+            self.load_deref_op(arg)
+
+    def store_deref_op(self, arg: int, **kwargs: tp.Any) -> None:
+        self.fast_locals[arg].cell_contents = self.pop()
+
+    def delete_deref_op(self, arg: int, **kwargs: tp.Any) -> None:
+        del self.fast_locals[arg].cell_contents
 
     def for_iter_op(self, argval: int, **kwargs: tp.Any) -> None:
-        try:
-            it = next(self.top())
-            if it is not None:
-                self.push(it)
-            else:
-                self.pop()
-                self.ptr = self.__find_instruction(argval)
-        except StopIteration:
+        value = next(self.top(), NULL)
+        if value is NULL:
             self.pop()
             self.ptr = self.__find_instruction(argval)
+        else:
+            self.push(value)
 
     def contains_op_op(self, argval: bool, **kwargs: tp.Any) -> None:
         # argval == invert[bool]
@@ -285,33 +614,118 @@ class Frame:
 
     def raise_varargs_op(self, arg: int, **kwargs: tp.Any) -> None:
         if arg == 0:
-            raise
+            if self.vm.exception is None:
+                raise RuntimeError("No active exception to reraise")
+            raise self.vm.exception
         elif arg == 1:
             e = self.pop()
             raise e
         elif arg == 2:
             cause = self.pop()
             e = self.pop()
-            raise e(cause)
+            raise e from cause
         raise NameError
 
+    def push_exc_info_op(self, **kwargs: tp.Any) -> None:
+        """
+        Operation description:
+            https://docs.python.org/release/3.11.5/library/dis.html#opcode-PUSH_EXC_INFO
+        """
+        exc = self.pop()
+        self.push(self.vm.exception, exc)
+        self.vm.exception = exc
+
+    def pop_except_op(self, **kwargs: tp.Any) -> None:
+        self.vm.exception = self.pop()
+
+    def check_exc_match_op(self, **kwargs: tp.Any) -> None:
+        expected = self.pop()
+        for exc_type in expected if isinstance(expected, tuple) else (expected,):
+            if not (isinstance(exc_type, type) and issubclass(exc_type, BaseException)):
+                raise TypeError("catching classes that do not inherit from BaseException is not allowed")
+        self.push(isinstance(self.top(), expected))
+
+    def reraise_op(self, **kwargs: tp.Any) -> None:
+        """
+        Operation description:
+            https://docs.python.org/release/3.11.5/library/dis.html#opcode-RERAISE
+        lasti under exception is only used by cpython for line numbers in traceback, so it is left on stack
+        """
+        raise self.pop()
+
+    def before_with_op(self, **kwargs: tp.Any) -> None:
+        manager = self.pop()
+        manager_type = type(manager)
+        if not hasattr(manager_type, "__enter__") or not hasattr(manager_type, "__exit__"):
+            raise TypeError(f"'{manager_type.__name__}' object does not support the context manager protocol")
+        self.push(types.MethodType(manager_type.__exit__, manager), manager_type.__enter__(manager))
+
+    def with_except_start_op(self, **kwargs: tp.Any) -> None:
+        """
+        Operation description:
+            https://docs.python.org/release/3.11.5/library/dis.html#opcode-WITH_EXCEPT_START
+        """
+        exc = self.top()
+        exit_func = self.data_stack[-4]
+        self.push(exit_func(type(exc), exc, exc.__traceback__))
+
     def binary_subscr_op(self, **kwargs: tp.Any) -> None:
         tos = self.pop()
         tos1 = self.pop()
         self.push(tos1[tos])
 
     def store_attr_op(self, argval: str, **kwargs: tp.Any) -> None:
+        global _types_version
         tos = self.pop()
         tos1 = self.pop()
         setattr(tos, argval, tos1)
-        self.push(tos)
+        if isinstance(tos, type):
+            _types_version += 1
 
-    def load_attr_op(self, argval: str, **kwargs: tp.Any) -> None:
-        tos = self.pop()
-        self.push(getattr(tos, argval))
+    def load_attr_op(self, argval: str, cache: InlineCache, **kwargs: tp.Any) -> None:
+        """
+        Instruction is replaced by specialized one when it binds the same function defined in class of object
+        several times: binding of VM functions is their python `__get__` otherwise.
+        """
+        stack = self.data_stack
+        tos = stack[-1]
+        value = stack[-1] = getattr(tos, argval)
+        if type(value) is not types.MethodType or cache.flag:
+            return
+        tos_type = type(tos)
+        if cache.key is not tos_type:
+            cache.key, cache.version = tos_type, 1
+            return
+        cache.version += 1
+        if cache.version == QUICKEN_AFTER:
+            method, namespaces = self.lookup_method(tos_type, argval)
+            if type(method) is Function and method is value.__func__ and tos_type.__dictoffset__ != 0:
+                cache.version, cache.value = _types_version, method
+                cache.owner, cache.shadows = namespaces[-1], namespaces[:-1]
+                self.decoded.handlers[self.ptr] = (Frame.load_attr_function_op, (argval, cache))
+            else:
+                cache.flag = True
+
+    def load_attr_function_op(self, argval: str, cache: InlineCache) -> None:
+        stack = self.data_stack
+        tos = stack[-1]
+        function: Function = cache.value
+        if type(tos) is not cache.key or cache.version != _types_version or argval in tos.__dict__ or \
+                cache.owner.get(argval) is not function or cache.shadows and cache.moved(argval):
+            self.decoded.handlers[self.ptr] = (Frame.load_attr_op, (argval, cache))
+            cache.key, cache.version, cache.value = None, 0, NULL
+            cache.misses += 1
+            cache.flag = cache.misses >= MAX_DEOPTIMIZATIONS
+            stack[-1] = getattr(tos, argval)
+        else:
+            stack[-1] = types.MethodType(function, tos)
 
     def delete_attr_op(self, argval: str, **kwargs: tp.Any) -> None:
-        delattr(self.top(), argval)
+        global _types_version
+        tos = self.pop()
+        delattr(tos, argval)
+        if isinstance(tos, type):
+            _types_version += 1
 
     def delete_name_op(self, argval: str, **kwargs: tp.Any) -> None:
         if argval in self.locals:
@@ -321,39 +735,41 @@ class Frame:
         elif argval in self.builtins:
             self.builtins.pop(argval)
         else:
-            raise NameError
+            raise NameError(f"name '{argval}' is not defined")
+        if self.locals is self.globals:
+            self.globals.keys_changed()
 
     def build_set_op(self, argval: int, **kwargs: tp.Any) -> None:
         cnt = argval
         if cnt < 0:
             raise Exception(f"unexpected count {cnt} in build_set_op")
-        values = []
-        for i in range(cnt):
-            values.append(self.pop())
-        self.push(set(values))
+        self.push(set(self.popn(cnt)))
 
     def build_tuple_op(self, argval: int, **kwargs: tp.Any) -> None:
         cnt = argval
         if cnt < 0:
             raise Exception(f"unexpected count {cnt} in build_tuple_op")
-        values = []
-        for i in range(cnt):
-            values.append(self.pop())
-        self.push(tuple(values))
+        self.push(tuple(self.popn(cnt)))
 
     def unpack_sequence_op(self, argval: int, **kwargs: tp.Any) -> None:
-        tos = self.pop()
-        for i in tos[::-1]:
-            self.push(i)
+        values = tuple(self.pop())
+        if len(values) != argval:
+            raise ValueError(f"expected {argval} values to unpack, got {len(values)}")
+        self.push(*reversed(values))
+
+    def unpack_ex_op(self, arg: int, **kwargs: tp.Any) -> None:
+        before, after = arg & 0xFF, arg >> 8
+        values = list(self.pop())
+        if len(values) < before + after:
+            raise ValueError(f"not enough values to unpack (expected at least {before + after}, got {len(values)})")
+        rest = values[before:len(values) - after]
+        self.push(*reversed(values[len(values) - after:]), rest, *reversed(values[:before]))
 
     def build_list_op(self, argval: int, **kwargs: tp.Any) -> None:
         cnt = argval
         if cnt < 0:
             raise Exception(f"unexpected count {cnt} in build_list_op")
-        values = []
-        for i in range(cnt):
-            values.append(self.pop())
-        self.push(list(values))
+        self.push(self.popn(cnt))
 
     def build_const_key_map_op(self, argval: int, **kwargs: tp.Any) -> None:
         cnt = argval
@@ -385,69 +801,168 @@ class Frame:
         seq = self.pop()
         set.update(self.data_stack[-i], seq)
 
+    def list_append_op(self, arg: int, **kwargs: tp.Any) -> None:
+        value = self.pop()
+        self.data_stack[-arg].append(value)
+
+    def set_add_op(self, arg: int, **kwargs: tp.Any) -> None:
+        value = self.pop()
+        self.data_stack[-arg].add(value)
+
+    def map_add_op(self, arg: int, **kwargs: tp.Any) -> None:
+        key, value = self.popn(2)
+        self.data_stack[-arg][key] = value
+
+    def list_to_tuple_op(self, **kwargs: tp.Any) -> None:
+        self.push(tuple(self.pop()))
+
+    def dict_update_op(self, arg: int, **kwargs: tp.Any) -> None:
+        mapping = self.pop()
+        self.data_stack[-arg].update(mapping)
+
+    def dict_merge_op(self, arg: int, **kwargs: tp.Any) -> None:
+        mapping = self.pop()
+        target = self.data_stack[-arg]
+        for key in mapping.keys():
+            if key in target:
+                raise TypeError(f"got multiple values for keyword argument '{key}'")
+        target.update(mapping)
+
     def resume_op(self, **kwargs: tp.Any) -> None:
         pass
 
+    def return_generator_op(self, **kwargs: tp.Any) -> None:
+        """
+        Suspend the frame just created by call of generator function, the generator is result of the call.
+        Every resumption pushes value sent to generator, so the first one is popped by the following POP_TOP.
+        """
+        if self.code.co_flags & CO_ASYNC_GENERATOR:
+            raise NotImplementedError("Asynchronous generators are not supported")
+        self.return_value = Coroutine(self) if self.code.co_flags & CO_COROUTINE else Generator(self)
+        self.returned = True
+
+    def yield_value_op(self, **kwargs: tp.Any) -> None:
+        """
+        Operation description:
+            https://docs.python.org/release/3.11.5/library/dis.html#opcode-YIELD_VALUE
+        """
+        self.return_value = self.pop()
+        self.returned = self.yielded = True
+
+    def send_op(self, argval: int, **kwargs: tp.Any) -> None:
+        """
+        Operation description:
+            https://docs.python.org/release/3.11.5/library/dis.html#opcode-SEND
+        """
+        value = self.pop()
+        receiver = self.top()
+        try:
+            if value is None and hasattr(receiver, "__next__"):
+                result = next(receiver)
+            else:
+                result = receiver.send(value)
+        except StopIteration as stop:
+            self.data_stack[-1] = stop.value
+            self.ptr = self.__find_instruction(argval)
+        else:
+            self.push(result)
+
+    def get_yield_from_iter_op(self, **kwargs: tp.Any) -> None:
+        if not isinstance(self.top(), (Generator, types.GeneratorType)):
+            self.push(iter(self.pop()))
+
+    def get_awaitable_op(self, **kwargs: tp.Any) -> None:
+        awaitable = self.pop()
+        if not isinstance(awaitable, (Coroutine, types.CoroutineType)):
+            await_method = getattr(type(awaitable), "__await__", None)
+            if await_method is None:
+                raise TypeError(f"object {type(awaitable).__name__} can't be used in 'await' expression")
+            awaitable = await_method(awaitable)
+        self.push(awaitable)
+
     def push_null_op(self, **kwargs: tp.Any) -> None:
-        self.push(None)
+        self.push(NULL)
 
     def precall_op(self, **kwargs: tp.Any) -> None:
         pass
 
-    def call_op(self, argval: int, **kwargs: tp.Any) -> None:
-        arg = argval
+    def call_op(self, arg: int, **kwargs: tp.Any) -> None:
         """
         Operation description:
             https://docs.python.org/release/3.11.5/library/dis.html#opcode-CALL
         """
-
         arguments = self.popn(arg)
-
-        f = self.pop()
-        if callable(f):
-            if len(self.data_stack) > 0 and self.top() is None:
-                self.pop()
-            self.push(f(*arguments))
+        callable_or_self = self.pop()
+        method_or_null = self.pop()
+        if method_or_null is NULL:
+            func = callable_or_self
         else:
-            obj = f
-            method = self.pop()
-            self.push(getattr(obj, method)(*arguments))
-
-    def load_name_op(self, argval: str, **kwargs: tp.Any) -> None:
+            func = method_or_null
+            arguments.insert(0, callable_or_self)
+
+        keywords: dict[str, tp.Any] = {}
+        if self.kw_names:
+            count = len(self.kw_names)
+            keywords = dict(zip(self.kw_names, arguments[-count:]))
+            del arguments[-count:]
+            self.kw_names = ()
+        self.push(self.call(func, arguments, keywords))
+
+    def call_function_ex_op(self, arg: int, **kwargs: tp.Any) -> None:
+        keywords = self.pop() if arg & 1 else {}
+        arguments = self.pop()
+        func = self.pop()
+        self.pop()  # NULL
+        self.push(self.call(func, arguments, dict(keywords)))
+
+    def load_name_op(self, argval: str, cache: InlineCache, **kwargs: tp.Any) -> None:
         """
-        Partial realization
-
         Operation description:
             https://docs.python.org/release/3.11.5/library/dis.html#opcode-LOAD_NAME
         """
-        # TODO: parse all scopes
         arg = argval
-        if arg in self.locals:
+        if self.locals is self.globals:
+            # module level, locals are globals
+            self.load_global(arg, cache)
+        elif arg in self.locals:
             self.push(self.locals[arg])
         elif arg in self.globals:
             self.push(self.globals[arg])
         elif arg in self.builtins:
             self.push(self.builtins[arg])
         else:
-            raise NameError
+            raise NameError(f"name '{arg}' is not defined")
 
-    def load_global_op(self, argval: str, **kwargs: tp.Any) -> None:
+    def load_global_op(self, argval: str, arg: int, cache: InlineCache, **kwargs: tp.Any) -> None:
         """
         Operation description:
             https://docs.python.org/release/3.11.5/library/dis.html#opcode-LOAD_GLOBAL
         """
-        # TODO: parse all scopes
-        arg = argval
-        if arg in self.globals:
-            self.push(self.globals[arg])
-        elif arg in self.builtins:
-            self.push(self.builtins[arg])
+        if arg & 1:
+            self.push(NULL)
+        self.load_global(argval, cache)
+
+    def load_global(self, name: str, cache: InlineCache) -> None:
+        """
+        Push value of global or builtin name. Cache remembers which of dicts has the name
+        while keys of globals are the same, so only one lookup is done.
+        """
+        if cache.version == self.globals.version:
+            self.push(self.builtins[name] if cache.flag else self.globals[name])
+        elif name in self.globals:
+            cache.version, cache.flag = self.globals.version, False
+            self.push(self.globals[name])
+        elif name in self.builtins:
+            cache.version, cache.flag = self.globals.version, True
+            self.push(self.builtins[name])
         else:
-            raise NameError
+            raise NameError(f"name '{name}' is not defined")
 
-    def load_fast_op(self, argval: tp.Any, **kwargs: tp.Any) -> None:
-        assert argval in self.locals
-        self.push(self.locals[argval])
+    def load_fast_op(self, arg: int, **kwargs: tp.Any) -> None:
+        value = self.fast_locals[arg]
+        if value is NULL:
+            raise UnboundLocalError(f"local variable '{self.decoded.names[arg]}' referenced before assignment")
+        self.push(value)
 
     def load_const_op(self, argval: tp.Any, **kwargs: tp.Any) -> None:
         """
@@ -476,29 +991,15 @@ class Frame:
         Operation description:
             https://docs.python.org/release/3.11.5/library/dis.html#opcode-MAKE_FUNCTION
         """
-        code = self.pop()  # the code associated with the function (at TOS1)
-
-        flags = arg
-        pos_defaults = ()
-        if flags & 1 != 0:
-            pos_defaults = self.pop()
-
-        # TODO: use arg to parse function defaults
-
-        def f(*args: tp.Any, **kwargs: tp.Any) -> tp.Any:
-            # TODO: parse input arguments using code attributes such as co_argcount
-
-            parsed_args: dict[str, tp.Any] = bind_args(pos_defaults, code, *args, **kwargs)  # type: ignore
-
-            f_locals = dict(self.locals)
-            f_locals.update(parsed_args)
-            res_frame = []
-            res_frame.extend(self.frame_nested)
-            res_frame.extend(f_locals)  # type: ignore
-            frame = Frame(code, self.builtins, self.globals, f_locals, res_frame)  # Run code in prepared environment
-            return frame.run()
-
-        self.push(f)
+        code = self.pop()
+        closure = self.pop() if arg & 0x08 else ()
+        annotations = self.pop() if arg & 0x04 else None
+        kwdefaults = self.pop() if arg & 0x02 else None
+        defaults = self.pop() if arg & 0x01 else None
+        func = Function(code, self.globals, self.builtins, self.vm, defaults, kwdefaults, closure)
+        if annotations is not None:
+            func.__annotations__ = dict(zip(annotations[::2], annotations[1::2]))
+        self.push(func)
 
     def store_name_op(self, argval: str, **kwargs: tp.Any) -> None:
         """
@@ -508,111 +1009,121 @@ class Frame:
         arg = argval
         const = self.pop()
 
+        size = len(self.locals)
         self.locals[arg] = const
+        if size != len(self.locals) and self.locals is self.globals:
+            self.globals.keys_changed()
 
     def store_global_op(self, argval: str, **kwargs: tp.Any) -> None:
         arg = argval
         const = self.pop()
+        size = len(self.globals)
         self.globals[arg] = const
+        if size != len(self.globals):
+            self.globals.keys_changed()
 
-    def binary_op_op(self, argval: str, **kwargs: tp.Any) -> None:
-        op = argval
+    def binary_op_op(self, arg: int, cache: InlineCache, **kwargs: tp.Any) -> None:
+        """
+        Operation description:
+            https://docs.python.org/release/3.11.5/library/dis.html#opcode-BINARY_OP
 
-        rhs = self.pop()
-        lhs = self.pop()
-        result = None
-
-        if op == 0:
-            result = lhs + rhs
-        elif op == 1:
-            result = lhs & rhs
-        elif op == 2:
-            result = lhs // rhs
-        elif op == 3:
-            result = lhs << rhs
-        elif op == 4:
-            # TODO:MATRIX
-            result = lhs @ rhs
-        elif op == 5:
-            result = lhs * rhs
-        elif op == 6:
-            result = lhs % rhs
-        elif op == 7:
-            result = lhs | rhs
-        elif op == 8:
-            result = lhs ** rhs
-        elif op == 9:
-            result = lhs >> rhs
-        elif op == 10:
-            result = lhs - rhs
-        elif op == 11:
-            result = lhs / rhs
-        elif op == 12:
-            result = lhs ^ rhs
-        elif op == 13:
-            lhs += rhs
-            result = lhs
-        elif op == 14:
-            lhs &= rhs
-            result = lhs
-        elif op == 15:
-            lhs //= rhs
-            result = lhs
-        elif op == 16:
-            lhs <<= rhs
-            result = lhs
-        elif op == 17:
-            # TODO:MATRIX
-            lhs @= rhs
-            result = lhs
-        elif op == 18:
-            lhs *= rhs
-            result = lhs
-        elif op == 19:
-            lhs %= rhs
-            result = lhs
-        elif op == 20:
-            lhs |= rhs
-            result = lhs
-        elif op == 21:
-            lhs **= rhs
-            result = lhs
-        elif op == 22:
-            lhs >>= rhs
-            result = lhs
-        elif op == 23:
-            lhs -= rhs
-            result = lhs
-        elif op == 24:
-            lhs /= rhs
-            result = lhs
-        elif op == 25:
-            lhs ^= rhs
-            result = lhs
+        Instruction is replaced by specialized one when its operands happen to have the same type several times.
+        Inplace operations of immutable types are the same as plain ones.
+        """
+        stack = self.data_stack
+        rhs = stack.pop()
+        lhs = stack[-1]
+        stack[-1] = _BINARY_OPS[arg](lhs, rhs)
+
+        lhs_type = type(lhs)
+        if lhs_type is not type(rhs) or cache.flag:
+            return
+        if cache.key is not lhs_type:
+            cache.key, cache.version = lhs_type, 1
+            return
+        cache.version += 1
+        if cache.version == QUICKEN_AFTER:
+            specialized = _SPECIALIZED_BINARY_OPS.get((arg, lhs_type))
+            if specialized is None:
+                cache.flag = True
+            else:
+                self.decoded.handlers[self.ptr] = (specialized, (arg, cache))
+
+    def deoptimize_binary_op(self, arg: int, cache: InlineCache, lhs: tp.Any, rhs: tp.Any) -> None:
+        """Return generic instruction in place of specialized one which got operands of other types"""
+        self.decoded.handlers[self.ptr] = (Frame.binary_op_op, (arg, cache))
+        cache.key, cache.version = None, 0
+        cache.value = 1 if cache.value is NULL else cache.value + 1
+        cache.flag = cache.value >= MAX_DEOPTIMIZATIONS
+        self.data_stack[-1] = _BINARY_OPS[arg](lhs, rhs)
+
+    def binary_op_add_int_op(self, arg: int, cache: InlineCache) -> None:
+        stack = self.data_stack
+        rhs = stack.pop()
+        lhs = stack[-1]
+        if type(lhs) is int and type(rhs) is int:
+            stack[-1] = lhs + rhs
         else:
-            raise NameError(op)
-        self.push(result)
-
-    def compare_op_op(self, argval: str, **kwargs: tp.Any) -> None:
-        op = argval
-        rhs = self.pop()
-        lhs = self.pop()
-        result = None
-        if op == "<":
-            result = lhs < rhs
-        elif op == "<=":
-            result = lhs <= rhs
-        elif op == "==":
-            result = lhs == rhs
-        elif op == "!=":
-            result = lhs != rhs
-        elif op == ">":
-            result = lhs > rhs
-        elif op == ">=":
-            result = lhs >= rhs
+            self.deoptimize_binary_op(arg, cache, lhs, rhs)
+
+    def binary_op_add_float_op(self, arg: int, cache: InlineCache) -> None:
+        stack = self.data_stack
+        rhs = stack.pop()
+        lhs = stack[-1]
+        if type(lhs) is float and type(rhs) is float:
+            stack[-1] = lhs + rhs
         else:
-            raise NameError(op)
-        self.push(result)
+            self.deoptimize_binary_op(arg, cache, lhs, rhs)
+
+    def binary_op_add_unicode_op(self, arg: int, cache: InlineCache) -> None:
+        stack = self.data_stack
+        rhs = stack.pop()
+        lhs = stack[-1]
+        if type(lhs) is str and type(rhs) is str:
+            stack[-1] = lhs + rhs
+        else:
+            self.deoptimize_binary_op(arg, cache, lhs, rhs)
+
+    def binary_op_subtract_int_op(self, arg: int, cache: InlineCache) -> None:
+        stack = self.data_stack
+        rhs = stack.pop()
+        lhs = stack[-1]
+        if type(lhs) is int and type(rhs) is int:
+            stack[-1] = lhs - rhs
+        else:
+            self.deoptimize_binary_op(arg, cache, lhs, rhs)
+
+    def binary_op_subtract_float_op(self, arg: int, cache: InlineCache) -> None:
+        stack = self.data_stack
+        rhs = stack.pop()
+        lhs = stack[-1]
+        if type(lhs) is float and type(rhs) is float:
+            stack[-1] = lhs - rhs
+        else:
+            self.deoptimize_binary_op(arg, cache, lhs, rhs)
+
+    def binary_op_multiply_int_op(self, arg: int, cache: InlineCache) -> None:
+        stack = self.data_stack
+        rhs = stack.pop()
+        lhs = stack[-1]
+        if type(lhs) is int and type(rhs) is int:
+            stack[-1] = lhs * rhs
+        else:
+            self.deoptimize_binary_op(arg, cache, lhs, rhs)
+
+    def binary_op_multiply_float_op(self, arg: int, cache: InlineCache) -> None:
+        stack = self.data_stack
+        rhs = stack.pop()
+        lhs = stack[-1]
+        if type(lhs) is float and type(rhs) is float:
+            stack[-1] = lhs * rhs
+        else:
+            self.deoptimize_binary_op(arg, cache, lhs, rhs)
+
+    def compare_op_op(self, arg: int, **kwargs: tp.Any) -> None:
+        stack = self.data_stack
+        rhs = stack.pop()
+        stack[-1] = _COMPARE_OPS[arg](stack[-1], rhs)
 
     def unary_negative_op(self, **kwargs: tp.Any) -> None:
         self.push(-self.pop())
@@ -628,13 +1139,11 @@ class Frame:
         container = self.pop()
         value = self.pop()
         container[key] = value
-        self.push(container)
 
     def delete_subscr_op(self, **kwargs: tp.Any) -> None:
         key = self.pop()
         container = self.pop()
         del container[key]
-        self.push(container)
 
     def setup_annotations_op(self, **kwargs: tp.Any) -> None:
         if "__annotations__" not in self.locals:
@@ -655,10 +1164,8 @@ class Frame:
             self.pop()
 
     def __find_instruction(self, offset: int) -> int:
-        for indx, instruction in enumerate(dis.get_instructions(self.code)):
-            if instruction.offset == offset:
-                return indx - 1
-        raise IndexError()
+        """:return: value of `ptr` which makes the instruction at offset the next one"""
+        return self.decoded.indices[offset] - 1
 
     def pop_jump_forward_if_true_op(self, argval: int, **kwargs: tp.Any) -> None:
         tos = self.pop()
@@ -675,16 +1182,72 @@ class Frame:
         if tos is None:
             self.ptr = self.__find_instruction(argval)
 
+    def pop_jump_forward_if_not_none_op(self, argval: int, **kwargs: tp.Any) -> None:
+        tos = self.pop()
+        if tos is not None:
+            self.ptr = self.__find_instruction(argval)
+
+    def pop_jump_backward_if_true_op(self, argval: int, **kwargs: tp.Any) -> None:
+        tos = self.pop()
+        if tos:
+            self.ptr = self.__find_instruction(argval)
+
+    def pop_jump_backward_if_false_op(self, argval: int, **kwargs: tp.Any) -> None:
+        tos = self.pop()
+        if not tos:
+            self.ptr = self.__find_instruction(argval)
+
+    def pop_jump_backward_if_none_op(self, argval: int, **kwargs: tp.Any) -> None:
+        tos = self.pop()
+        if tos is None:
+            self.ptr = self.__find_instruction(argval)
+
+    def pop_jump_backward_if_not_none_op(self, argval: int, **kwargs: tp.Any) -> None:
+        tos = self.pop()
+        if tos is not None:
+            self.ptr = self.__find_instruction(argval)
+
     def jump_backward_op(self, argval: int, **kwargs: tp.Any) -> None:
-        # TODO: check
         self.ptr = self.__find_instruction(argval)
 
-    def load_method_op(self, argval: str, **kwargs: tp.Any) -> None:
+    def jump_backward_no_interrupt_op(self, argval: int, **kwargs: tp.Any) -> None:
+        self.ptr = self.__find_instruction(argval)
+
+    def load_method_op(self, argval: str, cache: InlineCache, **kwargs: tp.Any) -> None:
+        """
+        Push method and object if attribute is a method defined in class, otherwise NULL and attribute.
+        Cache keeps method found in type of object while it is still found there.
+        """
         tos = self.pop()
-        if argval in dir(tos):
-            self.push(getattr(tos, argval))
+        tos_type = type(tos)
+        method = cache.value
+        if cache.key is not tos_type or cache.version != _types_version or method is not NULL and \
+                (cache.owner.get(argval) is not method or cache.shadows and cache.moved(argval)):
+            cache.key, cache.version = tos_type, _types_version
+            method, namespaces = self.lookup_method(tos_type, argval)
+            cache.value, cache.flag = method, tos_type.__dictoffset__ != 0
+            if method is not NULL:
+                cache.owner, cache.shadows = namespaces[-1], namespaces[:-1]
+        if method is NULL or cache.flag and argval in tos.__dict__:
+            self.push(NULL, getattr(tos, argval))
         else:
-            self.push(None)
+            self.push(method, tos)
+
+    @staticmethod
+    def lookup_method(tos_type: type, name: str) -> tuple[tp.Any, tuple['types.MappingProxyType[str, tp.Any]', ...]]:
+        """
+        Method found in MRO of type, NULL if attribute is not a method or is looked up in unusual way
+        :return: method and namespaces of classes in MRO up to the one defining it
+        """
+        if issubclass(tos_type, type) or tos_type.__getattribute__ is not object.__getattribute__:
+            return NULL, ()
+        namespaces = []
+        for klass in tos_type.__mro__:
+            namespaces.append(klass.__dict__)
+            if name in namespaces[-1]:
+                attribute = namespaces[-1][name]
+                return (attribute if isinstance(attribute, (Function, *_METHOD_TYPES)) else NULL), tuple(namespaces)
+        return NULL, ()
 
     def copy_op(self, argval: int, **kwargs: tp.Any) -> None:
         self.push(self.data_stack[-argval])
@@ -705,31 +1268,441 @@ class Frame:
             self.push(lhs is rhs)
 
     def format_value_op(self, arg: int, **kwargs: tp.Any) -> None:
-        value = self.pop()
+        """
+        Operation description:
+            https://docs.python.org/release/3.11.5/library/dis.html#opcode-FORMAT_VALUE
+        """
         flags = arg
-        if (flags & 0x03) == 0x00:
-            pass
-        elif (flags & 0x03) == 0x01:
+        fmt_spec = self.pop() if (flags & 0x04) == 0x04 else ""
+        value = self.pop()
+        if (flags & 0x03) == 0x01:
             value = str(value)
         elif (flags & 0x03) == 0x02:
             value = repr(value)
         elif (flags & 0x03) == 0x03:
             value = ascii(value)
-        elif (flags & 0x04) == 0x04:
-            raise NameError("not implemented")
-            # fmt_spec = self.pop()
-            # if type(fmt_spec
-        self.push(value)
+        self.push(format(value, fmt_spec))
 
     def build_string_op(self, arg: int, **kwargs: tp.Any) -> None:
         self.push("".join(map(str, self.popn(arg))))
 
 
+# specializations of BINARY_OP by argument and type of operands, like in cpython 3.11
+_SPECIALIZED_BINARY_OPS: dict[tuple[int, type], tp.Callable[..., None]] = {}
+for _arg, _type, _handler in [
+    (0, int, Frame.binary_op_add_int_op), (0, float, Frame.binary_op_add_float_op),
+    (0, str, Frame.binary_op_add_unicode_op), (10, int, Frame.binary_op_subtract_int_op),
+    (10, float, Frame.binary_op_subtract_float_op), (5, int, Frame.binary_op_multiply_int_op),
+    (5, float, Frame.binary_op_multiply_float_op),
+]:
+    _SPECIALIZED_BINARY_OPS[_arg, _type] = _SPECIALIZED_BINARY_OPS[_arg + 13, _type] = _handler
+
+
+class Function:
+    """
+    Function defined by code run in VM; calling it runs its code in a new frame of the same VM.
+    Arguments of simple positional calls are copied to fast locals as is, other calls are bound by plan of code.
+    """
+
+    def __init__(self, code: types.CodeType, func_globals: Namespace, func_builtins: dict[str, tp.Any],
+                 vm: 'VirtualMachine', defaults: tuple[tp.Any, ...] | None = None,
+                 kwdefaults: dict[str, tp.Any] | None = None, closure: tuple[types.CellType, ...] = ()) -> None:
+        self.__code__ = code
+        self.__globals__ = func_globals
+        self.__defaults__ = defaults
+        self.__kwdefaults__ = kwdefaults
+        self.__closure__ = closure or None
+        self.__name__ = code.co_name
+        self.__qualname__ = code.co_qualname
+        # None like in cpython if globals have no __name__
+        self.__module__ = func_globals.get("__name__")  # type: ignore[assignment]
+        self.__doc__ = code.co_consts[0] if code.co_consts and isinstance(code.co_consts[0], str) else None
+        self.__annotations__: dict[str, tp.Any] = {}
+        self.builtins = func_builtins
+        self.vm = vm
+        self.decoded = decode(code)
+        self.closure = closure
+        self.defaults = defaults or ()
+        # number of positional arguments which have no defaults
+        self.required = code.co_argcount - len(self.defaults)
+
+    def __repr__(self) -> str:
+        return f"<function {self.__qualname__} at {id(self):#x}>"
+
+    def __get__(self, instance: tp.Any, owner: type | None = None) -> tp.Any:
+        return self if instance is None else types.MethodType(self, instance)
+
+    def __call__(self, *args: tp.Any, **kwargs: tp.Any) -> tp.Any:
+        return self.call(args, kwargs)
+
+    def call(self, args: tp.Sequence[tp.Any], kwargs: dict[str, tp.Any],
+             func_locals: dict[str, tp.Any] | None = None) -> tp.Any:
+        """
+        :param func_locals: namespace to run code in (for class bodies), by default locals are fast only
+        """
+        decoded = self.decoded
+        if not kwargs and decoded.simple and self.required <= len(args) <= decoded.argcount:
+            fast_locals = [*args, *self.defaults[len(args) - self.required:], *decoded.nulls]
+        else:
+            fast_locals = self.bind(args, kwargs)
+        frame = Frame(self.__code__, self.builtins, self.__globals__, {} if func_locals is None else func_locals,
+                      self.vm, fast_locals, self.closure)
+        return frame.run()
+
+    def bind(self, args: tp.Sequence[tp.Any], kwargs: dict[str, tp.Any]) -> list[tp.Any]:
+        """Fast locals with arguments bound to parameters, raise TypeError with one of `ERR_*` descriptions"""
+        decoded = self.decoded
+        fast_locals: list[tp.Any] = [NULL] * len(decoded.names)
+        argcount = decoded.argcount
+        fast_locals[:min(len(args), argcount)] = args[:argcount]
+        if len(args) > argcount and decoded.varargs_index < 0:
+            raise TypeError(ERR_TOO_MANY_POS_ARGS)
+        if decoded.varargs_index >= 0:
+            fast_locals[decoded.varargs_index] = tuple(args[argcount:])
+
+        extra: dict[str, tp.Any] = {}
+        for name, value in kwargs.items():
+            index = decoded.keyword_indices.get(name)
+            if index is None:
+                if decoded.varkwargs_index >= 0:
+                    extra[name] = value
+                    continue
+                raise TypeError(ERR_POSONLY_PASSED_AS_KW if name in decoded.positional_only else ERR_TOO_MANY_KW_ARGS)
+            if fast_locals[index] is not NULL:
+                raise TypeError(ERR_MULT_VALUES_FOR_ARG)
+            fast_locals[index] = value
+        if decoded.varkwargs_index >= 0:
+            fast_locals[decoded.varkwargs_index] = extra
+
+        for index in range(len(args), argcount):
+            if fast_locals[index] is NULL:
+                if index < self.required:
+                    raise TypeError(ERR_MISSING_POS_ARGS)
+                fast_locals[index] = self.defaults[index - self.required]
+        kwdefaults = self.__kwdefaults__ or {}
+        for index in range(argcount, argcount + decoded.kwonlyargcount):
+            if fast_locals[index] is NULL:
+                name = decoded.names[index]
+                if name not in kwdefaults:
+                    raise TypeError(ERR_MISSING_KWONLY_ARGS)
+                fast_locals[index] = kwdefaults[name]
+        return fast_locals
+
+
+class Generator:
+    """
+    Generator created by call of generator function defined in VM. Its frame is suspended and resumed as is:
+    instruction pointer and value stack are kept in frame between resumptions, decoded code is shared.
+    """
+
+    def __init__(self, frame: Frame) -> None:
+        self.gi_frame = frame
+        self.gi_code = frame.code
+        self.__name__ = frame.code.co_name
+        self.__qualname__ = frame.code.co_qualname
+        self.gi_running = False
+        self.started = False
+        self.finished = False
+        self.exception: BaseException | None = None
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__.lower()} object {self.__qualname__} at {id(self):#x}>"
+
+    def __del__(self) -> None:
+        # like in cpython, generator suspended at yield is closed when collected, so its finally blocks run;
+        # errors of close are reported as unraisable by the interpreter
+        if self.started and not self.finished:
+            self.close()
+
+    def __iter__(self) -> 'Generator':
+        return self
+
+    def __next__(self) -> tp.Any:
+        return self.send(None)
+
+    @property
+    def gi_yieldfrom(self) -> tp.Any:
+        """Iterator which the generator delegates to by `yield from` or `await`, if it is suspended there"""
+        frame = self.gi_frame
+        if not self.started or self.finished or frame.ptr + 1 >= len(frame.decoded.instructions):
+            return None
+        # yield of delegation is followed by RESUME with argument 2 (yield from) or 3 (await)
+        following = frame.decoded.instructions[frame.ptr + 1]
+        if following.opname != "RESUME" or following.arg is None or following.arg < 2:
+            return None
+        return frame.top()
+
+    def send(self, value: tp.Any) -> tp.Any:
+        if self.finished:
+            raise StopIteration
+        if not self.started and value is not None:
+            raise TypeError(f"can't send non-None value to a just-started {type(self).__name__.lower()}")
+        return self.resume(value)
+
+    def throw(self, typ: tp.Any, val: tp.Any = None, tb: types.TracebackType | None = None) -> tp.Any:
+        if isinstance(typ, BaseException):
+            exc = typ
+        elif val is None:
+            exc = typ()
+        else:
+            exc = val if isinstance(val, typ) else typ(val)
+        if tb is not None:
+            exc = exc.with_traceback(tb)
+        if self.finished:
+            raise exc
+
+        delegate = self.gi_yieldfrom
+        if delegate is not None:
+            if isinstance(exc, GeneratorExit):
+                close = getattr(delegate, "close", None)
+                if close is not None:
+                    close()
+            elif (delegate_throw := getattr(delegate, "throw", None)) is not None:
+                self.gi_running = True
+                try:
+                    return delegate_throw(exc)
+                except StopIteration as stop:
+                    # delegation is over, continue after SEND loop with its result as value of yield from
+                    frame = self.gi_frame
+                    frame.pop()
+                    send = frame.decoded.instructions[frame.ptr - 1]
+                    frame.ptr = frame.decoded.indices[send.argval] - 1
+                    self.gi_running = False
+                    return self.resume(stop.value)
+                except BaseException as error:
+                    exc = error
+                finally:
+                    self.gi_running = False
+        return self.resume(exc=exc)
+
+    def close(self) -> None:
+        if self.finished:
+            return
+        if not self.started:
+            self.finished = True
+            return
+        try:
+            self.throw(GeneratorExit)
+        except (GeneratorExit, StopIteration):
+            return
+        raise RuntimeError(f"{type(self).__name__.lower()} ignored GeneratorExit")
+
+    def resume(self, value: tp.Any = None, exc: BaseException | None = None) -> tp.Any:
+        """Run frame from the suspension point with sent value or raised exception until the next yield"""
+        if self.gi_running:
+            raise ValueError(f"{type(self).__name__.lower()} already executing")
+        frame = self.gi_frame
+        frame.returned = False
+        self.started = self.gi_running = True
+        # generator has its own handled exception, it is kept while generator is suspended in except block
+        vm = frame.vm
+        outer_exception = vm.exception
+        if self.exception is not None:
+            vm.exception = self.exception
+        try:
+            if exc is None:
+                frame.push(value)
+                result = frame.run()
+            else:
+                result = frame.throw(exc)
+        except StopIteration as stop:
+            self.finished = True
+            raise RuntimeError(f"{type(self).__name__.lower()} raised StopIteration") from stop
+        except BaseException:
+            self.finished = True
+            raise
+        finally:
+            self.gi_running = False
+            self.exception = vm.exception if vm.exception is not outer_exception else None
+            vm.exception = outer_exception
+        if frame.yielded:
+            frame.yielded = False
+            return result
+        self.finished = True
+        raise StopIteration() if result is None else StopIteration(result)
+
+
+class Coroutine(Generator):
+    """Coroutine created by call of `async def` function defined in VM"""
+
+    def __await__(self) -> 'Coroutine':
+        return self
+
+    @property
+    def cr_await(self) -> tp.Any:
+        return self.gi_yieldfrom
+
+
+class CodeStats:
+    """Metrics of code object collected by `VMProfiler`, times are in seconds"""
+
+    def __init__(self, code: types.CodeType) -> None:
+        self.code = code
+        instructions = decode(code).instructions
+        self.counts = [0] * len(instructions)
+        self.times = [0.0] * len(instructions)
+        # times of instructions without time of code called by them
+        self.self_times = [0.0] * len(instructions)
+        self.calls = 0
+        # calls which are not recursive, i.e. the code was not running yet
+        self.primitive_calls = 0
+        self.self_time = 0.0
+        self.total_time = 0.0
+        # the same metrics by code objects calling this one
+        # (primitive calls, calls, self time, total time) as in pstats
+        self.callers: collections.defaultdict[types.CodeType, list[float]] = \
+            collections.defaultdict(lambda: [0, 0, 0.0, 0.0])
+
+    @property
+    def key(self) -> tuple[str, int, str]:
+        """Function identifier in pstats format"""
+        return self.code.co_filename, self.code.co_firstlineno, self.code.co_qualname
+
+
+class VMProfiler:
+    """
+    Collects number of executions and time of every instruction and calls, self and total time of code objects
+    run by VM. Profiled frames run in separate loop, so VM without profiler does not pay for it.
+    Time of instruction includes time of code called by it (e.g. by CALL), self time does not.
+    """
+
+    def __init__(self) -> None:
+        self.stats: dict[types.CodeType, CodeStats] = {}
+        # running code objects with their start times and time spent in code they called
+        self._running: list[list[tp.Any]] = []
+        self._depth: collections.Counter[types.CodeType] = collections.Counter()
+
+    def enter(self, code: types.CodeType, resumed: bool = False) -> list[tp.Any]:
+        """
+        Register start of code
+        :param resumed: code of generator is resumed, so it is not counted as a call
+        :return: its run [stats of code, start time, time of code called so far, resumed], which profiler updates
+        """
+        stats = self.stats.get(code)
+        if stats is None:
+            stats = self.stats[code] = CodeStats(code)
+        run = [stats, time.perf_counter(), 0.0, resumed]
+        self._running.append(run)
+        self._depth[code] += 1
+        return run
+
+    def exit(self) -> None:
+        """Register end of the last started code"""
+        stats, start, children, resumed = self._running.pop()
+        elapsed = time.perf_counter() - start
+        self._depth[stats.code] -= 1
+        recursive = self._depth[stats.code] > 0
+        calls = 0 if resumed else 1
+        stats.calls += calls
+        stats.self_time += elapsed - children
+        if not recursive:
+            stats.primitive_calls += calls
+            stats.total_time += elapsed
+        if self._running:
+            caller = self._running[-1]
+            caller[2] += elapsed
+            edge = stats.callers[caller[0].code]
+            edge[0] += 0 if recursive else calls
+            edge[1] += calls
+            edge[2] += elapsed - children
+            edge[3] += 0.0 if recursive else elapsed
+
+    def opcodes(self) -> list[tuple[str, int, float, float]]:
+        """Opcode names with numbers of executions, cumulative and self times, the slowest (by self time) first"""
+        counts: collections.Counter[str] = collections.Counter()
+        times: collections.defaultdict[str, float] = collections.defaultdict(float)
+        self_times: collections.defaultdict[str, float] = collections.defaultdict(float)
+        for stats in self.stats.values():
+            for instruction, count, spent, self_spent in zip(decode(stats.code).instructions, stats.counts,
+                                                             stats.times, stats.self_times):
+                counts[instruction.opname] += count
+                times[instruction.opname] += spent
+                self_times[instruction.opname] += self_spent
+        return sorted(((name, counts[name], times[name], self_times[name]) for name in counts if counts[name]),
+                      key=lambda item: -item[3])
+
+    def functions(self) -> list[CodeStats]:
+        """Metrics of code objects, the slowest (by self time) first"""
+        return sorted(self.stats.values(), key=lambda stats: -stats.self_time)
+
+    def hottest(self, n: int = 20) -> list[tuple[str, int | None, int, str, int, float, float]]:
+        """
+        The slowest (by self time) instructions
+        :return: tuples (qualified name of code, line, offset, opname, number of executions, time, self time)
+        """
+        rows = []
+        for stats in self.stats.values():
+            for instruction, count, spent, self_spent in zip(decode(stats.code).instructions, stats.counts,
+                                                             stats.times, stats.self_times):
+                if count:
+                    line = instruction.positions.lineno if instruction.positions else None
+                    rows.append((stats.code.co_qualname, line, instruction.offset, instruction.opname, count, spent,
+                                 self_spent))
+        return sorted(rows, key=lambda row: -row[6])[:n]
+
+    def to_json(self) -> dict[str, tp.Any]:
+        return {
+            "opcodes": [{"opname": name, "count": count, "time": spent, "self_time": self_spent}
+                        for name, count, spent, self_spent in self.opcodes()],
+            "functions": [{"filename": stats.code.co_filename, "line": stats.code.co_firstlineno,
+                           "name": stats.code.co_qualname, "calls": stats.calls, "self_time": stats.self_time,
+                           "total_time": stats.total_time} for stats in self.functions()],
+            "hottest": [{"name": name, "line": line, "offset": offset, "opname": opname, "count": count, "time": spent,
+                         "self_time": self_spent}
+                        for name, line, offset, opname, count, spent, self_spent in self.hottest()],
+        }
+
+    def dump_json(self, filename: str) -> None:
+        with open(filename, "w") as file:
+            json.dump(self.to_json(), file, indent=2)
+
+    def dump_stats(self, filename: str) -> None:
+        """Save metrics of code objects in format of `cProfile`, they can be loaded by `pstats.Stats(filename)`"""
+        result = {}
+        for stats in self.stats.values():
+            callers = {self.stats[code].key: tuple(edge) for code, edge in stats.callers.items()}
+            result[stats.key] = (stats.primitive_calls, stats.calls, stats.self_time, stats.total_time, callers)
+        with open(filename, "wb") as file:
+            marshal.dump(result, file)
+
+    def report(self, n: int = 20) -> str:
+        """Tables of the slowest opcodes, code objects and instructions"""
+        lines = [f'{"opcode":<32}{"count":>12}{"time, s":>12}{"self, s":>12}']
+        lines += [f"{name:<32}{count:>12}{spent:>12.4f}{self_spent:>12.4f}"
+                  for name, count, spent, self_spent in self.opcodes()[:n]]
+        lines += ["", f'{"code":<32}{"calls":>12}{"self, s":>12}{"total, s":>12}']
+        lines += [f"{stats.code.co_qualname[:31]:<32}{stats.calls:>12}{stats.self_time:>12.4f}{stats.total_time:>12.4f}"
+                  for stats in self.functions()[:n]]
+        lines += ["", f'{"instruction":<48}{"count":>12}{"time, s":>12}{"self, s":>12}']
+        lines += [f"{f'{name[:20]}:{line} @{offset} {opname}':<48}{count:>12}{spent:>12.4f}{self_spent:>12.4f}"
+                  for name, line, offset, opname, count, spent, self_spent in self.hottest(n)]
+        return "\n".join(lines)
+
+
 class VirtualMachine:
+    def __init__(self, trace: tp.TextIO | None = None, profiler: VMProfiler | None = None) -> None:
+        """
+        :param trace: file to write every executed instruction and the frame state after it to (slow, for debugging)
+        :param profiler: profiler to collect metrics of executed code to
+        """
+        self.trace = trace
+        self.profiler = profiler
+        # exception handled by except block of VM code, reraised by bare raise
+        self.exception: BaseException | None = None
+
     def run(self, code_obj: types.CodeType) -> None:
         """
         :param code_obj: code for interpreting
         """
-        globals_context: dict[str, tp.Any] = {}
-        frame = Frame(code_obj, builtins.globals()['__builtins__'], globals_context, globals_context)
+        globals_context = Namespace()
+        frame = Frame(code_obj, builtins.__dict__, globals_context, globals_context, self)
         return frame.run()
+
+    def build_class(self, func: Function, name: str, *bases: tp.Any, **kwargs: tp.Any) -> type:
+        """Same as `builtins.__build_class__`, which can not run body of class defined in VM"""
+        resolved_bases = types.resolve_bases(bases)
+        meta, namespace, kwargs = types.prepare_class(name, resolved_bases, kwargs)
+        func.call((), {}, namespace)
+        if resolved_bases != bases:
+            namespace["__orig_bases__"] = bases
+        return meta(name, resolved_bases, namespace, **kwargs)
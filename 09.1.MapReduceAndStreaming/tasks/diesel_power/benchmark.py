@@ -0,0 +1,293 @@
+"""
+Benchmarks of mappers, reducers, joiners and typical graphs on synthetic data.
+
+    python -m diesel_power.benchmark --save                  # measure and save baseline
+    python -m diesel_power.benchmark                         # measure and compare with baseline
+    python -m diesel_power.benchmark --filter join --scale 0.1
+
+Throughput is measured in input rows per second, memory is the peak growth of process RSS
+sampled by `MemoryWatchdog` (its period is set by WATCHDOG_PERIOD environment variable).
+"""
+import argparse
+import collections
+import dataclasses
+import functools
+import gc
+import itertools
+import json
+import math
+import os
+import random
+import string
+import sys
+import time
+import typing as tp
+
+from . import graph
+from . import operations as ops
+from .memory_watchdog import MemoryWatchdog, SELF_PROCESS
+
+MiB = 1024 * 1024
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'benchmark_baseline.json')
+
+
+def _zipf_weights(vocabulary: int, exponent: float) -> list[float]:
+    return [1 / rank ** exponent for rank in range(1, vocabulary + 1)]
+
+
+def words(vocabulary: int, seed: int = 0) -> list[str]:
+    """Distinct random lowercase words"""
+    rng = random.Random(seed)
+    result: dict[str, None] = {}
+    while len(result) < vocabulary:
+        result[''.join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 10)))] = None
+    return list(result)
+
+
+def zipf_rows(count: int, vocabulary: int = 10000, exponent: float = 1.2,
+              grouped: bool = False, seed: int = 0) -> ops.TRowsGenerator:
+    """
+    Rows {'key', 'value', 'time'} with keys distributed by Zipf's law: the k-th key is 1 / k^exponent as frequent
+    :param grouped: if true, rows are sorted by key (sizes of groups follow the same law)
+    """
+    rng = random.Random(seed)
+    weights = _zipf_weights(vocabulary, exponent)
+    if grouped:
+        total = sum(weights)
+        sizes = [max(1, round(count * weight / total)) for weight in weights]
+        keys: tp.Iterable[int] = sorted(itertools.islice(
+            itertools.chain.from_iterable(itertools.repeat(rank, size) for rank, size in enumerate(sizes)), count))
+    else:
+        cum_weights = list(itertools.accumulate(weights))
+        keys = (rng.choices(range(vocabulary), cum_weights=cum_weights)[0] for _ in range(count))
+    for index, key in enumerate(keys):
+        yield {'key': f'{key:08}', 'value': rng.random(), 'time': index}
+
+
+def skewed_join(count: int, keys: int = 1000, hot_share: float = 0.5,
+                seed: int = 0) -> tuple[ops.TRowsGenerator, ops.TRowsGenerator]:
+    """
+    Two tables sorted by 'key' to join: the left one has a row per key, the right one has `count` rows,
+    `hot_share` of them with the first key and the rest spread uniformly over the other keys
+    """
+    rng = random.Random(seed)
+
+    def left() -> ops.TRowsGenerator:
+        for key in range(keys):
+            yield {'key': f'{key:08}', 'name': f'name{key}'}
+
+    def right() -> ops.TRowsGenerator:
+        hot = int(count * hot_share)
+        cold = sorted(rng.randrange(1, keys) for _ in range(count - hot))
+        for key in itertools.chain(itertools.repeat(0, hot), cold):
+            yield {'key': f'{key:08}', 'value': rng.random()}
+
+    return left(), right()
+
+
+def long_texts(count: int, words_per_text: int = 1000, vocabulary: int = 10000,
+               exponent: float = 1.1, seed: int = 0) -> ops.TRowsGenerator:
+    """Rows {'doc_id', 'text'} with texts of Zipf-distributed words, some of them capitalized and punctuated"""
+    rng = random.Random(seed)
+    dictionary = words(vocabulary, seed)
+    dictionary += [word.capitalize() + ',' for word in dictionary[:vocabulary // 10]]
+    cum_weights = list(itertools.accumulate(_zipf_weights(len(dictionary), exponent)))
+    for doc_id in range(count):
+        yield {'doc_id': doc_id, 'text': ' '.join(rng.choices(dictionary, cum_weights=cum_weights, k=words_per_text))}
+
+
+class _Idf(ops.Mapper):
+    def __call__(self, row: ops.TRow) -> ops.TRowsGenerator:
+        row['idf'] = math.log(row['docs_count'] / row['docs_with_word'])
+        yield row
+
+
+def _words_graph(source: str) -> graph.Graph:
+    return graph.Graph.from_iter(source) \
+        .map(ops.FilterPunctuation('text')).map(ops.LowerCase('text')).map(ops.Split('text'))
+
+
+def word_count_graph(source: str = 'docs') -> graph.Graph:
+    """Number of occurrences of every word in texts, the most frequent first"""
+    return _words_graph(source).sort(['text']).reduce(ops.Count('count'), ['text']).sort(['count', 'text'])
+
+
+def tf_idf_graph(source: str = 'docs') -> graph.Graph:
+    """Three documents with the largest tf-idf for every word"""
+    split_words = _words_graph(source)
+    count_docs = graph.Graph.from_iter(source).reduce(ops.Count('docs_count'), [])
+    idf = split_words.sort(['doc_id', 'text']).reduce(ops.FirstReducer(), ['doc_id', 'text']) \
+        .sort(['text']).reduce(ops.Count('docs_with_word'), ['text']) \
+        .join(ops.InnerJoiner(), count_docs, []).map(_Idf())
+    tf = split_words.sort(['doc_id']).reduce(ops.TermFrequency('text'), ['doc_id'])
+    return tf.sort(['text']).join(ops.InnerJoiner(), idf, ['text']) \
+        .map(ops.Product(['tf', 'idf'], 'tf_idf')).reduce(ops.TopN('tf_idf', 3), ['text'])
+
+
+TTables = tp.Callable[[], list[list[ops.TRow]]]
+TCopies = tp.Callable[[], ops.TRowsIterable]
+
+
+@dataclasses.dataclass
+class Case:
+    """
+    Benchmark: `run` gets functions returning fresh copies of tables made by `inputs` (in advance,
+    so generation is not measured) and returns rows to exhaust; throughput is measured in input rows per second
+    """
+    name: str
+    inputs: TTables
+    run: tp.Callable[..., ops.TRowsIterable]
+
+
+def cases(scale: float = 1.0) -> list[Case]:
+    """
+    All benchmarks
+    :param scale: multiplier of sizes of inputs
+    """
+    n, texts = max(int(100000 * scale), 10), max(int(1000 * scale), 2)
+    rows: TTables = functools.cache(lambda: [list(zipf_rows(n))])
+    grouped: TTables = functools.cache(lambda: [list(zipf_rows(n, grouped=True))])
+    docs: TTables = functools.cache(lambda: [list(long_texts(texts))])
+    uniform: TTables = functools.cache(lambda: list(map(list, skewed_join(n, max(n // 100, 2), 0.0))))
+    skewed: TTables = functools.cache(lambda: list(map(list, skewed_join(n, max(n // 100, 2), 0.5))))
+
+    def map_case(mapper: ops.Mapper) -> tp.Callable[[TCopies], ops.TRowsIterable]:
+        return lambda table: ops.Map(mapper)(table())
+
+    def reduce_case(reducer: ops.Reducer,
+                    keys: tp.Sequence[str] = ('key',)) -> tp.Callable[[TCopies], ops.TRowsIterable]:
+        return lambda table: ops.Reduce(reducer, keys)(table())
+
+    def join_case(joiner: ops.Joiner) -> tp.Callable[[TCopies, TCopies], ops.TRowsIterable]:
+        return lambda left, right: ops.Join(joiner, ['key'])(left(), right())
+
+    result = [
+        Case('map/DummyMapper', rows, map_case(ops.DummyMapper())),
+        Case('map/FilterPunctuation', docs, map_case(ops.FilterPunctuation('text'))),
+        Case('map/LowerCase', docs, map_case(ops.LowerCase('text'))),
+        Case('map/Split', docs, map_case(ops.Split('text'))),
+        Case('map/Tokenize', docs, map_case(ops.Tokenize(['text'], keep=['doc_id']))),
+        Case('map/Product', rows, map_case(ops.Product(['value', 'value']))),
+        Case('map/Filter', rows, map_case(ops.Filter(lambda row: row['value'] < 0.5))),
+        Case('map/Project', rows, map_case(ops.Project(['key', 'value']))),
+        Case('reduce/FirstReducer', grouped, reduce_case(ops.FirstReducer())),
+        Case('reduce/TopN', grouped, reduce_case(ops.TopN('value', 3))),
+        Case('reduce/TermFrequency', rows, reduce_case(ops.TermFrequency('key'), ())),
+        Case('reduce/Count', grouped, reduce_case(ops.Count('count'))),
+        Case('reduce/Sum', grouped, reduce_case(ops.Sum('value'))),
+        Case('reduce/ApproxDistinct', rows, reduce_case(ops.ApproxDistinct('key'), ())),
+        Case('reduce/HeavyHitters', rows, reduce_case(ops.HeavyHitters('key', 10), ())),
+        Case('reduce/ApproxQuantiles', rows, reduce_case(ops.ApproxQuantiles('value', {'median': 0.5}), ())),
+        Case('hash_reduce/Count', rows, lambda table: ops.HashReduce(ops.Count('count'), ['key'])(table())),
+        Case('sort', rows, lambda table: ops.Sort(['key'])(table())),
+    ]
+    for joiner_type in (ops.InnerJoiner, ops.OuterJoiner, ops.LeftJoiner, ops.RightJoiner):
+        result.append(Case(f'join/{joiner_type.__name__}', uniform, join_case(joiner_type())))
+        result.append(Case(f'join/{joiner_type.__name__}/skewed', skewed, join_case(joiner_type())))
+    result += [
+        Case('graph/word_count', docs, lambda table: word_count_graph().run(docs=table)),
+        Case('graph/tf_idf', docs, lambda table: tf_idf_graph().run(docs=table)),
+    ]
+    return result
+
+
+@dataclasses.dataclass
+class Result:
+    """Measurement of one benchmark"""
+    rows: int
+    seconds: float
+    peak_memory: int
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else math.inf
+
+
+def measure(case: Case, repeat: int = 1) -> Result:
+    """
+    Run benchmark; the fastest run and the smallest peak memory of all runs are taken
+    :param repeat: number of runs
+    """
+    tables = case.inputs()
+    copies = [functools.partial(map, dict, table) for table in tables]
+    seconds, peak_memory = math.inf, sys.maxsize
+    for _ in range(repeat):
+        gc.collect()
+        start_memory = SELF_PROCESS.memory_info().rss
+        watchdog = MemoryWatchdog(limit=1024 * MiB, is_baseline=True)
+        watchdog.start()
+        start = time.perf_counter()
+        try:
+            collections.deque(case.run(*copies), maxlen=0)
+        finally:
+            seconds = min(seconds, time.perf_counter() - start)
+            usage = SELF_PROCESS.memory_info().rss
+            watchdog.stop()
+            watchdog.join()
+        peak_memory = min(peak_memory, max(watchdog.maximum_memory_usage, usage) - start_memory)
+    return Result(sum(map(len, tables)), seconds, max(peak_memory, 0))
+
+
+def save(results: tp.Mapping[str, Result], filename: str) -> None:
+    with open(filename, 'w') as file:
+        json.dump({name: dataclasses.asdict(result) for name, result in results.items()}, file, indent=2)
+
+
+def load(filename: str) -> dict[str, Result]:
+    with open(filename) as file:
+        return {name: Result(**fields) for name, fields in json.load(file).items()}
+
+
+def compare(results: tp.Mapping[str, Result], baseline: tp.Mapping[str, Result],
+            tolerance: float = 0.25, memory_slack: int = 8 * MiB) -> list[str]:
+    """
+    Find regressions against baseline
+    :param tolerance: allowed relative decrease of throughput and increase of memory
+    :param memory_slack: allowed absolute increase of memory, small peaks are mostly noise of allocator and GC
+    :return: descriptions of regressions
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result.rows_per_second < base.rows_per_second * (1 - tolerance):
+            regressions.append(f'{name}: {result.rows_per_second:.0f} rows/s, '
+                               f'baseline {base.rows_per_second:.0f} rows/s')
+        if result.peak_memory > base.peak_memory * (1 + tolerance) + memory_slack:
+            regressions.append(f'{name}: {result.peak_memory / MiB:.1f} MiB, baseline {base.peak_memory / MiB:.1f} MiB')
+    return regressions
+
+
+def main(argv: tp.Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplier of sizes of inputs')
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs of every benchmark')
+    parser.add_argument('--filter', default='', help='run only benchmarks with this substring in name')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='JSON file with baseline results')
+    parser.add_argument('--save', action='store_true', help='save results as new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative regression')
+    args = parser.parse_args(argv)
+
+    baseline = load(args.baseline) if not args.save and os.path.exists(args.baseline) else {}
+    results = {}
+    print(f'{"benchmark":<36}{"rows/s":>14}{"memory, MiB":>13}{"vs baseline":>13}')
+    for case in cases(args.scale):
+        if args.filter not in case.name:
+            continue
+        result = results[case.name] = measure(case, args.repeat)
+        base = baseline.get(case.name)
+        change = f'{result.rows_per_second / base.rows_per_second - 1:+.1%}' if base else ''
+        print(f'{case.name:<36}{result.rows_per_second:>14.0f}{result.peak_memory / MiB:>13.1f}{change:>13}')
+
+    if args.save:
+        save(results, args.baseline)
+        return 0
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f'REGRESSION {regression}', file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
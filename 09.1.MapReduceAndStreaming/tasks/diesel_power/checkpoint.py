@@ -0,0 +1,226 @@
+import glob
+import hashlib
+import itertools
+import os
+import pickle
+import re
+import tempfile
+import types
+import typing as tp
+
+from . import operations as ops
+
+if tp.TYPE_CHECKING:
+    from .graph import Graph
+
+
+def fingerprint(obj: tp.Any) -> str:
+    """
+    Digest of configuration (operations, mappers, parsers, ...) which is the same in every run.
+    Functions are identified by their code, defaults and closure, functions they call are not tracked.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    _feed(digest, obj, set())
+    return digest.hexdigest()
+
+
+def _feed(digest: tp.Any, obj: tp.Any, seen: set[int]) -> None:
+    """:param seen: ids of objects being fed, to stop on reference cycles"""
+    if obj is None or isinstance(obj, (str, bytes, int, float, complex)):
+        digest.update(repr(obj).encode())
+        return
+    if id(obj) in seen:
+        digest.update(b'<cycle>')
+        return
+    seen.add(id(obj))
+    digest.update(f'<{type(obj).__module__}.{type(obj).__qualname__}>'.encode())
+    items: tp.Iterable[tp.Any]
+    if isinstance(obj, (list, tuple)):
+        items = obj
+    elif isinstance(obj, (set, frozenset)):
+        items = sorted(fingerprint(item) for item in obj)
+    elif isinstance(obj, dict):
+        items = obj.items()
+    elif isinstance(obj, types.FunctionType):
+        # mutable containers captured by closures are state (like caches or counters), not configuration
+        cells = [cell.cell_contents for cell in obj.__closure__ or ()
+                 if not isinstance(cell.cell_contents, (list, dict, set, bytearray))]
+        items = (obj.__module__, obj.__qualname__, obj.__code__, obj.__defaults__, obj.__kwdefaults__, cells)
+    elif isinstance(obj, types.CodeType):
+        items = (obj.co_code, obj.co_consts, obj.co_names)
+    elif isinstance(obj, (types.MethodType, types.BuiltinMethodType)):
+        items = (getattr(obj, '__self__', None), obj.__name__)
+    elif hasattr(obj, '__dict__') and not isinstance(obj, (type, types.ModuleType)):
+        items = sorted(vars(obj).items())
+    else:
+        items = (re.sub(r' at 0x[0-9a-fA-F]+', '', repr(obj)),)
+    for item in items:
+        _feed(digest, item, seen)
+    seen.remove(id(obj))
+
+
+def _file_stats(filenames: tp.Iterable[str]) -> dict[str, tuple[int, int]]:
+    """Sizes and modification times of files by absolute names"""
+    stats = {}
+    for filename in filenames:
+        stat = os.stat(filename)
+        stats[os.path.abspath(filename)] = (stat.st_size, stat.st_mtime_ns)
+    return stats
+
+
+def _source_files(operation: ops.Operation) -> list[str] | None:
+    """Files read by source operation; None if its input can not be fingerprinted"""
+    if isinstance(operation, (ops.Read, ops.ReadBinary)):
+        return [operation.filename]
+    if isinstance(operation, ops.ReadFiles):
+        return list(dict.fromkeys(filename for filename, _, _ in operation.shards()))
+    if isinstance(operation, IncrementalReduce):
+        return _source_files(operation.source)
+    return None
+
+
+def _graph_fingerprint(graph: 'Graph') -> str | None:
+    """Digest of graph configuration and its input files; None if some input can not be fingerprinted"""
+    if isinstance(graph._operation, Checkpoint):
+        return _graph_fingerprint(graph._operation.graph)
+    parts: list[tp.Any] = []
+    for parent in graph._parents:
+        parent_fingerprint = _graph_fingerprint(parent)
+        if parent_fingerprint is None:
+            return None
+        parts.append(parent_fingerprint)
+    if not graph._parents:
+        files = _source_files(graph._operation)
+        if files is None:
+            return None
+        parts.append(_file_stats(files))
+    return fingerprint((graph._operation, parts))
+
+
+class CheckpointStore:
+    """Directory with content-addressed results of stages; files are replaced atomically"""
+
+    def __init__(self, directory: str) -> None:
+        """
+        :param directory: directory to keep checkpoints in, it is created if necessary
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: str, suffix: str = '.rows') -> str:
+        return os.path.join(self.directory, key + suffix)
+
+    def read_rows(self, key: str) -> ops.TRowsGenerator:
+        for chunk in ops.unspill(open(self.path(key), 'rb')):
+            yield from chunk
+
+    def write_rows(self, key: str, rows: ops.TRowsIterable, chunk_size: int = 4096) -> ops.TRowsGenerator:
+        """Pass rows through and save them; nothing is saved unless rows are exhausted"""
+        rows = iter(rows)
+        with tempfile.NamedTemporaryFile(dir=self.directory, delete=False) as file:
+            try:
+                while chunk := list(itertools.islice(rows, chunk_size)):
+                    pickle.dump(chunk, file, pickle.HIGHEST_PROTOCOL)
+                    yield from chunk
+            except BaseException:
+                file.close()
+                os.remove(file.name)
+                raise
+        os.replace(file.name, self.path(key))
+
+    def load(self, key: str) -> tp.Any:
+        """:return: object saved by `save`, None if there is no such object"""
+        try:
+            with open(self.path(key, '.state'), 'rb') as file:
+                return pickle.load(file)
+        except FileNotFoundError:
+            return None
+
+    def save(self, key: str, obj: tp.Any) -> None:
+        with tempfile.NamedTemporaryFile(dir=self.directory, delete=False) as file:
+            pickle.dump(obj, file, pickle.HIGHEST_PROTOCOL)
+        os.replace(file.name, self.path(key, '.state'))
+
+
+class Checkpoint(ops.Operation):
+    """
+    Source operation serving results of graph from store while its configuration and input files are unchanged.
+    Otherwise graph is run (in current process) and its results are saved.
+    Graphs reading rows from iterators can not be fingerprinted, so they are always run.
+    """
+
+    def __init__(self, store: CheckpointStore, graph: 'Graph') -> None:
+        self.store = store
+        self.graph = graph
+
+    def __call__(self, *args: tp.Any, **kwargs: tp.Any) -> ops.TRowsGenerator:
+        key = _graph_fingerprint(self.graph)
+        if key is None:
+            yield from self.graph.run(**kwargs)
+        elif os.path.exists(self.store.path(key)):
+            yield from self.store.read_rows(key)
+        else:
+            yield from self.store.write_rows(key, self.graph.run(**kwargs))
+
+
+class IncrementalReduce(ops.Operation):
+    """
+    Reduce of rows read from files and passed through mappers, which keeps states of groups in store.
+    When files are only added since the previous run, only the new files are read and their rows
+    are added to the saved states; if any of the previously read files changed, everything is recomputed.
+    All states are kept in memory; results are ordered by keys.
+    """
+
+    def __init__(self, reducer: ops.AlgebraicReducer, keys: tp.Sequence[str], store: CheckpointStore,
+                 source: ops.Read | ops.ReadFiles, mappers: tp.Sequence[ops.Mapper] = ()) -> None:
+        """
+        :param reducer: reducer with mergeable state
+        :param keys: column names to group by
+        :param store: store to keep states in
+        :param source: operation reading files
+        :param mappers: mappers applied to rows of files before reduce
+        """
+        self.reducer = reducer
+        self.keys = keys
+        self.store = store
+        self.source = source
+        self.mappers = mappers
+
+    def _read(self, filenames: tp.Sequence[str]) -> ops.TRowsIterable:
+        if not filenames:
+            return []
+        if isinstance(self.source, ops.Read):
+            rows: ops.TRowsIterable = self.source()
+        else:
+            source = self.source
+            rows = ops.ReadFiles([glob.escape(filename) for filename in filenames], source.parser, source.workers,
+                                 source.ordered, source.split_size, source.encoding)()
+        for mapper in self.mappers:
+            rows = ops.Map(mapper)(rows)
+        return rows
+
+    def __call__(self, *args: tp.Any, **kwargs: tp.Any) -> ops.TRowsGenerator:
+        files = _file_stats(_source_files(self.source) or [])
+        config = self.source.parser if isinstance(self.source, ops.Read) else \
+            (self.source.patterns, self.source.parser, self.source.encoding)
+        key = fingerprint((self.reducer, tuple(self.keys), self.mappers, type(self.source), config))
+
+        saved = self.store.load(key)
+        states: dict[tuple[tp.Any, ...], tp.Any] = {}
+        new_files = list(files)
+        if saved is not None and all(files.get(name) == stats for name, stats in saved['files'].items()):
+            states = saved['states']
+            new_files = [name for name in files if name not in saved['files']]
+
+        if new_files or saved is None:
+            reducer = self.reducer
+            key_func = ops.key_function(self.keys)
+            for row in self._read(new_files):
+                row_key = key_func(row)
+                state = states.get(row_key, ops.MISSING)
+                states[row_key] = reducer.update(reducer.initial() if state is ops.MISSING else state, row)
+            self.store.save(key, {'files': files, 'states': states})
+
+        group_key = tuple(self.keys)
+        for row_key in sorted(states):
+            yield from self.reducer.finalize(group_key, row_key, states[row_key])
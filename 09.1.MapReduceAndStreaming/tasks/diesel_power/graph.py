@@ -0,0 +1,572 @@
+import collections
+import dataclasses
+import heapq
+import itertools
+import multiprocessing
+import multiprocessing.pool
+import operator
+import pickle
+import shutil
+import tempfile
+import typing as tp
+import weakref
+
+from . import checkpoint as checkpoints
+from . import operations as ops
+from . import profiling
+
+
+class Graph:
+    """
+    Computational graph over table operations
+    Methods only describe the computation; nothing is read or computed until `run` is called.
+    Graphs are immutable, so any graph may be reused as a part of several other graphs.
+    """
+
+    def __init__(self, operation: ops.Operation, parents: tp.Sequence['Graph'] = ()) -> None:
+        self._operation = operation
+        self._parents = tuple(parents)
+
+    @staticmethod
+    def from_iter(name: str) -> 'Graph':
+        """
+        Construct new graph which reads data from row iterator (in form of sequence of dicts)
+        passed as `name` keyword argument to `run`
+        :param name: name of kwarg to use as data source
+        """
+        return Graph(ops.ReadIterFactory(name))
+
+    @staticmethod
+    def from_file(filename: str, parser: tp.Callable[[str], ops.TRow]) -> 'Graph':
+        """
+        Construct new graph extended with operation for reading rows from file
+        :param filename: filename to read from
+        :param parser: parser from string to row
+        """
+        return Graph(ops.Read(filename, parser))
+
+    @staticmethod
+    def from_files(patterns: str | tp.Sequence[str], parser: tp.Callable[[str], ops.TRow],
+                   workers: int | None = None, ordered: bool = True) -> 'Graph':
+        """
+        Construct new graph extended with operation for reading rows from several, possibly compressed, files
+        :param patterns: glob pattern or list of patterns of files to read
+        :param parser: parser from string to row
+        :param workers: number of worker processes parsing files
+        :param ordered: whether rows should come in order of files and lines
+        """
+        return Graph(ops.ReadFiles(patterns, parser, workers, ordered))
+
+    def map(self, mapper: ops.Mapper) -> 'Graph':
+        """
+        Construct new graph extended with map operation with particular mapper
+        :param mapper: mapper to use
+        """
+        return Graph(ops.Map(mapper), [self])
+
+    def reduce(self, reducer: ops.Reducer, keys: tp.Sequence[str]) -> 'Graph':
+        """
+        Construct new graph extended with reduce operation with particular reducer
+        :param reducer: reducer to use
+        :param keys: keys for grouping
+        """
+        return Graph(ops.Reduce(reducer, keys), [self])
+
+    def hash_reduce(self, reducer: ops.AlgebraicReducer, keys: tp.Sequence[str],
+                    max_groups: int | None = None) -> 'Graph':
+        """
+        Construct new graph extended with reduce operation which does not need sorted input
+        :param reducer: reducer with mergeable state to use
+        :param keys: keys for grouping
+        :param max_groups: maximum number of groups kept in memory, by default `reducer.max_groups`
+        """
+        return Graph(ops.HashReduce(reducer, keys, max_groups), [self])
+
+    def sort(self, keys: tp.Sequence[str]) -> 'Graph':
+        """
+        Construct new graph extended with sort operation
+        :param keys: sorting keys (typical is tuple of strings)
+        """
+        return Graph(ops.Sort(keys), [self])
+
+    def join(self, joiner: ops.Joiner, join_graph: 'Graph', keys: tp.Sequence[str],
+             strategy: str = 'sort_merge') -> 'Graph':
+        """
+        Construct new graph extended with join operation with another graph
+        :param joiner: join strategy to use
+        :param join_graph: other graph to join with
+        :param keys: keys for grouping
+        :param strategy: join algorithm, one of `operations.Join.STRATEGIES`
+        """
+        return Graph(ops.Join(joiner, keys, strategy), [self, join_graph])
+
+    def window(self, window: ops.Window) -> 'Graph':
+        """
+        Construct new graph extended with event-time window aggregation; input does not have to be finite or sorted
+        :param window: window operation to use, e.g. `operations.TumblingWindow`
+        """
+        return Graph(window, [self])
+
+    def checkpoint(self, store: checkpoints.CheckpointStore) -> 'Graph':
+        """
+        Construct new graph with results of this one saved to store and reused while configuration
+        of this graph and files it reads are unchanged
+        :param store: store to keep results in
+        """
+        return Graph(checkpoints.Checkpoint(store, self))
+
+    def incremental_reduce(self, reducer: ops.AlgebraicReducer, keys: tp.Sequence[str],
+                           store: checkpoints.CheckpointStore) -> 'Graph':
+        """
+        Construct new graph extended with reduce operation which keeps states of groups in store,
+        so when files are added to input only new files are read. Graph must consist of maps over files reading.
+        :param reducer: reducer with mergeable state to use
+        :param keys: keys for grouping
+        :param store: store to keep states in
+        """
+        mappers: list[ops.Mapper] = []
+        graph = self
+        while isinstance(graph._operation, ops.Map):
+            mappers.insert(0, graph._operation.mapper)
+            graph = graph._parents[0]
+        if not isinstance(graph._operation, (ops.Read, ops.ReadFiles)):
+            raise ValueError('Incremental reduce is possible only over maps of rows read from files')
+        return Graph(checkpoints.IncrementalReduce(reducer, keys, store, graph._operation, mappers))
+
+    def run(self, workers: int | None = None, profiler: profiling.Profiler | None = None,
+            **kwargs: tp.Any) -> ops.TRowsIterable:
+        """
+        Plan and lazily run graph; kwargs are passed to sources
+        :param workers: number of worker processes, by default everything runs in current process
+        :param profiler: profiler to collect metrics of every operation of plan to
+        """
+        return Graph.run_many({'': self}, workers, profiler, **kwargs)['']
+
+    @staticmethod
+    def run_many(graphs: tp.Mapping[str, 'Graph'], workers: int | None = None,
+                 profiler: profiling.Profiler | None = None, **kwargs: tp.Any) -> dict[str, ops.TRowsIterable]:
+        """
+        Plan and lazily run several graphs at once; subgraphs they have in common are computed only once.
+        Output of common subgraph is buffered until every graph reads it, so consuming outputs one after another
+        keeps the whole common part in memory; iterate them side by side (e.g. with zip) to avoid that.
+        :param graphs: graphs to run by names of outputs
+        :param workers: number of worker processes, by default everything runs in current process;
+            they are started when some output needs them and stopped when all outputs are exhausted, closed
+            or garbage collected
+        :param profiler: profiler to collect metrics of every operation of plan to; with workers only
+            the work done in current process is measured
+        """
+        plan = _Planner(graphs.values()).optimize()
+        if workers is not None and 'fork' in multiprocessing.get_all_start_methods():
+            return dict(zip(graphs, _ParallelRunner(plan, kwargs, profiler, workers).outputs()))
+        return dict(zip(graphs, _Runner(plan, kwargs, profiler).outputs()))
+
+
+@dataclasses.dataclass(eq=False)
+class _Node:
+    """Node of physical plan"""
+    operation: ops.Operation
+    parents: list['_Node']
+
+
+class _MapperChain(ops.Mapper):
+    """Several mappers fused into one pass"""
+
+    def __init__(self, mappers: tp.Sequence[ops.Mapper]) -> None:
+        self.mappers = mappers
+
+    def __call__(self, row: ops.TRow) -> ops.TRowsGenerator:
+        # every mapper lazily consumes output of previous one, so rows are streamed without intermediate lists
+        rows: ops.TRowsIterable = (row,)
+        for mapper in self.mappers:
+            rows = itertools.chain.from_iterable(map(mapper, rows))
+        yield from rows
+
+    def map_batch(self, batch: ops.TBatch) -> ops.TBatchesGenerator:
+        batches: ops.TBatchesIterable = (batch,)
+        for mapper in self.mappers:
+            batches = itertools.chain.from_iterable(map(mapper.map_batch, batches))
+        yield from batches
+
+
+class _Prune(ops.Mapper):
+    """Drop all columns except mentioned ones; unlike `Project` missing columns are ignored"""
+
+    def __init__(self, columns: tp.Collection[str]) -> None:
+        self.columns = columns
+
+    def __call__(self, row: ops.TRow) -> ops.TRowsGenerator:
+        if type(row) is ops.Row:
+            yield row.project([key for key in row if key in self.columns])
+        else:
+            yield {key: value for key, value in row.items() if key in self.columns}
+
+
+def _signature(obj: tp.Any) -> tp.Hashable:
+    """Structural identity of operation: equal signatures mean equal results"""
+    if obj is None or isinstance(obj, (str, int, float, bool)):
+        return type(obj), obj
+    if isinstance(obj, (list, tuple)):
+        return type(obj), tuple(map(_signature, obj))
+    if isinstance(obj, (ops.Operation, ops.Mapper, ops.Reducer, ops.Joiner)):
+        return type(obj), tuple((name, _signature(value)) for name, value in sorted(vars(obj).items()))
+    return 'id', id(obj)
+
+
+def _count_consumers(outputs: tp.Iterable[_Node]) -> dict[_Node, int]:
+    """Number of nodes (and outputs) using result of every node"""
+    consumers: dict[_Node, int] = {}
+    stack = list(outputs)
+    while stack:
+        node = stack.pop()
+        consumers[node] = consumers.get(node, 0) + 1
+        if consumers[node] == 1:
+            stack.extend(node.parents)
+    return consumers
+
+
+def _written_columns(obj: tp.Any) -> set[str] | None:
+    """Columns which mapper or reducer may change; None if unknown"""
+    if isinstance(obj, (ops.DummyMapper, ops.AsRow, ops.Filter, ops.FirstReducer, ops.TopN)):
+        return set()
+    if isinstance(obj, (ops.LowerCase, ops.FilterPunctuation, ops.Split, ops.Count, ops.Sum)):
+        return {obj.column}
+    if isinstance(obj, ops.Product):
+        return {obj.result_column}
+    if isinstance(obj, ops.TermFrequency):
+        return {obj.words_column, obj.result_column}
+    if isinstance(obj, _MapperChain):
+        written: set[str] = set()
+        for mapper in obj.mappers:
+            columns = _written_columns(mapper)
+            if columns is None:
+                return None
+            written |= columns
+        return written
+    return None
+
+
+class _Planner:
+    """
+    Turns graphs into physical plan:
+        - equal subgraphs are merged, so they are computed once
+        - sorts of data already sorted by the same keys are dropped
+        - filters depending only on join keys and projections are pushed below joins
+        - adjacent maps are fused into one pass
+    """
+
+    def __init__(self, graphs: tp.Iterable[Graph]) -> None:
+        nodes: dict[int, _Node] = {}
+        self.outputs = [self._build(graph, nodes) for graph in graphs]
+        self.consumers: dict[_Node, int] = {}
+        self._signatures: dict[tp.Hashable, _Node] = {}
+
+    def _build(self, graph: Graph, nodes: dict[int, _Node]) -> _Node:
+        if id(graph) not in nodes:
+            parents = [self._build(parent, nodes) for parent in graph._parents]
+            nodes[id(graph)] = _Node(graph._operation, parents)
+        return nodes[id(graph)]
+
+    def optimize(self) -> list[_Node]:
+        for rule in (self._merge_equal, self._drop_sort, self._push_below_join, self._fuse_maps):
+            self._rewrite(rule)
+        return self.outputs
+
+    def _rewrite(self, rule: tp.Callable[[_Node], _Node]) -> None:
+        """Apply rule to every node bottom-up keeping shared nodes shared"""
+        self.consumers = _count_consumers(self.outputs)
+        done: dict[_Node, _Node] = {}
+
+        def visit(node: _Node) -> _Node:
+            if node not in done:
+                node.parents = [visit(parent) for parent in node.parents]
+                result = done[node] = rule(node)
+                self.consumers.setdefault(result, self.consumers[node])
+            return done[node]
+
+        self.outputs = [visit(node) for node in self.outputs]
+
+    def _merge_equal(self, node: _Node) -> _Node:
+        signature = (_signature(node.operation), tuple(node.parents))
+        return self._signatures.setdefault(signature, node)
+
+    def _sorted_by(self, node: _Node) -> tuple[str, ...]:
+        """Columns the output of node is known to be sorted by"""
+        operation = node.operation
+        if isinstance(operation, ops.Sort):
+            return tuple(operation.keys)
+        if isinstance(operation, ops.Join):
+            return tuple(operation.keys) if operation.strategy == 'sort_merge' else ()
+        if isinstance(operation, (ops.Map, ops.Reduce)):
+            parent = self._sorted_by(node.parents[0])
+            if isinstance(operation, ops.Reduce):
+                if parent[:len(operation.keys)] != tuple(operation.keys):
+                    return ()
+                parent = tuple(operation.keys)
+            step = operation.mapper if isinstance(operation, ops.Map) else operation.reducer
+            if isinstance(step, ops.Project):
+                written = {key for key in parent if key not in step.columns}
+            else:
+                columns = _written_columns(step)
+                written = set(parent) if columns is None else columns
+            return tuple(itertools.takewhile(lambda key: key not in written, parent))
+        return ()
+
+    def _drop_sort(self, node: _Node) -> _Node:
+        if isinstance(node.operation, ops.Sort):
+            keys = tuple(node.operation.keys)
+            if self._sorted_by(node.parents[0])[:len(keys)] == keys:
+                return node.parents[0]
+        return node
+
+    def _push_below_join(self, node: _Node) -> _Node:
+        if not isinstance(node.operation, ops.Map) or not node.parents:
+            return node
+        join = node.parents[0]
+        if not isinstance(join.operation, ops.Join) or self.consumers[join] > 1:
+            return node
+        keys = set(join.operation.keys)
+        mapper = node.operation.mapper
+
+        if isinstance(mapper, ops.Filter) and mapper.columns is not None and set(mapper.columns) <= keys:
+            # rows failing condition on keys could not match anything, so both sides may be filtered
+            join.parents = [_Node(ops.Map(mapper), [parent]) for parent in join.parents]
+            return join
+
+        if isinstance(mapper, ops.Project) and keys <= set(mapper.columns):
+            if any(isinstance(parent.operation, ops.Map) and isinstance(parent.operation.mapper, _Prune)
+                   for parent in join.parents):
+                return node
+            columns = set(mapper.columns)
+            for suffix in (join.operation.joiner._a_suffix, join.operation.joiner._b_suffix):
+                columns |= {column[:-len(suffix)] for column in mapper.columns if suffix and column.endswith(suffix)}
+            join.parents = [_Node(ops.Map(_Prune(columns)), [parent]) for parent in join.parents]
+        return node
+
+    def _fuse_maps(self, node: _Node) -> _Node:
+        if not isinstance(node.operation, ops.Map) or not node.parents:
+            return node
+        parent = node.parents[0]
+        if not isinstance(parent.operation, ops.Map) or self.consumers[parent] > 1:
+            return node
+        mappers: list[ops.Mapper] = []
+        for mapper in (parent.operation.mapper, node.operation.mapper):
+            mappers.extend(mapper.mappers if isinstance(mapper, _MapperChain) else [mapper])
+        return _Node(ops.Map(_MapperChain(mappers)), parent.parents)
+
+
+_copy_row = operator.methodcaller('copy')
+
+
+class _Runner:
+    """
+    Lazily evaluates plan; outputs of nodes with several consumers are shared with `itertools.tee`.
+    Every consumer gets its own (shallow) copy of each row, since mappers like LowerCase change rows in place.
+    The tee keeps rows read by one consumer until all others read them, so when one output is consumed before
+    another, the whole shared output is buffered in memory.
+    """
+
+    def __init__(self, plan: tp.Sequence[_Node], kwargs: dict[str, tp.Any],
+                 profiler: profiling.Profiler | None = None) -> None:
+        self.plan = plan
+        self.kwargs = kwargs
+        self.consumers = _count_consumers(plan)
+        self.shared: dict[_Node, list[tp.Iterator[ops.TRow]]] = {}
+        self.profiler = profiler
+        self.stats: dict[_Node, profiling.StageStats] = {}
+        if profiler is not None:
+            for node in plan:
+                self._register(profiler, node, ())
+
+    def _register(self, profiler: profiling.Profiler, node: _Node, path: tuple[str, ...]) -> None:
+        """Add stages of node and its parents to profiler, parents go first"""
+        if node not in self.stats:
+            name = profiling.describe(node.operation)
+            for parent in node.parents:
+                self._register(profiler, parent, path + (name,))
+            self.stats[node] = profiler.stage(name, path)
+
+    def outputs(self) -> list[tp.Iterator[ops.TRow]]:
+        return [self.output(node) for node in self.plan]
+
+    def output(self, node: _Node) -> tp.Iterator[ops.TRow]:
+        if self.consumers[node] == 1:
+            return self._profiled(node)
+        if node not in self.shared:
+            self.shared[node] = list(itertools.tee(self._profiled(node), self.consumers[node]))
+        return map(_copy_row, self.shared[node].pop())
+
+    def _profiled(self, node: _Node) -> tp.Iterator[ops.TRow]:
+        if self.profiler is None:
+            return self._evaluate(node)
+        return self.profiler.outputs(self.stats[node], self._evaluate(node))
+
+    def _input(self, node: _Node, parent: _Node, grouped: bool = True) -> tp.Iterator[ops.TRow]:
+        """
+        Output of parent read by node
+        :param grouped: whether rows come sorted by keys of node if it is a reduce
+        """
+        if self.profiler is None:
+            return self.output(parent)
+        keys = node.operation.keys if grouped and isinstance(node.operation, ops.Reduce) else None
+        return self.profiler.inputs(self.stats[node], self.output(parent), keys)
+
+    def _evaluate(self, node: _Node) -> tp.Iterator[ops.TRow]:
+        if not node.parents:
+            return iter(node.operation(**self.kwargs))
+        return iter(node.operation(*(self._input(node, parent) for parent in node.parents)))
+
+
+_worker_nodes: list[_Node] = []
+
+
+def _init_worker(nodes: list[_Node]) -> None:
+    global _worker_nodes
+    _worker_nodes = nodes
+
+
+def _map_chunk(index: int, rows: list[ops.TRow]) -> list[ops.TRow]:
+    operation = _worker_nodes[index].operation
+    assert isinstance(operation, ops.Map)
+    return [result for row in rows for result in operation.mapper(row)]
+
+
+def _run_partition(index: int, paths: list[str], sort_keys: list[tp.Sequence[str] | None], directory: str) -> str:
+    """
+    Reduce or join one partition of node inputs
+    :return: name of file with (key, row) pairs, keys are set when output is ordered by them
+    """
+    operation = _worker_nodes[index].operation
+    inputs = []
+    for path, keys in zip(paths, sort_keys):
+        rows = ops.unspill(open(path, 'rb'))
+        inputs.append(rows if keys is None else ops.Sort(keys)(rows))
+
+    results: tp.Iterable[tuple[tp.Any, ops.TRow]]
+    if isinstance(operation, ops.Reduce):
+        group_key = tuple(operation.keys)
+        groups = itertools.groupby(inputs[0], key=ops.key_function(group_key))
+        results = ((key, row) for key, group in groups for row in operation.reducer(group_key, group))
+    elif isinstance(operation, ops.Join) and operation.strategy == 'sort_merge':
+        key_func = ops.key_function(operation.keys)
+        results = ((key_func(row), row) for row in operation(*inputs))
+    else:
+        results = ((None, row) for row in operation(*inputs))
+
+    with tempfile.NamedTemporaryFile(dir=directory, delete=False) as file:
+        for result in results:
+            pickle.dump(result, file, pickle.HIGHEST_PROTOCOL)
+    return file.name
+
+
+def _release(pool: multiprocessing.pool.Pool, directory: str) -> None:
+    pool.terminate()
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+class _ParallelRunner(_Runner):
+    """
+    Runs plan in a pool of forked worker processes:
+        - maps are applied to chunks of rows in parallel
+        - inputs of reduces and joins are hash partitioned by keys to temporary files,
+          and every partition is reduced (joined) by a worker independently
+    Partition results of sorted reduces and sort-merge joins are merged by keys, so the output order
+    is the same as in a single process. Plan is inherited by workers with fork, so mappers and
+    reducers need not be picklable; rows do.
+    Pool and temporary directory are created on first use and released by `close`, which is called when all
+    outputs are exhausted or closed, or when the runner is garbage collected (outputs keep it alive).
+    """
+
+    def __init__(self, plan: tp.Sequence[_Node], kwargs: dict[str, tp.Any], profiler: profiling.Profiler | None,
+                 workers: int, chunk_size: int = 8192) -> None:
+        super().__init__(plan, kwargs, profiler)
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.index = {node: i for i, node in enumerate(self.consumers)}
+        self.active = len(plan)
+        self._pool: multiprocessing.pool.Pool | None = None
+        self._directory = ''
+        self._finalizer: weakref.finalize | None = None
+
+    def _start(self) -> multiprocessing.pool.Pool:
+        """Create pool and temporary directory on first use"""
+        if self._pool is None:
+            self._directory = tempfile.mkdtemp()
+            self._pool = multiprocessing.get_context('fork').Pool(self.workers, _init_worker, (list(self.index),))
+            # finalizer must not refer to runner, otherwise runner would never be collected
+            self._finalizer = weakref.finalize(self, _release, self._pool, self._directory)
+        return self._pool
+
+    @property
+    def pool(self) -> multiprocessing.pool.Pool:
+        return self._start()
+
+    @property
+    def directory(self) -> str:
+        self._start()
+        return self._directory
+
+    def close(self) -> None:
+        """Stop worker processes and remove temporary files"""
+        if self._finalizer is not None:
+            self._finalizer()
+
+    def outputs(self) -> list[tp.Iterator[ops.TRow]]:
+        """Pool is shut down when all outputs are exhausted"""
+        return [self._closing(rows) for rows in super().outputs()]
+
+    def _closing(self, rows: tp.Iterator[ops.TRow]) -> ops.TRowsGenerator:
+        try:
+            yield from rows
+        finally:
+            self.active -= 1
+            if not self.active:
+                self.close()
+
+    def _evaluate(self, node: _Node) -> tp.Iterator[ops.TRow]:
+        if isinstance(node.operation, ops.Map) and node.parents:
+            return self._map(node)
+        if isinstance(node.operation, (ops.Reduce, ops.HashReduce, ops.Join)):
+            return self._partitioned(node, node.operation)
+        return super()._evaluate(node)
+
+    def _map(self, node: _Node) -> ops.TRowsGenerator:
+        rows = self._input(node, node.parents[0])
+        pending: collections.deque[tp.Any] = collections.deque()
+        while True:
+            chunk = list(itertools.islice(rows, self.chunk_size))
+            if chunk:
+                pending.append(self.pool.apply_async(_map_chunk, (self.index[node], chunk)))
+            if not pending:
+                return
+            if not chunk or len(pending) > 2 * self.workers:
+                yield from pending.popleft().get()
+
+    def _partitioned(self, node: _Node, operation: ops.Reduce | ops.HashReduce | ops.Join) -> ops.TRowsGenerator:
+        ordered = isinstance(operation, ops.Reduce) or (isinstance(operation, ops.Join) and
+                                                        operation.strategy == 'sort_merge')
+        partitions, sort_keys = [], []
+        for parent in node.parents:
+            keys = None
+            if ordered and isinstance(parent.operation, ops.Sort) and self.consumers[parent] == 1:
+                # sorting every partition separately is enough
+                keys = parent.operation.keys
+                parent = parent.parents[0]
+            partitions.append(self._partition(self._input(node, parent, grouped=keys is None), operation.keys))
+            sort_keys.append(keys)
+
+        tasks = [self.pool.apply_async(_run_partition, (self.index[node], list(paths), sort_keys, self.directory))
+                 for paths in zip(*partitions)]
+        results = [ops.unspill(open(task.get(), 'rb')) for task in tasks]
+        merged = heapq.merge(*results, key=operator.itemgetter(0)) if ordered else itertools.chain(*results)
+        for _, row in merged:
+            yield row
+
+    def _partition(self, rows: ops.TRowsIterable, keys: tp.Sequence[str]) -> list[str]:
+        key_func = ops.key_function(keys)
+        files = [tempfile.NamedTemporaryFile(dir=self.directory, delete=False) for _ in range(self.workers)]
+        for row in rows:
+            pickle.dump(row, files[hash(key_func(row)) % self.workers], pickle.HIGHEST_PROTOCOL)
+        for file in files:
+            file.close()
+        return [file.name for file in files]
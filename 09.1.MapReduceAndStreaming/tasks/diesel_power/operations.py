@@ -1,14 +1,417 @@
+import array
+import bz2
+import collections
+import collections.abc
+import concurrent.futures
+import dataclasses
+import functools
+import glob
+import gzip
+import hashlib
 import heapq
 import itertools
+import lzma
+import math
+import mmap
+import multiprocessing
+import operator
+import os
+import pickle
+import shutil
 import re
+import string
+import struct
+import tempfile
 import typing as tp
 from abc import abstractmethod, ABC
 from collections import defaultdict
 
-TRow = dict[str, tp.Any]
+# rows are dicts or schema-bound `Row`s, which support the same operations
+TRow = tp.Union[dict[str, tp.Any], 'Row']
 TRowsIterable = tp.Iterable[TRow]
 TRowsGenerator = tp.Generator[TRow, None, None]
 
+TSchema = tp.Sequence[tuple[str, type]]
+
+TBatch = dict[str, list[tp.Any]]
+TBatchesIterable = tp.Iterable[TBatch]
+TBatchesGenerator = tp.Generator[TBatch, None, None]
+
+# marker of absent value, unlike None it never equals a row, key or reducer state
+MISSING: tp.Any = object()
+_sequence = itertools.count()
+
+
+def key_function(keys: tp.Sequence[str], sample: TRow | None = None) -> tp.Callable[[TRow], tuple[tp.Any, ...]]:
+    """
+    Build function extracting tuple of key column values from row
+    :param sample: row of table, if it is a schema-bound `Row` keys are extracted without lookups by names
+    """
+    if isinstance(sample, Row):
+        return _row_key_function(keys)
+    if len(keys) == 0:
+        return lambda row: ()
+    if len(keys) == 1:
+        key = keys[0]
+        return lambda row: (row[key],)
+    return operator.itemgetter(*keys)
+
+
+def spill(rows: tp.Iterable[tp.Any]) -> tp.IO[bytes]:
+    """Dump rows (or any other picklable records) into anonymous temporary file and rewind it to the beginning"""
+    file = tempfile.TemporaryFile()
+    for row in rows:
+        pickle.dump(row, file, pickle.HIGHEST_PROTOCOL)
+    file.seek(0)
+    return file
+
+
+def unspill(file: tp.IO[bytes]) -> tp.Generator[tp.Any, None, None]:
+    """Read rows dumped by `spill` and close the file afterwards"""
+    with file:
+        while True:
+            try:
+                row = pickle.load(file)
+            except EOFError:
+                return
+            yield row
+
+
+class _GroupBuffer:
+    """
+    Rows of group which can be iterated many times (e.g. once per row of the other group of join).
+    Rows are kept in memory unless there are more than `limit` of them, otherwise they all are spilled
+    to a temporary file in chunks, so a group of any size takes memory of one chunk.
+    """
+
+    def __init__(self, rows: TRowsIterable, limit: int, chunk_size: int = 4096) -> None:
+        rows = iter(rows)
+        self._rows = list(itertools.islice(rows, limit + 1))
+        self._file: tp.IO[bytes] | None = None
+        if len(self._rows) > limit:
+            self._file = tempfile.TemporaryFile()
+            for start in range(0, len(self._rows), chunk_size):
+                pickle.dump(self._rows[start:start + chunk_size], self._file, pickle.HIGHEST_PROTOCOL)
+            self._rows = []
+            while chunk := list(itertools.islice(rows, chunk_size)):
+                pickle.dump(chunk, self._file, pickle.HIGHEST_PROTOCOL)
+
+    @property
+    def spilled(self) -> bool:
+        return self._file is not None
+
+    def __bool__(self) -> bool:
+        return bool(self._rows) or self._file is not None
+
+    def __iter__(self) -> TRowsGenerator:
+        if self._file is None:
+            yield from self._rows
+            return
+        file, position, end = self._file, 0, self._file.seek(0, os.SEEK_END)
+        while position < end:
+            # every iteration keeps its own position, so they may interleave
+            file.seek(position)
+            chunk = pickle.load(file)
+            position = file.tell()
+            yield from chunk
+
+    def __enter__(self) -> '_GroupBuffer':
+        return self
+
+    def __exit__(self, *args: tp.Any) -> None:
+        if self._file is not None:
+            self._file.close()
+
+
+def _split_whitespace(text: str) -> list[str]:
+    """Same as `re.split(r'\\s+', text)`: unlike `str.split` keeps empty fragments at the ends"""
+    fragments = text.split()
+    if not fragments:
+        return [''] if not text else ['', '']
+    if text[0].isspace():
+        fragments.insert(0, '')
+    if text[-1].isspace():
+        fragments.append('')
+    return fragments
+
+
+def _split_lazily(pattern: re.Pattern[str], text: str) -> tp.Iterator[str]:
+    """Same as `pattern.split(text)` without capturing groups, but fragments are produced one by one"""
+    start = 0
+    for match in pattern.finditer(text):
+        yield text[start:match.start()]
+        start = match.end()
+    yield text[start:]
+
+
+@functools.lru_cache(maxsize=None)
+def _splitter(separator: str | None, lazy_length: int = 65536) -> tp.Callable[[str], tp.Iterable[str]]:
+    """
+    Build function splitting text by separator regex like `re.split`;
+    whitespace and plain string separators are split by faster `str.split`.
+    Texts longer than `lazy_length` are split lazily, so fragments do not take memory all at once.
+    """
+    pattern = re.compile(r'\s+' if separator is None else separator)
+    split: tp.Callable[[str], list[str]]
+    if separator is None or separator == r'\s+':
+        split = _split_whitespace
+    elif separator and not set(separator) & set('.^$*+?{}[]\\|()'):
+        split = operator.methodcaller('split', separator)
+    else:
+        split = pattern.split
+
+    def splitter(text: str) -> tp.Iterable[str]:
+        return split(text) if len(text) <= lazy_length else _split_lazily(pattern, text)
+
+    return splitter
+
+
+def _stable_hash(value: tp.Any) -> int:
+    """64-bit hash of value which, unlike `hash`, is the same in every process and run"""
+    return int.from_bytes(hashlib.blake2b(repr(value).encode(), digest_size=8).digest(), 'little')
+
+
+def _batch_length(batch: TBatch) -> int:
+    return len(next(iter(batch.values()), ()))
+
+
+def _batch_to_rows(batch: TBatch) -> tp.Iterator[TRow]:
+    """Turn columns of batch back into separate rows"""
+    columns = tuple(batch)
+    return (dict(zip(columns, values)) for values in zip(*batch.values()))
+
+
+def _rows_to_batches(rows: TRowsIterable, batch_size: int = 65536) -> TBatchesGenerator:
+    """Pack rows into batches; a new batch is started whenever the set of columns changes"""
+    batch: TBatch = {}
+    length = 0
+    for row in rows:
+        if length == batch_size or batch.keys() != row.keys():
+            if length:
+                yield batch
+            batch = {key: [] for key in row}
+            length = 0
+        for key, value in row.items():
+            batch[key].append(value)
+        length += 1
+    if length:
+        yield batch
+
+
+def _slice_batch(batch: TBatch, start: int, stop: int | None = None) -> TBatch:
+    return {key: column[start:stop] for key, column in batch.items()}
+
+
+def _batch_keys(batch: TBatch, keys: tp.Sequence[str]) -> list[tuple[tp.Any, ...]]:
+    """Values of key columns in every row of batch; without keys all rows have the same empty key"""
+    if not keys:
+        return [()] * _batch_length(batch)
+    return list(zip(*(batch[key] for key in keys)))
+
+
+def _group_bounds(keys: tp.Sequence[tp.Any]) -> list[int]:
+    """Indices where runs of equal consecutive keys start, followed by total length"""
+    if not keys:
+        return [0]
+    changes = map(operator.ne, itertools.islice(keys, 1, None), keys)
+    return [0, *itertools.compress(range(1, len(keys)), changes), len(keys)]
+
+
+_TGetter = tp.Callable[[list[tp.Any]], tuple[tp.Any, ...]]
+
+
+def _tuple_getter(indices: tp.Sequence[int]) -> _TGetter:
+    """Build function taking items with given indices from list as a tuple"""
+    if len(indices) > 1:
+        return operator.itemgetter(*indices)
+    if indices:
+        index = indices[0]
+        return lambda values: (values[index],)
+    return lambda values: ()
+
+
+class RowSchema:
+    """
+    Column names of schema-bound rows with their indices. Schemas are interned, so equal schemas are
+    the same object, and everything derived from schema (projections, join plans) is computed once.
+    """
+
+    __slots__ = ('names', 'index', '_derived')
+    _interned: dict[tuple[str, ...], 'RowSchema'] = {}
+
+    def __init__(self, names: tuple[str, ...]) -> None:
+        self.names = names
+        self.index = {name: i for i, name in enumerate(names)}
+        self._derived: dict[tp.Any, tp.Any] = {}
+
+    @classmethod
+    def of(cls, names: tp.Iterable[str]) -> 'RowSchema':
+        names = tuple(names)
+        schema = cls._interned.get(names)
+        if schema is None:
+            schema = cls._interned[names] = cls(names)
+        return schema
+
+    def __reduce__(self) -> tuple[tp.Any, ...]:
+        return RowSchema.of, (self.names,)
+
+    def __repr__(self) -> str:
+        return f'RowSchema({self.names!r})'
+
+    def with_column(self, name: str) -> 'RowSchema':
+        key = ('with', name)
+        if key not in self._derived:
+            self._derived[key] = RowSchema.of(self.names + (name,))
+        return self._derived[key]
+
+    def without_column(self, name: str) -> 'RowSchema':
+        key = ('without', name)
+        if key not in self._derived:
+            self._derived[key] = RowSchema.of(column for column in self.names if column != name)
+        return self._derived[key]
+
+    def getter(self, columns: tp.Sequence[str]) -> _TGetter:
+        """Function taking values of columns from values of row as a tuple"""
+        key = ('getter', tuple(columns))
+        if key not in self._derived:
+            self._derived[key] = _tuple_getter([self.index[column] for column in columns])
+        return self._derived[key]
+
+    def projection(self, columns: tp.Sequence[str]) -> tuple['RowSchema', _TGetter]:
+        """Schema and values getter of rows with only given columns"""
+        key = ('projection', tuple(columns))
+        if key not in self._derived:
+            self._derived[key] = RowSchema.of(columns), self.getter(columns)
+        return self._derived[key]
+
+    def join_plan(self, other: 'RowSchema', keys: tp.Collection[str] | None = None, suffix_a: str = '',
+                  suffix_b: str = '') -> tuple['RowSchema', _TGetter]:
+        """
+        Schema and getter of joined rows from concatenated values of rows of this and other schema.
+        Columns present in both rows which are not keys get suffixes; if keys is None, values of other row
+        are taken instead, like in `a_row | b_row`.
+        """
+        key = ('join', other, None if keys is None else frozenset(keys), suffix_a, suffix_b)
+        if key not in self._derived:
+            names, sources = [], []
+            offset = len(self.names)
+            for name in self.names + tuple(name for name in other.names if name not in self.index):
+                in_a, in_b = name in self.index, name in other.index
+                if in_a and in_b and keys is not None and name not in keys:
+                    names += [name + suffix_a, name + suffix_b]
+                    sources += [self.index[name], offset + other.index[name]]
+                else:
+                    names.append(name)
+                    sources.append(offset + other.index[name] if in_b else self.index[name])
+            self._derived[key] = RowSchema.of(names), _tuple_getter(sources)
+        return self._derived[key]
+
+
+class Row(collections.abc.MutableMapping):  # type: ignore
+    """
+    Schema-bound row: values are kept in a list, and column names with their indices are shared by all rows
+    of the same schema. It takes much less memory than dict and may be used wherever dict row is used.
+    Adding or deleting a column switches row to another (cached) schema.
+    """
+
+    __slots__ = ('_schema', '_values')
+
+    def __init__(self, schema: RowSchema, values: list[tp.Any]) -> None:
+        """
+        :param schema: schema of row, see `RowSchema.of`
+        :param values: values of columns in order of schema
+        """
+        self._schema = schema
+        self._values = values
+
+    @classmethod
+    def from_dict(cls, row: tp.Mapping[str, tp.Any]) -> 'Row':
+        return cls(RowSchema.of(row.keys()), list(row.values()))
+
+    def __reduce__(self) -> tuple[tp.Any, ...]:
+        return Row, (self._schema, self._values)
+
+    def __getitem__(self, key: str) -> tp.Any:
+        return self._values[self._schema.index[key]]
+
+    def get(self, key: str, default: tp.Any = None) -> tp.Any:
+        index = self._schema.index.get(key)
+        return default if index is None else self._values[index]
+
+    def __setitem__(self, key: str, value: tp.Any) -> None:
+        index = self._schema.index.get(key)
+        if index is None:
+            self._schema = self._schema.with_column(key)
+            self._values.append(value)
+        else:
+            self._values[index] = value
+
+    def __delitem__(self, key: str) -> None:
+        index = self._schema.index[key]
+        self._schema = self._schema.without_column(key)
+        del self._values[index]
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._schema.index
+
+    def __iter__(self) -> tp.Iterator[str]:
+        return iter(self._schema.names)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __repr__(self) -> str:
+        return f'Row({dict(self)!r})'
+
+    def copy(self) -> 'Row':
+        return Row(self._schema, self._values.copy())
+
+    def project(self, columns: tp.Sequence[str]) -> 'Row':
+        """Row of only these columns in this order"""
+        schema, getter = self._schema.projection(columns)
+        return Row(schema, list(getter(self._values)))
+
+    def __or__(self, other: tp.Mapping[str, tp.Any]) -> 'Row':
+        if type(other) is Row:
+            schema, getter = self._schema.join_plan(other._schema)
+            return Row(schema, list(getter(self._values + other._values)))
+        if not isinstance(other, collections.abc.Mapping):
+            return NotImplemented
+        result = self.copy()
+        result.update(other)
+        return result
+
+    def __ror__(self, other: tp.Mapping[str, tp.Any]) -> TRow:
+        if not isinstance(other, collections.abc.Mapping):
+            return NotImplemented
+        return dict(other) | dict(zip(self._schema.names, self._values))
+
+
+def _row_key_function(keys: tp.Sequence[str]) -> tp.Callable[[TRow], tuple[tp.Any, ...]]:
+    """Build key function for schema-bound rows, plain dicts are accepted too"""
+    keys = tuple(keys)
+    dict_key = key_function(keys)
+    schema: RowSchema | None = None
+    getter: _TGetter = dict_key  # type: ignore
+
+    def key(row: TRow) -> tuple[tp.Any, ...]:
+        nonlocal schema, getter
+        if type(row) is not Row:
+            return dict_key(row)
+        if row._schema is not schema:
+            schema = row._schema
+            getter = schema.getter(keys)
+        return getter(row._values)
+
+    return key
+
+
+def _peek(rows: tp.Iterable[tp.Any]) -> tuple[tp.Any, tp.Iterator[tp.Any]]:
+    """:return: first item (None if there are no items) and iterator over all items"""
+    rows = iter(rows)
+    first = next(rows, None)
+    return first, rows if first is None else itertools.chain([first], rows)
+
 
 class Operation(ABC):
     @abstractmethod
@@ -36,6 +439,271 @@ class ReadIterFactory(Operation):
             yield row
 
 
+# GzipFile is a binary file too, but unlike BZ2File and LZMAFile it is not declared as IO[bytes] by typeshed
+_OPENERS: dict[str, tp.Callable[..., tp.IO[bytes]]] = {
+    '.gz': tp.cast(tp.Callable[..., tp.IO[bytes]], gzip.open), '.bz2': bz2.open, '.xz': lzma.open}
+_TShard = tuple[str, int, int | None]
+
+
+def _open_binary(filename: str) -> tp.IO[bytes]:
+    """Open file for reading, compressed files are decompressed on the fly by their extension"""
+    extension = os.path.splitext(filename)[1]
+    if extension in ('.zst', '.zstd'):
+        try:
+            import zstandard  # type: ignore[import]
+        except ImportError as error:
+            raise ImportError(f'zstandard package is required to read {filename}') from error
+        return tp.cast(tp.IO[bytes], zstandard.open(filename, 'rb'))
+    return _OPENERS.get(extension, open)(filename, 'rb')
+
+
+def _read_lines(filename: str, start: int, end: int | None) -> tp.Iterator[bytes]:
+    """Read lines starting in byte range [start, end) of file; end=None means until the end of file"""
+    with _open_binary(filename) as file:
+        if start:
+            # line crossing the start belongs to the previous range
+            file.seek(start - 1)
+            file.readline()
+        if end is None:
+            yield from file
+            return
+        position = file.tell()
+        for line in file:
+            if position >= end:
+                return
+            position += len(line)
+            yield line
+
+
+_reader_parser: tuple[tp.Callable[[str], TRow], str] | None = None
+
+
+def _init_reader(parser: tp.Callable[[str], TRow], encoding: str) -> None:
+    global _reader_parser
+    _reader_parser = parser, encoding
+
+
+def _parse_shard(shard: _TShard, directory: str, chunk_size: int = 4096) -> str:
+    """Parse shard in worker process; :return: name of file with dumped chunks of rows"""
+    parser, encoding = _reader_parser  # type: ignore
+    lines = _read_lines(*shard)
+    with tempfile.NamedTemporaryFile(dir=directory, delete=False) as file:
+        while chunk := [parser(line.decode(encoding)) for line in itertools.islice(lines, chunk_size)]:
+            pickle.dump(chunk, file, pickle.HIGHEST_PROTOCOL)
+    return file.name
+
+
+class ReadFiles(Operation):
+    """
+    Read and parse lines of several files, possibly compressed (gzip, bz2, xz or zstd by extension).
+    Big uncompressed files are split into byte ranges, so their parts are parsed in parallel as well.
+    With workers shards are parsed in a pool of forked processes, so parser need not be picklable; rows do.
+    """
+
+    def __init__(self, patterns: str | tp.Sequence[str], parser: tp.Callable[[str], TRow],
+                 workers: int | None = None, ordered: bool = True, split_size: int = 64 * 2 ** 20,
+                 encoding: str = 'utf-8') -> None:
+        """
+        :param patterns: glob pattern or list of patterns of files to read; files are read in sorted order
+        :param parser: parser from string to row
+        :param workers: number of worker processes, by default shards are read in current process
+        :param ordered: whether rows should come in order of files and lines; otherwise rows of shard
+            which is parsed first come first
+        :param split_size: uncompressed files bigger than this are split into byte ranges of this size
+        :param encoding: encoding of files
+        """
+        assert split_size > 0
+        self.patterns = [patterns] if isinstance(patterns, str) else list(patterns)
+        self.parser = parser
+        self.workers = workers
+        self.ordered = ordered
+        self.split_size = split_size
+        self.encoding = encoding
+
+    def shards(self) -> list[_TShard]:
+        """Files and byte ranges to be read"""
+        shards: list[_TShard] = []
+        for pattern in self.patterns:
+            filenames = sorted(glob.glob(pattern, recursive=True))
+            if not filenames:
+                raise FileNotFoundError(f'No files match {pattern!r}')
+            for filename in filenames:
+                size = os.path.getsize(filename)
+                if os.path.splitext(filename)[1] in (*_OPENERS, '.zst', '.zstd') or size <= self.split_size:
+                    shards.append((filename, 0, None))
+                else:
+                    shards.extend((filename, start, min(start + self.split_size, size))
+                                  for start in range(0, size, self.split_size))
+        return shards
+
+    def __call__(self, *args: tp.Any, **kwargs: tp.Any) -> TRowsGenerator:
+        shards = self.shards()
+        if self.workers is None or 'fork' not in multiprocessing.get_all_start_methods():
+            for shard in shards:
+                for line in _read_lines(*shard):
+                    yield self.parser(line.decode(self.encoding))
+            return
+
+        directory = tempfile.mkdtemp()
+        pool = concurrent.futures.ProcessPoolExecutor(self.workers, multiprocessing.get_context('fork'),
+                                                      _init_reader, (self.parser, self.encoding))
+        pending: collections.deque[concurrent.futures.Future[str]] = collections.deque()
+        try:
+            shards.reverse()
+            while shards or pending:
+                # a few shards are parsed ahead, so spilled rows do not pile up on disk
+                while shards and len(pending) < 2 * self.workers:
+                    pending.append(pool.submit(_parse_shard, shards.pop(), directory))
+                if self.ordered:
+                    done = pending.popleft()
+                else:
+                    done = next(iter(concurrent.futures.wait(pending, return_when='FIRST_COMPLETED').done))
+                    pending.remove(done)
+                path = done.result()
+                for chunk in unspill(open(path, 'rb')):
+                    yield from chunk
+                os.remove(path)
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+class _BinaryCodec:
+    """
+    Binary row format:
+        header: magic, number of columns, then name and type code of every column
+        row: bitmap of None values, fixed size values, lengths of strings and bytes (all packed together),
+             then contents of strings and bytes
+    """
+
+    MAGIC = b'DPRW\x01'
+    CODES: dict[type, str] = {int: 'q', float: 'd', bool: '?', str: 's', bytes: 'b'}
+    TYPES = {code: type_ for type_, code in CODES.items()}
+
+    def __init__(self, schema: TSchema) -> None:
+        for name, type_ in schema:
+            if type_ not in self.CODES:
+                raise TypeError(f'Column {name!r} has unsupported type {type_.__name__}')
+        self.schema = list(schema)
+        self.names = [name for name, _ in schema]
+        self.fixed = [i for i, (_, type_) in enumerate(schema) if type_ not in (str, bytes)]
+        self.variable = [i for i, (_, type_) in enumerate(schema) if type_ in (str, bytes)]
+        self.is_str = [schema[i][1] is str for i in self.variable]
+        # values are stored fixed columns first, `restore` puts them back in schema order
+        stored = self.fixed + self.variable
+        self.restore: tp.Callable[[list[tp.Any]], tuple[tp.Any, ...]] = \
+            operator.itemgetter(*sorted(range(len(stored)), key=stored.__getitem__)) if len(stored) > 1 \
+            else (lambda values: tuple(values))
+        self.no_nulls = bytes((len(schema) + 7) // 8)
+        self.head = struct.Struct(f'<{len(self.no_nulls)}s' + ''.join(self.CODES[schema[i][1]] for i in self.fixed)
+                                  + 'I' * len(self.variable))
+
+    def header(self) -> bytes:
+        parts = [self.MAGIC, struct.pack('<H', len(self.schema))]
+        for name, type_ in self.schema:
+            encoded = name.encode()
+            parts += [struct.pack('<H', len(encoded)), encoded, self.CODES[type_].encode()]
+        return b''.join(parts)
+
+    @classmethod
+    def from_header(cls, buffer: tp.Any) -> tuple['_BinaryCodec', int]:
+        if buffer[:len(cls.MAGIC)] != cls.MAGIC:
+            raise ValueError('Not a binary rows file')
+        offset = len(cls.MAGIC)
+        count, = struct.unpack_from('<H', buffer, offset)
+        offset += 2
+        schema = []
+        for _ in range(count):
+            size, = struct.unpack_from('<H', buffer, offset)
+            offset += 2
+            name = bytes(buffer[offset:offset + size]).decode()
+            offset += size
+            schema.append((name, cls.TYPES[bytes(buffer[offset:offset + 1]).decode()]))
+            offset += 1
+        return cls(schema), offset
+
+    def encode(self, row: TRow) -> bytes:
+        values = [row[name] for name in self.names]
+        nulls = 0
+        for i, (value, (name, type_)) in enumerate(zip(values, self.schema)):
+            if value is None:
+                nulls |= 1 << i
+                values[i] = type_()
+            elif type(value) is not type_ and not (type_ is float and type(value) is int):
+                raise TypeError(f'Column {name!r} expects {type_.__name__}, got {type(value).__name__}')
+        contents = [values[i].encode() if is_str else values[i] for i, is_str in zip(self.variable, self.is_str)]
+        head = self.head.pack(nulls.to_bytes(len(self.no_nulls), 'little'), *(values[i] for i in self.fixed),
+                              *map(len, contents))
+        return b''.join([head, *contents])
+
+    def decode(self, buffer: tp.Any, offset: int) -> tuple[tuple[tp.Any, ...], int]:
+        """:return: values of row in order of schema and offset of the next row"""
+        head = self.head.unpack_from(buffer, offset)
+        offset += self.head.size
+        stored: list[tp.Any] = list(head[1:len(self.fixed) + 1])
+        for size, is_str in zip(head[len(self.fixed) + 1:], self.is_str):
+            value = buffer[offset:offset + size]
+            stored.append(value.decode() if is_str else value)
+            offset += size
+        values = self.restore(stored)
+        if head[0] != self.no_nulls:
+            nulls = int.from_bytes(head[0], 'little')
+            values = tuple(None if nulls >> i & 1 else value for i, value in enumerate(values))
+        return values, offset
+
+
+class ReadBinary(Operation):
+    """Read rows written by `WriteBinary`; file is memory-mapped instead of being read into memory"""
+
+    def __init__(self, filename: str, schema_bound: bool = False) -> None:
+        """
+        :param filename: file to read from
+        :param schema_bound: whether to produce schema-bound `Row`s instead of dicts
+        """
+        self.filename = filename
+        self.schema_bound = schema_bound
+
+    def __call__(self, *args: tp.Any, **kwargs: tp.Any) -> TRowsGenerator:
+        with open(self.filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            codec, offset = _BinaryCodec.from_header(buffer)
+            schema, names = RowSchema.of(codec.names), codec.names
+            size = len(buffer)
+            while offset < size:
+                values, offset = codec.decode(buffer, offset)
+                yield Row(schema, list(values)) if self.schema_bound else dict(zip(names, values))
+
+
+class WriteBinary(Operation):
+    """
+    Write rows to file in compact typed binary format, rows are passed through further
+    Schema is taken from the first row unless given explicitly; every row must have all schema columns,
+    values may be None.
+    """
+
+    def __init__(self, filename: str, schema: TSchema | None = None) -> None:
+        """
+        :param filename: file to write to
+        :param schema: names and types (int, float, bool, str or bytes) of columns
+        """
+        self.filename = filename
+        self.schema = schema
+
+    def __call__(self, rows: TRowsIterable, *args: tp.Any, **kwargs: tp.Any) -> TRowsGenerator:
+        rows = iter(rows)
+        first = next(rows, None)
+        schema = self.schema
+        if schema is None:
+            if first is not None and None in first.values():
+                raise ValueError('Schema can not be inferred from row with None values, pass it explicitly')
+            schema = [(name, type(value)) for name, value in (first or {}).items()]
+        codec = _BinaryCodec(schema)
+        with open(self.filename, 'wb') as f:
+            f.write(codec.header())
+            for row in itertools.chain([first] if first is not None else [], rows):
+                f.write(codec.encode(row))
+                yield row
+
+
 # Operations
 
 
@@ -49,6 +717,13 @@ class Mapper(ABC):
         """
         pass
 
+    def map_batch(self, batch: TBatch) -> TBatchesGenerator:
+        """
+        Column-oriented version of mapper; by default rows are mapped one by one
+        :param batch: chunk of table rows stored by columns
+        """
+        yield from _rows_to_batches(itertools.chain.from_iterable(map(self, _batch_to_rows(batch))))
+
 
 class Map(Operation):
     def __init__(self, mapper: Mapper) -> None:
@@ -59,6 +734,56 @@ class Map(Operation):
             yield from self.mapper(i)
 
 
+_TInput = tp.TypeVar('_TInput')
+_TOutput = tp.TypeVar('_TOutput')
+
+
+class BatchOperation(ABC, tp.Generic[_TInput, _TOutput]):
+    """
+    Base class for column-oriented operations; unlike `Operation` they take and/or return batches instead of rows,
+    so they are chained with each other directly rather than put into a graph
+    """
+
+    @abstractmethod
+    def __call__(self, items: tp.Iterable[_TInput], /, *args: tp.Any,
+                 **kwargs: tp.Any) -> tp.Generator[_TOutput, None, None]:
+        pass
+
+
+class Batch(BatchOperation[TRow, TBatch]):
+    """Pack rows into column-oriented batches"""
+
+    def __init__(self, batch_size: int = 65536) -> None:
+        """
+        :param batch_size: maximum number of rows in one batch
+        """
+        self.batch_size = batch_size
+
+    def __call__(self, rows: TRowsIterable, *args: tp.Any, **kwargs: tp.Any) -> TBatchesGenerator:
+        yield from _rows_to_batches(rows, self.batch_size)
+
+
+class Unbatch(BatchOperation[TBatch, TRow]):
+    """Unpack column-oriented batches back into rows"""
+
+    def __call__(self, batches: TBatchesIterable, *args: tp.Any, **kwargs: tp.Any) -> TRowsGenerator:
+        for batch in batches:
+            yield from _batch_to_rows(batch)
+
+
+class MapBatch(BatchOperation[TBatch, TBatch]):
+    """Map operation working on column-oriented batches"""
+
+    def __init__(self, mapper: Mapper) -> None:
+        self.mapper = mapper
+
+    def __call__(self, batches: TBatchesIterable, *args: tp.Any, **kwargs: tp.Any) -> TBatchesGenerator:
+        for batch in batches:
+            for result in self.mapper.map_batch(batch):
+                if _batch_length(result):
+                    yield result
+
+
 class Reducer(ABC):
     """Base class for reducers"""
 
@@ -69,6 +794,14 @@ class Reducer(ABC):
         """
         pass
 
+    def reduce_batch(self, group_key: tuple[str, ...], batch: TBatch) -> TBatchesGenerator:
+        """
+        Column-oriented version of reducer; by default every group is reduced row by row
+        :param batch: whole groups of table rows sorted by group_key and stored by columns
+        """
+        rows = itertools.groupby(_batch_to_rows(batch), key=key_function(group_key))
+        yield from _rows_to_batches(itertools.chain.from_iterable(self(group_key, group) for _, group in rows))
+
 
 class Reduce(Operation):
     def __init__(self, reducer: Reducer, keys: tp.Sequence[str]) -> None:
@@ -76,16 +809,415 @@ class Reduce(Operation):
         self.keys = keys
 
     def __call__(self, rows: TRowsIterable, *args: tp.Any, **kwargs: tp.Any) -> TRowsGenerator:
-        for value, group in itertools.groupby(rows, key=lambda x: tuple(x[i] for i in self.keys)):
+        first, rows = _peek(rows)
+        for value, group in itertools.groupby(rows, key=key_function(self.keys, first)):
             yield from self.reducer(tuple(self.keys), group)
 
 
+class AlgebraicReducer(Reducer):
+    """
+    Base class for reducers which result can be computed from partial aggregates.
+    Such reducers may group rows in a hash table and combine partial states computed separately.
+    """
+
+    # number of groups HashReduce keeps in memory by default, reducers with big states lower it
+    max_groups = 100000
+
+    @abstractmethod
+    def initial(self) -> tp.Any:
+        """State of empty group"""
+        pass
+
+    @abstractmethod
+    def update(self, state: tp.Any, row: TRow) -> tp.Any:
+        """
+        :param state: current state of group
+        :param row: next table row of group
+        :return: new state of group
+        """
+        pass
+
+    @abstractmethod
+    def merge(self, state: tp.Any, other: tp.Any) -> tp.Any:
+        """
+        :param state: partial state of group
+        :param other: another partial state of the same group
+        :return: state of both parts
+        """
+        pass
+
+    @abstractmethod
+    def finalize(self, group_key: tuple[str, ...], key: tuple[tp.Any, ...], state: tp.Any) -> TRowsGenerator:
+        """
+        :param group_key: names of key columns
+        :param key: values of key columns
+        :param state: final state of group
+        """
+        pass
+
+    def __call__(self, group_key: tuple[str, ...], rows: TRowsIterable) -> TRowsGenerator:
+        rows = iter(rows)
+        first = next(rows, None)
+        if first is None:
+            return
+        state = functools.reduce(self.update, rows, self.update(self.initial(), first))
+        yield from self.finalize(group_key, tuple(first[key] for key in group_key), state)
+
+
+class HashReduce(Operation):
+    """
+    Reduce operation which does not need sorted input
+    Partial states are kept in a hash table; when it grows over `max_groups` entries, the states are
+    sorted by key and spilled to disk, and spilled runs are merged and combined at the end.
+    """
+
+    def __init__(self, reducer: AlgebraicReducer, keys: tp.Sequence[str], max_groups: int | None = None) -> None:
+        """
+        :param reducer: reducer with mergeable state
+        :param keys: column names to group by
+        :param max_groups: maximum number of groups kept in memory, by default `reducer.max_groups`
+        """
+        self.reducer = reducer
+        self.keys = keys
+        self.max_groups = reducer.max_groups if max_groups is None else max_groups
+        assert self.max_groups > 0
+
+    def __call__(self, rows: TRowsIterable, *args: tp.Any, **kwargs: tp.Any) -> TRowsGenerator:
+        group_key = tuple(self.keys)
+        first, rows = _peek(rows)
+        key_func = key_function(self.keys, first)
+        reducer = self.reducer
+        table: dict[tuple[tp.Any, ...], tp.Any] = {}
+        runs: list[tp.IO[bytes]] = []
+        try:
+            for row in rows:
+                key = key_func(row)
+                state = table.get(key, MISSING)
+                table[key] = reducer.update(reducer.initial() if state is MISSING else state, row)
+                if len(table) > self.max_groups:
+                    runs.append(spill(sorted(table.items(), key=operator.itemgetter(0))))
+                    table = {}
+
+            if not runs:
+                for key, state in table.items():
+                    yield from reducer.finalize(group_key, key, state)
+                return
+
+            runs.append(spill(sorted(table.items(), key=operator.itemgetter(0))))
+            table = {}
+            merged = heapq.merge(*map(unspill, runs), key=operator.itemgetter(0))
+            for key, parts in itertools.groupby(merged, key=operator.itemgetter(0)):
+                state = functools.reduce(reducer.merge, (part for _, part in parts))
+                yield from reducer.finalize(group_key, key, state)
+        finally:
+            for run in runs:
+                run.close()
+
+
+class ReduceBatch(BatchOperation[TBatch, TBatch]):
+    """
+    Reduce operation working on column-oriented batches
+    Batches must be sorted by keys; the group at the end of a batch is carried over to the next one,
+    so reducer always gets whole groups.
+    """
+
+    def __init__(self, reducer: Reducer, keys: tp.Sequence[str]) -> None:
+        self.reducer = reducer
+        self.keys = keys
+
+    def __call__(self, batches: TBatchesIterable, *args: tp.Any, **kwargs: tp.Any) -> TBatchesGenerator:
+        group_key = tuple(self.keys)
+        # chunks of the last group, which may continue in the next batch; they are joined once the group ends
+        pending: list[TBatch] = []
+        pending_key: tuple[tp.Any, ...] = ()
+        for batch in batches:
+            keys = _batch_keys(batch, group_key)
+            if not keys:
+                continue
+            bounds = _group_bounds(keys)
+            start = 0
+            if pending and keys[0] == pending_key:
+                if bounds[1] == len(keys):
+                    pending.append(batch)
+                    continue
+                pending.append(_slice_batch(batch, 0, bounds[1]))
+                start = bounds[1]
+            if pending:
+                yield from self._reduce_group(group_key, pending)
+            last = bounds[-2]
+            if start < last:
+                yield from self.reducer.reduce_batch(group_key, _slice_batch(batch, start, last))
+            pending, pending_key = [_slice_batch(batch, last)], keys[last]
+        if pending:
+            yield from self._reduce_group(group_key, pending)
+
+    def _reduce_group(self, group_key: tuple[str, ...], chunks: list[TBatch]) -> TBatchesGenerator:
+        """Reduce one group split into several batches"""
+        columns = chunks[0].keys()
+        if all(chunk.keys() == columns for chunk in chunks):
+            batch = chunks[0] if len(chunks) == 1 else \
+                {key: list(itertools.chain.from_iterable(chunk[key] for chunk in chunks)) for key in columns}
+            yield from self.reducer.reduce_batch(group_key, batch)
+        else:
+            # rows of group have different columns, so they can not be put in one batch without inventing values
+            rows = itertools.chain.from_iterable(map(_batch_to_rows, chunks))
+            yield from _rows_to_batches(self.reducer(group_key, rows))
+
+
+class Window(Operation):
+    """
+    Base class for event-time window aggregations over possibly infinite streams.
+    Watermark is the maximal event time seen minus `lateness`: a window is emitted as soon as the watermark
+    passes its end, rows of it coming later are dropped; windows still open are emitted when the input ends.
+    Algebraic reducers keep one state per window and key, other reducers keep rows of open windows.
+    Bounds of window are added to every output row of reducer.
+    """
+
+    def __init__(self, reducer: Reducer, keys: tp.Sequence[str], time_column: str, lateness: float = 0,
+                 start_column: str = 'window_start', end_column: str = 'window_end') -> None:
+        """
+        :param reducer: reducer to aggregate rows of every window and key with
+        :param keys: column names to group by
+        :param time_column: column name with event time (a number, e.g. seconds)
+        :param lateness: how much rows may come out of order of event time
+        :param start_column: column name to save window start in
+        :param end_column: column name to save window end in
+        """
+        assert lateness >= 0
+        self.reducer = reducer
+        self.keys = keys
+        self.time_column = time_column
+        self.lateness = lateness
+        self.start_column = start_column
+        self.end_column = end_column
+
+    def _add(self, accumulator: tp.Any, row: TRow) -> tp.Any:
+        if isinstance(self.reducer, AlgebraicReducer):
+            return self.reducer.update(self.reducer.initial() if accumulator is MISSING else accumulator, row)
+        if accumulator is MISSING:
+            return [row]
+        accumulator.append(row)
+        return accumulator
+
+    def _merge(self, accumulator: tp.Any, other: tp.Any) -> tp.Any:
+        if isinstance(self.reducer, AlgebraicReducer):
+            return self.reducer.merge(accumulator, other)
+        return accumulator + other
+
+    def _emit(self, key: tuple[tp.Any, ...], accumulator: tp.Any, start: float, end: float) -> TRowsGenerator:
+        group_key = tuple(self.keys)
+        if isinstance(self.reducer, AlgebraicReducer):
+            rows = self.reducer.finalize(group_key, key, accumulator)
+        else:
+            rows = self.reducer(group_key, accumulator)
+        for row in rows:
+            # reducers may return the same row for overlapping windows, so it is not modified
+            yield {**row, self.start_column: start, self.end_column: end}
+
+
+class SlidingWindow(Window):
+    """Aggregate rows in windows [start, start + size) for every start divisible by slide"""
+
+    def __init__(self, reducer: Reducer, keys: tp.Sequence[str], time_column: str, size: float, slide: float,
+                 lateness: float = 0, start_column: str = 'window_start', end_column: str = 'window_end') -> None:
+        """
+        :param size: length of windows
+        :param slide: distance between starts of consecutive windows
+        """
+        assert size > 0 and slide > 0
+        super().__init__(reducer, keys, time_column, lateness, start_column, end_column)
+        self.size = size
+        self.slide = slide
+
+    def _starts(self, time: float) -> list[float]:
+        starts = []
+        start = time // self.slide * self.slide
+        while start > time - self.size:
+            starts.append(start)
+            start -= self.slide
+        return starts[::-1]
+
+    def __call__(self, rows: TRowsIterable, *args: tp.Any, **kwargs: tp.Any) -> TRowsGenerator:
+        first, rows = _peek(rows)
+        key_func = key_function(self.keys, first)
+        windows: dict[tuple[float, float], dict[tuple[tp.Any, ...], tp.Any]] = {}
+        ends: list[tuple[float, float]] = []
+        watermark = -math.inf
+        for row in rows:
+            time = row[self.time_column]
+            watermark = max(watermark, time - self.lateness)
+            key = key_func(row)
+            for start in self._starts(time):
+                end = start + self.size
+                if end <= watermark:
+                    continue  # window is already emitted
+                window = windows.get((start, end))
+                if window is None:
+                    window = windows[start, end] = {}
+                    heapq.heappush(ends, (end, start))
+                window[key] = self._add(window.get(key, MISSING), row)
+
+            while ends and ends[0][0] <= watermark:
+                end, start = heapq.heappop(ends)
+                for key, accumulator in windows.pop((start, end)).items():
+                    yield from self._emit(key, accumulator, start, end)
+
+        while ends:
+            end, start = heapq.heappop(ends)
+            for key, accumulator in windows.pop((start, end)).items():
+                yield from self._emit(key, accumulator, start, end)
+
+
+class TumblingWindow(SlidingWindow):
+    """Aggregate rows in consecutive non-overlapping windows [start, start + size)"""
+
+    def __init__(self, reducer: Reducer, keys: tp.Sequence[str], time_column: str, size: float,
+                 lateness: float = 0, start_column: str = 'window_start', end_column: str = 'window_end') -> None:
+        """
+        :param size: length of windows
+        """
+        super().__init__(reducer, keys, time_column, size, size, lateness, start_column, end_column)
+
+
+@dataclasses.dataclass
+class _Session:
+    start: float
+    last: float
+    accumulator: tp.Any
+    alive: bool = True
+
+
+class SessionWindow(Window):
+    """
+    Aggregate rows in sessions: rows of key closer in time than gap get into the same session.
+    Session window is [time of first row, time of last row + gap). Late rows which would get into
+    or merge with already emitted session of their key are dropped.
+    """
+
+    def __init__(self, reducer: Reducer, keys: tp.Sequence[str], time_column: str, gap: float,
+                 lateness: float = 0, start_column: str = 'window_start', end_column: str = 'window_end') -> None:
+        """
+        :param gap: inactivity period closing session
+        """
+        assert gap > 0
+        super().__init__(reducer, keys, time_column, lateness, start_column, end_column)
+        self.gap = gap
+
+    def __call__(self, rows: TRowsIterable, *args: tp.Any, **kwargs: tp.Any) -> TRowsGenerator:
+        first, rows = _peek(rows)
+        key_func = key_function(self.keys, first)
+        sessions: dict[tuple[tp.Any, ...], list[_Session]] = {}
+        # sessions by ends; entries of sessions which were merged or extended later are skipped
+        ends: list[tuple[float, int, tuple[tp.Any, ...], _Session]] = []
+        # ends of the last emitted sessions of keys in order of emission, rows of key before it are late
+        closed: dict[tuple[tp.Any, ...], float] = {}
+        closed_order: collections.deque[tuple[float, tuple[tp.Any, ...]]] = collections.deque()
+        watermark = -math.inf
+        for row in rows:
+            time = row[self.time_column]
+            watermark = max(watermark, time - self.lateness)
+            # rows earlier than watermark - gap are dropped anyway, so older ends are not needed
+            while closed_order and closed_order[0][0] <= watermark - self.gap:
+                end, key = closed_order.popleft()
+                if closed[key] == end:
+                    del closed[key]
+            if time + self.gap <= watermark:
+                continue  # session is already emitted
+            key = key_func(row)
+            if time < closed.get(key, -math.inf):
+                continue  # row belongs to already emitted session
+            session = _Session(time, time, self._add(MISSING, row))
+            key_sessions = sessions.setdefault(key, [])
+            for other in [other for other in key_sessions
+                          if time < other.last + self.gap and other.start < time + self.gap]:
+                key_sessions.remove(other)
+                other.alive = False
+                if other.start <= session.start:
+                    session.accumulator = self._merge(other.accumulator, session.accumulator)
+                else:
+                    session.accumulator = self._merge(session.accumulator, other.accumulator)
+                session.start, session.last = min(session.start, other.start), max(session.last, other.last)
+            key_sessions.append(session)
+            heapq.heappush(ends, (session.last + self.gap, next(_sequence), key, session))
+
+            while ends and ends[0][0] <= watermark:
+                end, _, key, session = heapq.heappop(ends)
+                if session.alive and session.last + self.gap == end:
+                    closed[key] = end
+                    closed_order.append((end, key))
+                    yield from self._close(sessions, key, session)
+
+        while ends:
+            end, _, key, session = heapq.heappop(ends)
+            if session.alive and session.last + self.gap == end:
+                yield from self._close(sessions, key, session)
+
+    def _close(self, sessions: dict[tuple[tp.Any, ...], list[_Session]], key: tuple[tp.Any, ...],
+               session: _Session) -> TRowsGenerator:
+        end = session.last + self.gap
+        session.alive = False
+        sessions[key].remove(session)
+        if not sessions[key]:
+            del sessions[key]
+        yield from self._emit(key, session.accumulator, session.start, end)
+
+
+class Sort(Operation):
+    """
+    Sort rows by keys (external merge sort)
+    Rows are sorted in chunks of `chunk_size`, every chunk is spilled to a temporary file
+    and then runs are merged with a heap holding one row per run.
+    """
+
+    def __init__(self, keys: tp.Sequence[str], chunk_size: int = 65536, fan_in: int = 64) -> None:
+        """
+        :param keys: column names to sort by
+        :param chunk_size: number of rows sorted in memory at once
+        :param fan_in: maximum number of runs merged at once
+        """
+        assert chunk_size > 0 and fan_in > 1
+        self.keys = keys
+        self.chunk_size = chunk_size
+        self.fan_in = fan_in
+
+    def __call__(self, rows: TRowsIterable, *args: tp.Any, **kwargs: tp.Any) -> TRowsGenerator:
+        first, rows = _peek(rows)
+        key = key_function(self.keys, first)
+        runs: list[tp.IO[bytes]] = []
+        try:
+            while True:
+                chunk = list(itertools.islice(rows, self.chunk_size))
+                chunk.sort(key=key)
+                if not runs and len(chunk) < self.chunk_size:
+                    yield from chunk  # everything fits in memory, no need to touch the disk
+                    return
+                if not chunk:
+                    break
+                runs.append(spill(chunk))
+                del chunk
+
+            while len(runs) > self.fan_in:
+                merged = [spill(heapq.merge(*map(unspill, runs[i:i + self.fan_in]), key=key))
+                          for i in range(0, len(runs), self.fan_in)]
+                runs = merged
+            yield from heapq.merge(*map(unspill, runs), key=key)
+        finally:
+            for run in runs:
+                run.close()
+
+
 class Joiner(ABC):
     """Base class for joiners"""
 
-    def __init__(self, suffix_a: str = '_1', suffix_b: str = '_2') -> None:
+    def __init__(self, suffix_a: str = '_1', suffix_b: str = '_2', max_group_rows: int = 65536) -> None:
+        """
+        :param suffix_a: suffix of colliding columns of left table
+        :param suffix_b: suffix of colliding columns of right table
+        :param max_group_rows: groups which have to be iterated many times are spilled to disk if they are larger
+        """
         self._a_suffix = suffix_a
         self._b_suffix = suffix_b
+        self.max_group_rows = max_group_rows
 
     @abstractmethod
     def __call__(self, keys: tp.Sequence[str], rows_a: TRowsIterable, rows_b: TRowsIterable) -> TRowsGenerator:
@@ -98,14 +1230,81 @@ class Joiner(ABC):
 
 
 class Join(Operation):
-    def __init__(self, joiner: Joiner, keys: tp.Sequence[str]):
+    """
+    Join two tables by keys with one of strategies:
+        'sort_merge' - both tables must be sorted by keys, nothing is kept in memory except current groups
+        'hash' - right table is loaded into a hash table, left one is streamed; no sorting needed
+        'grace' - both tables are partitioned to disk by hash of keys, then every partition is hash joined
+    """
+
+    STRATEGIES = ('sort_merge', 'hash', 'grace')
+
+    def __init__(self, joiner: Joiner, keys: tp.Sequence[str], strategy: str = 'sort_merge',
+                 partitions: int = 16) -> None:
+        """
+        :param joiner: joiner applied to groups of rows with equal keys
+        :param keys: column names to join by
+        :param strategy: one of `Join.STRATEGIES`
+        :param partitions: number of disk partitions for 'grace' strategy
+        """
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f'Unknown join strategy {strategy!r}, expected one of {self.STRATEGIES}')
         self.keys = keys
         self.joiner = joiner
+        self.strategy = strategy
+        self.partitions = partitions
 
     def __call__(self, rows: TRowsIterable, *args: tp.Any, **kwargs: tp.Any) -> TRowsGenerator:
-        other_rows = args[0]
-        rows_iter = itertools.groupby(rows, lambda x: tuple(x[i] for i in self.keys))
-        other_rows_iter = itertools.groupby(other_rows, lambda x: tuple(x[i] for i in self.keys))
+        if self.strategy == 'hash':
+            return self._hash_join(rows, args[0])
+        if self.strategy == 'grace':
+            return self._grace_join(rows, args[0])
+        return self._sort_merge_join(rows, args[0])
+
+    def _hash_join(self, rows: TRowsIterable, other_rows: TRowsIterable) -> TRowsGenerator:
+        first, rows = _peek(rows)
+        key_func = key_function(self.keys, first)
+        table: dict[tuple[tp.Any, ...], list[TRow]] = defaultdict(list)
+        for row in other_rows:
+            table[key_func(row)].append(row)
+
+        probed = set()
+        for value, group in itertools.groupby(rows, key=key_func):
+            other_group = table.get(value)
+            if other_group is None:
+                yield from self.joiner(self.keys, group, [])
+            else:
+                probed.add(value)
+                yield from self.joiner(self.keys, group, other_group)
+        for value, other_group in table.items():
+            if value not in probed:
+                yield from self.joiner(self.keys, [], other_group)
+
+    def _grace_join(self, rows: TRowsIterable, other_rows: TRowsIterable) -> TRowsGenerator:
+        parts = [self._partition(rows), self._partition(other_rows)]
+        try:
+            for part, other_part in zip(*parts):
+                yield from self._hash_join(unspill(part), unspill(other_part))
+        finally:
+            for file in itertools.chain.from_iterable(parts):
+                file.close()
+
+    def _partition(self, rows: TRowsIterable) -> list[tp.IO[bytes]]:
+        first, rows = _peek(rows)
+        key_func = key_function(self.keys, first)
+        files: list[tp.IO[bytes]] = [tempfile.TemporaryFile() for _ in range(self.partitions)]
+        dumps = [functools.partial(pickle.dump, file=file, protocol=pickle.HIGHEST_PROTOCOL) for file in files]
+        for row in rows:
+            dumps[hash(key_func(row)) % self.partitions](row)
+        for file in files:
+            file.seek(0)
+        return files
+
+    def _sort_merge_join(self, rows: TRowsIterable, other_rows: TRowsIterable) -> TRowsGenerator:
+        first, rows = _peek(rows)
+        other_first, other_rows = _peek(other_rows)
+        rows_iter = itertools.groupby(rows, key_function(self.keys, first))
+        other_rows_iter = itertools.groupby(other_rows, key_function(self.keys, other_first))
         try:
             for (value, group) in rows_iter:
                 for (other_value, other_group) in other_rows_iter:
@@ -136,6 +1335,9 @@ class DummyMapper(Mapper):
     def __call__(self, row: TRow) -> TRowsGenerator:
         yield row
 
+    def map_batch(self, batch: TBatch) -> TBatchesGenerator:
+        yield batch
+
 
 class FirstReducer(Reducer):
     """Yield only first row from passed ones"""
@@ -152,6 +1354,8 @@ class FirstReducer(Reducer):
 class FilterPunctuation(Mapper):
     """Left only non-punctuation symbols"""
 
+    TABLE = str.maketrans('', '', string.punctuation)
+
     def __init__(self, column: str):
         """
         :param column: name of column to process
@@ -159,9 +1363,14 @@ class FilterPunctuation(Mapper):
         self.column = column
 
     def __call__(self, row: TRow) -> TRowsGenerator:
-        row[self.column] = str.translate(row[self.column], str.maketrans('', '', r'!"#$%&\'()*+,-./:;<=>?@[\]^_`{|}~'))
+        row[self.column] = row[self.column].translate(self.TABLE)
         yield row
 
+    def map_batch(self, batch: TBatch) -> TBatchesGenerator:
+        table = self.TABLE
+        batch[self.column] = [value.translate(table) for value in batch[self.column]]
+        yield batch
+
 
 class LowerCase(Mapper):
     """Replace column value with value in lower case"""
@@ -180,6 +1389,10 @@ class LowerCase(Mapper):
         row[self.column] = LowerCase._lower_case(row[self.column])
         yield row
 
+    def map_batch(self, batch: TBatch) -> TBatchesGenerator:
+        batch[self.column] = list(map(LowerCase._lower_case, batch[self.column]))
+        yield batch
+
 
 class Split(Mapper):
     """Split row on multiple rows by separator"""
@@ -187,15 +1400,51 @@ class Split(Mapper):
     def __init__(self, column: str, separator: str | None = r"\s+") -> None:
         """
         :param column: name of column to split
-        :param separator: string to separate by
+        :param separator: regex to separate by, None means whitespace
         """
         self.column = column
         self.separator = separator
+        self._split = _splitter(separator)
+
+    def __call__(self, row: TRow) -> TRowsGenerator:
+        column = self.column
+        for fragment in self._split(row[column]):
+            result = row.copy()
+            result[column] = fragment
+            yield result
+
+
+class Tokenize(Mapper):
+    """
+    Split several text columns into tokens, one row per token.
+    Unlike `Split` the whole row is not copied: result rows have only token and kept columns.
+    """
+
+    def __init__(self, columns: tp.Sequence[str], keep: tp.Sequence[str] = (), result_column: str = 'token',
+                 separator: str | None = r"\s+", skip_empty: bool = True) -> None:
+        """
+        :param columns: names of columns to split
+        :param keep: names of columns to copy to every token row
+        :param result_column: column name to save token in
+        :param separator: regex to separate by, None means whitespace
+        :param skip_empty: whether to drop empty tokens (e.g. at the ends of text)
+        """
+        self.columns = columns
+        self.keep = keep
+        self.result_column = result_column
+        self.separator = separator
+        self.skip_empty = skip_empty
+        self._split = _splitter(separator)
 
     def __call__(self, row: TRow) -> TRowsGenerator:
-        for match in re.finditer(f'(?:^|{self.separator})((?:(?!{self.separator}).)*)', row[self.column]):
-            fragment = match.group(1)
-            yield row.copy() | {self.column: fragment}
+        base = {key: row[key] for key in self.keep}
+        result_column = self.result_column
+        for column in self.columns:
+            for token in self._split(row[column]):
+                if token or not self.skip_empty:
+                    result = base.copy()
+                    result[result_column] = token
+                    yield result
 
 
 class Product(Mapper):
@@ -216,20 +1465,47 @@ class Product(Mapper):
         row[self.result_column] = ans
         yield row
 
+    def map_batch(self, batch: TBatch) -> TBatchesGenerator:
+        result: list[tp.Any] = [1] * _batch_length(batch)
+        for i in self.columns:
+            result = list(map(operator.mul, result, batch[i]))
+        batch[self.result_column] = result
+        yield batch
+
 
 class Filter(Mapper):
     """Remove records that don't satisfy some condition"""
 
-    def __init__(self, condition: tp.Callable[[TRow], bool]) -> None:
+    def __init__(self, condition: tp.Callable[[TRow], bool],
+                 batch_condition: tp.Callable[[TBatch], tp.Iterable[bool]] | None = None,
+                 columns: tp.Sequence[str] | None = None) -> None:
         """
         :param condition: if condition is not true - remove record
+        :param batch_condition: optional vectorized condition returning flag for every row of batch
+        :param columns: optional names of all columns condition depends on (lets graph planner move filter)
         """
         self.condition = condition
+        self.batch_condition = batch_condition
+        self.columns = columns
 
     def __call__(self, row: TRow) -> TRowsGenerator:
         if self.condition(row):
             yield row
 
+    def map_batch(self, batch: TBatch) -> TBatchesGenerator:
+        if self.batch_condition is not None:
+            mask = list(self.batch_condition(batch))
+        else:
+            mask = list(map(self.condition, _batch_to_rows(batch)))
+        yield {key: list(itertools.compress(column, mask)) for key, column in batch.items()}
+
+
+class AsRow(Mapper):
+    """Convert row to schema-bound `Row`, which takes less memory and is joined and projected faster"""
+
+    def __call__(self, row: TRow) -> TRowsGenerator:
+        yield row if type(row) is Row else Row.from_dict(row)
+
 
 class Project(Mapper):
     """Leave only mentioned columns"""
@@ -241,13 +1517,19 @@ class Project(Mapper):
         self.columns = columns
 
     def __call__(self, row: TRow) -> TRowsGenerator:
-        yield {key: row[key] for key in self.columns}
+        if type(row) is Row:
+            yield row.project(self.columns)
+        else:
+            yield {key: row[key] for key in self.columns}
+
+    def map_batch(self, batch: TBatch) -> TBatchesGenerator:
+        yield {key: batch[key] for key in self.columns}
 
 
 # Reducers
 
 
-class TopN(Reducer):
+class TopN(AlgebraicReducer):
     """Calculate top N by value"""
 
     def __init__(self, column: str, n: int) -> None:
@@ -258,19 +1540,31 @@ class TopN(Reducer):
         self.column_max = column
         self.n = n
 
-    def __call__(self, group_key: tuple[str, ...], rows: TRowsIterable) -> TRowsGenerator:
-        heap: list[tuple[tp.Any, tp.ItemsView[str, tp.Any]]] = []
-        for row in rows:
-            if len(heap) < self.n:
-                heapq.heappush(heap, (row[self.column_max], row.items()))
-            else:
-                heapq.heappushpop(heap, (row[self.column_max], row.items()))
+    def initial(self) -> list[tuple[tp.Any, int, TRow]]:
+        return []
+
+    def update(self, state: list[tuple[tp.Any, int, TRow]], row: TRow) -> list[tuple[tp.Any, int, TRow]]:
+        # unique sequence number keeps rows with equal values out of comparison
+        item = (row[self.column_max], next(_sequence), row)
+        if len(state) < self.n:
+            heapq.heappush(state, item)
+        else:
+            heapq.heappushpop(state, item)
+        return state
+
+    def merge(self, state: list[tuple[tp.Any, int, TRow]],
+              other: list[tuple[tp.Any, int, TRow]]) -> list[tuple[tp.Any, int, TRow]]:
+        merged = heapq.nlargest(self.n, state + other)
+        heapq.heapify(merged)
+        return merged
 
-        for _, i in heap:
-            yield dict(i)
+    def finalize(self, group_key: tuple[str, ...], key: tuple[tp.Any, ...],
+                 state: list[tuple[tp.Any, int, TRow]]) -> TRowsGenerator:
+        for _, _, row in state:
+            yield dict(row)
 
 
-class TermFrequency(Reducer):
+class TermFrequency(AlgebraicReducer):
     """Calculate frequency of values in column"""
 
     def __init__(self, words_column: str, result_column: str = 'tf') -> None:
@@ -284,7 +1578,7 @@ class TermFrequency(Reducer):
     def __call__(self, group_key: tuple[str, ...], rows: TRowsIterable) -> TRowsGenerator:
         size = 0
         value_dict: dict[str, int] = defaultdict(int)
-        main_part = dict()
+        main_part: TRow = dict()
         for value, group in itertools.groupby(rows,
                                               key=lambda x: x[self.words_column]):
             group_size = 0
@@ -299,8 +1593,25 @@ class TermFrequency(Reducer):
                    {self.result_column: group_size / size} |
                    {self.words_column: value})
 
+    def initial(self) -> dict[tp.Any, int]:
+        return defaultdict(int)
 
-class Count(Reducer):
+    def update(self, state: dict[tp.Any, int], row: TRow) -> dict[tp.Any, int]:
+        state[row[self.words_column]] += 1
+        return state
+
+    def merge(self, state: dict[tp.Any, int], other: dict[tp.Any, int]) -> dict[tp.Any, int]:
+        for value, group_size in other.items():
+            state[value] += group_size
+        return state
+
+    def finalize(self, group_key: tuple[str, ...], key: tuple[tp.Any, ...], state: dict[tp.Any, int]) -> TRowsGenerator:
+        size = sum(state.values())
+        for value, group_size in state.items():
+            yield dict(zip(group_key, key)) | {self.result_column: group_size / size} | {self.words_column: value}
+
+
+class Count(AlgebraicReducer):
     """
     Count records by key
     Example for group_key=('a',) and column='d'
@@ -318,14 +1629,31 @@ class Count(Reducer):
 
     def __call__(self, group_key: tuple[str, ...], rows: TRowsIterable) -> TRowsGenerator:
         size = 0
-        value = dict()
+        value: TRow = dict()
         for row in rows:
             size += 1
             value = row
         yield {key: value[key] for key in group_key} | {self.column: size}
 
+    def reduce_batch(self, group_key: tuple[str, ...], batch: TBatch) -> TBatchesGenerator:
+        bounds = _group_bounds(_batch_keys(batch, group_key))
+        result = {key: [batch[key][i] for i in bounds[:-1]] for key in group_key}
+        yield result | {self.column: list(map(operator.sub, bounds[1:], bounds[:-1]))}
+
+    def initial(self) -> int:
+        return 0
 
-class Sum(Reducer):
+    def update(self, state: int, row: TRow) -> int:
+        return state + 1
+
+    def merge(self, state: int, other: int) -> int:
+        return state + other
+
+    def finalize(self, group_key: tuple[str, ...], key: tuple[tp.Any, ...], state: int) -> TRowsGenerator:
+        yield dict(zip(group_key, key)) | {self.column: state}
+
+
+class Sum(AlgebraicReducer):
     """
     Sum values aggregated by key
     Example for key=('a',) and column='b'
@@ -343,12 +1671,296 @@ class Sum(Reducer):
 
     def __call__(self, group_key: tuple[str, ...], rows: TRowsIterable) -> TRowsGenerator:
         size = 0
-        value = dict()
+        value: TRow = dict()
         for row in rows:
             size += row[self.column]
             value = row
         yield {key: value[key] for key in group_key} | {self.column: size}
 
+    def reduce_batch(self, group_key: tuple[str, ...], batch: TBatch) -> TBatchesGenerator:
+        bounds = _group_bounds(_batch_keys(batch, group_key))
+        column = batch[self.column]
+        result = {key: [batch[key][i] for i in bounds[:-1]] for key in group_key}
+        yield result | {self.column: [sum(column[start:stop]) for start, stop in zip(bounds, bounds[1:])]}
+
+    def initial(self) -> tp.Any:
+        return 0
+
+    def update(self, state: tp.Any, row: TRow) -> tp.Any:
+        return state + row[self.column]
+
+    def merge(self, state: tp.Any, other: tp.Any) -> tp.Any:
+        return state + other
+
+    def finalize(self, group_key: tuple[str, ...], key: tuple[tp.Any, ...], state: tp.Any) -> TRowsGenerator:
+        yield dict(zip(group_key, key)) | {self.column: state}
+
+
+# memory for states of groups which HashReduce keeps by default with sketch reducers, whose states are big
+_SKETCHES_MEMORY = 256 * 1024 * 1024
+
+
+class ApproxDistinct(AlgebraicReducer):
+    """
+    Estimate number of distinct values in column with HyperLogLog
+    Small groups are counted exactly; relative error of estimate is about 1.04 / sqrt(2 ** precision),
+    state takes at most 2 ** precision bytes per group, so HashReduce keeps fewer groups by default.
+    """
+
+    def __init__(self, column: str, result_column: str = 'distinct', precision: int = 12) -> None:
+        """
+        :param column: column name to count distinct values of
+        :param result_column: column name to save estimate in
+        :param precision: number of hash bits addressing registers, from 4 to 18
+        """
+        assert 4 <= precision <= 18
+        self.column = column
+        self.result_column = result_column
+        self.precision = precision
+        self.max_groups = max(1, _SKETCHES_MEMORY >> precision)
+
+    def initial(self) -> set[int] | bytearray:
+        # hashes are kept while there are few of them, registers take more memory
+        return set()
+
+    def _registers(self, hashes: tp.Iterable[int]) -> bytearray:
+        registers = bytearray(1 << self.precision)
+        for value_hash in hashes:
+            self._add(registers, value_hash)
+        return registers
+
+    def _add(self, registers: bytearray, value_hash: int) -> None:
+        bits = 64 - self.precision
+        index, rest = value_hash >> bits, value_hash & ((1 << bits) - 1)
+        rank = bits - rest.bit_length() + 1
+        if rank > registers[index]:
+            registers[index] = rank
+
+    def update(self, state: set[int] | bytearray, row: TRow) -> set[int] | bytearray:
+        value_hash = _stable_hash(row[self.column])
+        if isinstance(state, bytearray):
+            self._add(state, value_hash)
+            return state
+        state.add(value_hash)
+        return state if len(state) <= (1 << self.precision) // 16 else self._registers(state)
+
+    def merge(self, state: set[int] | bytearray, other: set[int] | bytearray) -> set[int] | bytearray:
+        if isinstance(state, set) and isinstance(other, set):
+            state |= other
+            return state if len(state) <= (1 << self.precision) // 16 else self._registers(state)
+        if isinstance(state, set):
+            return self.merge(other, state)
+        if isinstance(other, set):
+            for value_hash in other:
+                self._add(state, value_hash)
+            return state
+        return bytearray(map(max, state, other))
+
+    def finalize(self, group_key: tuple[str, ...], key: tuple[tp.Any, ...],
+                 state: set[int] | bytearray) -> TRowsGenerator:
+        if isinstance(state, set):
+            estimate = len(state)
+        else:
+            size = len(state)
+            alpha = 0.7213 / (1 + 1.079 / size)
+            raw = alpha * size * size / sum(2.0 ** -rank for rank in state)
+            zeros = state.count(0)
+            # linear counting is more precise for small cardinalities
+            estimate = round(size * math.log(size / zeros) if raw <= 2.5 * size and zeros else raw)
+        yield dict(zip(group_key, key)) | {self.result_column: estimate}
+
+
+_TSketch = tuple['array.array[int] | None', dict[tp.Any, int]]
+
+
+class HeavyHitters(AlgebraicReducer):
+    """
+    Find approximately most frequent values of column
+    Groups with few distinct values are counted exactly. Counts in bigger groups are estimated with Count-Min
+    sketch, so they may only be overestimated: by at most e / width of group size with probability 1 - exp(-depth).
+    Sketch takes 8 * width * depth bytes (64 KiB by default) per group, so HashReduce keeps fewer groups by default.
+    """
+
+    def __init__(self, column: str, n: int, result_column: str = 'count', width: int = 2048, depth: int = 4) -> None:
+        """
+        :param column: column name to find most frequent values of
+        :param n: number of values to find
+        :param result_column: column name to save estimated count in
+        :param width: number of counters in every row of sketch
+        :param depth: number of rows of sketch
+        """
+        self.column = column
+        self.n = n
+        self.result_column = result_column
+        self.width = width
+        self.depth = depth
+        self.max_groups = max(1, _SKETCHES_MEMORY // (8 * width * depth))
+        # groups with more distinct values get sketch
+        self.exact_limit = max(self.n, width * depth // 64)
+
+    def initial(self) -> _TSketch:
+        """
+        Sketch counters and candidates with their estimated counts;
+        sketch is allocated when group gets many values, until then the counts are exact counts of all values
+        """
+        return None, {}
+
+    def _sketch(self, counts: dict[tp.Any, int]) -> _TSketch:
+        sketch = array.array('q', bytes(8 * self.width * self.depth))
+        self._add(sketch, counts)
+        return sketch, self._prune({value: self._estimate(sketch, value) for value in counts})
+
+    def _add(self, sketch: 'array.array[int]', counts: dict[tp.Any, int]) -> None:
+        for value, count in counts.items():
+            for cell in self._cells(value):
+                sketch[cell] += count
+
+    def _cells(self, value: tp.Any) -> list[int]:
+        value_hash = _stable_hash(value)
+        low, high = value_hash & 0xffffffff, value_hash >> 32 | 1
+        return [row * self.width + (low + row * high) % self.width for row in range(self.depth)]
+
+    def _estimate(self, sketch: 'array.array[int]', value: tp.Any) -> int:
+        return min(sketch[cell] for cell in self._cells(value))
+
+    def _prune(self, candidates: dict[tp.Any, int]) -> dict[tp.Any, int]:
+        # candidates are pruned in bulk, dropped values come back once their estimate grows
+        if len(candidates) <= 2 * self.n:
+            return candidates
+        return dict(heapq.nlargest(self.n, candidates.items(), key=operator.itemgetter(1)))
+
+    def update(self, state: _TSketch, row: TRow) -> _TSketch:
+        sketch, candidates = state
+        value = row[self.column]
+        if sketch is None:
+            candidates[value] = candidates.get(value, 0) + 1
+            return state if len(candidates) <= self.exact_limit else self._sketch(candidates)
+        estimate = None
+        for cell in self._cells(value):
+            sketch[cell] += 1
+            estimate = sketch[cell] if estimate is None else min(estimate, sketch[cell])
+        candidates[value] = estimate  # type: ignore
+        return sketch, self._prune(candidates)
+
+    def merge(self, state: _TSketch, other: _TSketch) -> _TSketch:
+        if state[0] is None and other[0] is None:
+            counts = state[1]
+            for value, count in other[1].items():
+                counts[value] = counts.get(value, 0) + count
+            return state if len(counts) <= self.exact_limit else self._sketch(counts)
+        if state[0] is None:
+            state, other = other, state
+        sketch = state[0]
+        assert sketch is not None
+        if other[0] is None:
+            self._add(sketch, other[1])
+        else:
+            sketch = array.array('q', map(operator.add, sketch, other[0]))
+        candidates = {value: self._estimate(sketch, value) for value in itertools.chain(state[1], other[1])}
+        return sketch, self._prune(candidates)
+
+    def finalize(self, group_key: tuple[str, ...], key: tuple[tp.Any, ...], state: _TSketch) -> TRowsGenerator:
+        sketch, candidates = state
+        estimates: tp.Iterable[tuple[tp.Any, int]] = candidates.items() if sketch is None else \
+            ((value, self._estimate(sketch, value)) for value in candidates)
+        for value, count in heapq.nlargest(self.n, estimates, key=operator.itemgetter(1)):
+            yield dict(zip(group_key, key)) | {self.column: value, self.result_column: count}
+
+
+@dataclasses.dataclass
+class _TDigest:
+    """Centroids (mean, weight) sorted by mean, values not merged into centroids yet and value range"""
+    centroids: list[tuple[float, float]] = dataclasses.field(default_factory=list)
+    buffer: list[float] = dataclasses.field(default_factory=list)
+    min: float = math.inf
+    max: float = -math.inf
+
+
+class ApproxQuantiles(AlgebraicReducer):
+    """
+    Estimate quantiles of column values with merging t-digest
+    Estimates are most precise for extreme quantiles; state takes O(compression) memory per group.
+    """
+
+    def __init__(self, column: str, quantiles: tp.Mapping[str, float], compression: int = 100) -> None:
+        """
+        :param column: column name to estimate quantiles of
+        :param quantiles: quantiles (from 0 to 1) to estimate by names of columns to save them in
+        :param compression: bigger compression means more precise estimates and bigger state
+        """
+        self.column = column
+        self.quantiles = quantiles
+        self.compression = compression
+
+    def initial(self) -> _TDigest:
+        return _TDigest()
+
+    def _compress(self, digest: _TDigest) -> _TDigest:
+        points = sorted(digest.centroids + [(value, 1.0) for value in digest.buffer])
+        digest.buffer = []
+        if not points:
+            return digest
+        total = sum(weight for _, weight in points)
+        centroids = []
+        mean, weight = points[0]
+        before = 0.0
+        for point_mean, point_weight in points[1:]:
+            proposed = weight + point_weight
+            q = (before + proposed / 2) / total
+            if proposed <= 4 * total * q * (1 - q) / self.compression:
+                mean += (point_mean - mean) * point_weight / proposed
+                weight = proposed
+            else:
+                centroids.append((mean, weight))
+                before += weight
+                mean, weight = point_mean, point_weight
+        centroids.append((mean, weight))
+        digest.centroids = centroids
+        return digest
+
+    def update(self, state: _TDigest, row: TRow) -> _TDigest:
+        value = row[self.column]
+        state.buffer.append(value)
+        if value < state.min:
+            state.min = value
+        if value > state.max:
+            state.max = value
+        return self._compress(state) if len(state.buffer) >= 5 * self.compression else state
+
+    def merge(self, state: _TDigest, other: _TDigest) -> _TDigest:
+        state.centroids += other.centroids
+        state.buffer += other.buffer
+        state.min, state.max = min(state.min, other.min), max(state.max, other.max)
+        return self._compress(state)
+
+    def _quantile(self, digest: _TDigest, q: float) -> float:
+        centroids = digest.centroids
+        total = sum(weight for _, weight in centroids)
+        target = q * total
+        # centroid weight is spread evenly around its mean, value range ends are known exactly
+        previous_position, previous_mean = 0.0, digest.min
+        position = 0.0
+        for mean, weight in centroids:
+            center = position + weight / 2
+            if target <= center:
+                return self._interpolate(previous_position, previous_mean, center, mean, target)
+            previous_position, previous_mean = center, mean
+            position += weight
+        return self._interpolate(previous_position, previous_mean, total, digest.max, target)
+
+    @staticmethod
+    def _interpolate(left: float, left_value: float, right: float, right_value: float, target: float) -> float:
+        if right == left:
+            return right_value
+        return left_value + (right_value - left_value) * (target - left) / (right - left)
+
+    def finalize(self, group_key: tuple[str, ...], key: tuple[tp.Any, ...], state: _TDigest) -> TRowsGenerator:
+        self._compress(state)
+        result = dict(zip(group_key, key))
+        for column, q in self.quantiles.items():
+            result[column] = self._quantile(state, q)
+        yield result
+
 
 # Joiners
 
@@ -356,14 +1968,27 @@ class Sum(Reducer):
 class InnerJoiner(Joiner):
     """Join with inner strategy"""
 
-    def __init__(self, suffix_a: str = '_1', suffix_b: str = '_2') -> None:
-        super().__init__(suffix_a, suffix_b)
+    def __init__(self, suffix_a: str = '_1', suffix_b: str = '_2', max_group_rows: int = 65536) -> None:
+        super().__init__(suffix_a, suffix_b, max_group_rows)
 
     def __call__(self, keys: tp.Sequence[str], rows_a: TRowsIterable, rows_b: TRowsIterable) -> TRowsGenerator:
-        rows_b = list(rows_b)
-        for a_row in rows_a:
-            for b_row in rows_b:
-                if all(a_row[i] == b_row[i] for i in keys):
+        # rows of both groups have equal keys, so only colliding non-key columns need attention
+        key_set = set(keys)
+        plans: dict[tuple[RowSchema, RowSchema], tuple[RowSchema, _TGetter]] = {}
+        with _GroupBuffer(rows_b, self.max_group_rows) as b_rows:
+            for a_row in rows_a:
+                for b_row in b_rows:
+                    if type(a_row) is Row and type(b_row) is Row:
+                        schemas = a_row._schema, b_row._schema
+                        if schemas not in plans:
+                            plans[schemas] = a_row._schema.join_plan(b_row._schema, key_set,
+                                                                     self._a_suffix, self._b_suffix)
+                        schema, getter = plans[schemas]
+                        yield Row(schema, list(getter(a_row._values + b_row._values)))
+                        continue
+                    if a_row.keys() & b_row.keys() <= key_set:
+                        yield a_row | b_row
+                        continue
                     row = dict()
                     for key, value in (a_row | b_row).items():
                         if key in a_row and key in b_row and key not in keys:
@@ -392,17 +2017,17 @@ class LeftJoiner(Joiner):
     """Join with left strategy"""
 
     def __call__(self, keys: tp.Sequence[str], rows_a: TRowsIterable, rows_b: TRowsIterable) -> TRowsGenerator:
-        b = list(rows_b)
-        for a_row in rows_a:
-            if len(b) != 0:
-                for b_row in b:
-                    yield a_row | b_row
-            else:
-                yield a_row
+        with _GroupBuffer(rows_b, self.max_group_rows) as b_rows:
+            for a_row in rows_a:
+                if b_rows:
+                    for b_row in b_rows:
+                        yield a_row | b_row
+                else:
+                    yield a_row
 
 
 class RightJoiner(Joiner):
     """Join with right strategy"""
 
     def __call__(self, keys: tp.Sequence[str], rows_a: TRowsIterable, rows_b: TRowsIterable) -> TRowsGenerator:
-        return LeftJoiner()(keys, rows_b, rows_a)
+        return LeftJoiner(max_group_rows=self.max_group_rows)(keys, rows_b, rows_a)
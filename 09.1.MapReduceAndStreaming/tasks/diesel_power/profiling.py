@@ -0,0 +1,170 @@
+import collections
+import dataclasses
+import time
+import typing as tp
+
+from . import operations as ops
+from .memory_watchdog import SELF_PROCESS
+
+
+@dataclasses.dataclass
+class StageStats:
+    """Metrics of one profiled operation; times are in seconds, memory is in bytes"""
+    name: str
+    path: tuple[str, ...] = ()
+    rows_in: int = 0
+    rows_out: int = 0
+    wall: float = 0.0
+    cpu: float = 0.0
+    self_wall: float = 0.0
+    self_cpu: float = 0.0
+    memory: int = 0
+    groups: collections.Counter[int] | None = None
+
+    def group_sizes(self) -> list[tuple[int, int, int]]:
+        """Histogram of group sizes as (smallest size, largest size, number of groups), bounds are powers of 2"""
+        if self.groups is None:
+            return []
+        return [(1 << bucket >> 1, (1 << bucket) - 1, count) for bucket, count in sorted(self.groups.items())]
+
+
+def describe(operation: ops.Operation) -> str:
+    """Default stage name: type of operation with types of its mappers, reducer or joiner"""
+    for attribute in ('mapper', 'reducer', 'joiner'):
+        step = getattr(operation, attribute, None)
+        if step is not None:
+            names = [type(mapper).__name__ for mapper in getattr(step, 'mappers', [step])]
+            return f'{type(operation).__name__}({"+".join(names)})'
+    return type(operation).__name__
+
+
+class Profiler:
+    """
+    Collects metrics of operations: rows in and out, wall and CPU time (total and self, i.e. excluding
+    time spent by the operations it reads from), peak memory delta and group sizes of reduces.
+    Operations are lazy and interleaved, so time is measured around every pulled row, and memory is
+    the maximal growth of process RSS sampled while the operation is running.
+    """
+
+    def __init__(self, memory_period: int = 1024) -> None:
+        """
+        :param memory_period: RSS is sampled once per this number of output rows of every stage
+        """
+        self.memory_period = memory_period
+        self.stages: list[StageStats] = []
+        self._running: list[StageStats] = []
+
+    def stage(self, name: str, path: tp.Sequence[str] = ()) -> StageStats:
+        """
+        Register new stage
+        :param name: name of stage in report
+        :param path: names of stages consuming results of this one, starting from the final one
+        """
+        stats = StageStats(name, tuple(path) + (name,))
+        self.stages.append(stats)
+        return stats
+
+    def wrap(self, operation: ops.Operation, name: str | None = None) -> 'Profiled':
+        """
+        Construct operation which works like the given one and collects its metrics
+        :param operation: operation to profile
+        :param name: name of stage in report, by default names of operation and its mapper/reducer/joiner
+        """
+        return Profiled(operation, self.stage(name or describe(operation)), self)
+
+    def inputs(self, stats: StageStats, rows: ops.TRowsIterable,
+               keys: tp.Sequence[str] | None = None) -> ops.TRowsGenerator:
+        """
+        Count rows read by stage
+        :param keys: if given, rows are sorted by keys and sizes of groups are collected
+        """
+        if keys is None:
+            for row in rows:
+                stats.rows_in += 1
+                yield row
+            return
+
+        groups = stats.groups = stats.groups if stats.groups is not None else collections.Counter()
+        key_func = ops.key_function(keys)
+        current, size = ops.MISSING, 0
+        try:
+            for row in rows:
+                stats.rows_in += 1
+                key = key_func(row)
+                if key != current:
+                    if size:
+                        groups[size.bit_length()] += 1
+                    current, size = key, 0
+                size += 1
+                yield row
+        finally:
+            if size:
+                groups[size.bit_length()] += 1
+
+    def outputs(self, stats: StageStats, rows: ops.TRowsIterable) -> ops.TRowsGenerator:
+        """Measure time and memory spent on producing rows of stage"""
+        rows = iter(rows)
+        start_memory = SELF_PROCESS.memory_info().rss
+        try:
+            while True:
+                self._running.append(stats)
+                wall, cpu = time.perf_counter(), time.process_time()
+                try:
+                    row = next(rows, ops.MISSING)
+                finally:
+                    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+                    self._running.pop()
+                    stats.wall += wall
+                    stats.cpu += cpu
+                    stats.self_wall += wall
+                    stats.self_cpu += cpu
+                    if self._running:
+                        self._running[-1].self_wall -= wall
+                        self._running[-1].self_cpu -= cpu
+                if row is ops.MISSING:
+                    return
+                stats.rows_out += 1
+                if stats.rows_out % self.memory_period == 0:
+                    stats.memory = max(stats.memory, SELF_PROCESS.memory_info().rss - start_memory)
+                yield row
+        finally:
+            stats.memory = max(stats.memory, SELF_PROCESS.memory_info().rss - start_memory)
+
+    def report(self) -> str:
+        """Table with metrics of every stage"""
+        header = f'{"stage":<40}{"rows in":>12}{"rows out":>12}{"wall, s":>10}{"cpu, s":>10}' \
+                 f'{"self wall":>11}{"self cpu":>10}{"memory, MiB":>13}'
+        lines = [header, '-' * len(header)]
+        for stats in self.stages:
+            lines.append(f'{stats.name[:39]:<40}{stats.rows_in:>12}{stats.rows_out:>12}{stats.wall:>10.3f}'
+                         f'{stats.cpu:>10.3f}{stats.self_wall:>11.3f}{stats.self_cpu:>10.3f}'
+                         f'{stats.memory / 2 ** 20:>13.1f}')
+            if stats.groups:
+                sizes = ', '.join(f'{low}: {count}' if low == high else f'{low}-{high}: {count}'
+                                  for low, high, count in stats.group_sizes())
+                lines.append(f'    group sizes: {sizes}')
+        return '\n'.join(lines)
+
+    def folded(self) -> str:
+        """
+        Self wall time of stages in microseconds in folded stacks format,
+        which is accepted by flamegraph.pl, speedscope and similar tools
+        """
+        weights: collections.Counter[str] = collections.Counter()
+        for stats in self.stages:
+            weights[';'.join(name.replace(';', ',') for name in stats.path)] += max(round(stats.self_wall * 1e6), 0)
+        return ''.join(f'{stack} {weight}\n' for stack, weight in weights.items() if weight)
+
+
+class Profiled(ops.Operation):
+    """Operation collecting metrics of another one"""
+
+    def __init__(self, operation: ops.Operation, stats: StageStats, profiler: Profiler) -> None:
+        self.operation = operation
+        self.stats = stats
+        self.profiler = profiler
+
+    def __call__(self, *args: tp.Any, **kwargs: tp.Any) -> ops.TRowsGenerator:
+        keys = self.operation.keys if isinstance(self.operation, ops.Reduce) else None
+        inputs = [self.profiler.inputs(self.stats, rows, keys) for rows in args]
+        yield from self.profiler.outputs(self.stats, self.operation(*inputs, **kwargs))
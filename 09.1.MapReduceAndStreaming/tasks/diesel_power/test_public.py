@@ -1,12 +1,24 @@
+import bz2
 import copy
 import dataclasses
+import gc
+import gzip
+import itertools
+import multiprocessing
+import pickle
+import random
+import tempfile
 import time
 import typing as tp
 
 import pytest
 from pytest import approx
 
+from . import benchmark
+from . import checkpoint as checkpoints
+from . import graph
 from . import operations as ops
+from . import profiling
 from . import memory_watchdog
 
 
@@ -127,6 +139,63 @@ MAP_CASES = [
         cmp_keys=('test_id', 'text'),
         mapper_ground_truth_items=(0, 1, 2)
     ),
+    MapCase(
+        mapper=ops.Split(column='text', separator=r'[;,]\s*'),
+        data=[
+            {'test_id': 1, 'text': 'one, two;three'},
+            {'test_id': 2, 'text': ';tricky,'},
+            {'test_id': 3, 'text': ''}
+        ],
+        ground_truth=[
+            {'test_id': 1, 'text': 'one'},
+            {'test_id': 1, 'text': 'three'},
+            {'test_id': 1, 'text': 'two'},
+
+            {'test_id': 2, 'text': ''},
+            {'test_id': 2, 'text': ''},
+            {'test_id': 2, 'text': 'tricky'},
+
+            {'test_id': 3, 'text': ''}
+        ],
+        cmp_keys=('test_id', 'text'),
+        mapper_ground_truth_items=(0, 1, 2)
+    ),
+    MapCase(
+        mapper=ops.Split(column='text'),
+        data=[
+            {'test_id': 1, 'text': ' leading and trailing\t'},
+            {'test_id': 2, 'text': '  '}
+        ],
+        ground_truth=[
+            {'test_id': 1, 'text': ''},
+            {'test_id': 1, 'text': ''},
+            {'test_id': 1, 'text': 'and'},
+            {'test_id': 1, 'text': 'leading'},
+            {'test_id': 1, 'text': 'trailing'},
+
+            {'test_id': 2, 'text': ''},
+            {'test_id': 2, 'text': ''}
+        ],
+        cmp_keys=('test_id', 'text'),
+        mapper_ground_truth_items=(0, 1, 2, 3, 4)
+    ),
+    MapCase(
+        mapper=ops.Tokenize(columns=['title', 'text'], keep=['test_id'], result_column='word'),
+        data=[
+            {'test_id': 1, 'title': 'first doc', 'text': ' one  two ', 'score': 0.5},
+            {'test_id': 2, 'title': '', 'text': 'three', 'score': 1.5}
+        ],
+        ground_truth=[
+            {'test_id': 1, 'word': 'doc'},
+            {'test_id': 1, 'word': 'first'},
+            {'test_id': 1, 'word': 'one'},
+            {'test_id': 1, 'word': 'two'},
+
+            {'test_id': 2, 'word': 'three'}
+        ],
+        cmp_keys=('test_id', 'word'),
+        mapper_ground_truth_items=(0, 1, 2, 3)
+    ),
     MapCase(
         mapper=ops.Product(columns=['speed', 'distance'], result_column='time'),
         data=[
@@ -193,6 +262,23 @@ def test_mapper(case: MapCase) -> None:
     assert sorted(result, key=key_func) == sorted(case.ground_truth, key=key_func)
 
 
+@pytest.mark.parametrize('case', MAP_CASES)
+@pytest.mark.parametrize('batch_size', [1, 2, 65536])
+def test_mapper_batch(case: MapCase, batch_size: int) -> None:
+    key_func = _Key(*case.cmp_keys)
+
+    batches = ops.MapBatch(case.mapper)(ops.Batch(batch_size)(iter(copy.deepcopy(case.data))))
+    assert isinstance(batches, tp.Iterator)
+    result = ops.Unbatch()(batches)
+    assert sorted(result, key=key_func) == sorted(case.ground_truth, key=key_func)
+
+
+def test_filter_batch_condition() -> None:
+    mapper = ops.Filter(condition=lambda row: row['x'] > 1, batch_condition=lambda batch: [x > 1 for x in batch['x']])
+    batches = list(mapper.map_batch({'x': [1, 2, 3], 'y': ['a', 'b', 'c']}))
+    assert batches == [{'x': [2, 3], 'y': ['b', 'c']}]
+
+
 @dataclasses.dataclass
 class ReduceCase:
     reducer: ops.Reducer
@@ -389,6 +475,136 @@ def test_reducer(case: ReduceCase) -> None:
     assert sorted(result, key=key_func) == sorted(case.ground_truth, key=key_func)
 
 
+@pytest.mark.parametrize('case', REDUCE_CASES)
+@pytest.mark.parametrize('batch_size', [1, 3, 65536])
+def test_reducer_batch(case: ReduceCase, batch_size: int) -> None:
+    key_func = _Key(*case.cmp_keys)
+
+    batches = ops.ReduceBatch(case.reducer, case.reducer_keys)(ops.Batch(batch_size)(iter(copy.deepcopy(case.data))))
+    assert isinstance(batches, tp.Iterator)
+    result = ops.Unbatch()(batches)
+    assert sorted(result, key=key_func) == sorted(case.ground_truth, key=key_func)
+
+
+@pytest.mark.parametrize('reducer', [ops.Count('x'), ops.Sum('x'), ops.FirstReducer()])
+@pytest.mark.parametrize('batch_size', [1, 2, 65536])
+def test_reducer_batch_without_keys(reducer: ops.Reducer, batch_size: int) -> None:
+    data = [{'x': 1}, {'x': 2}, {'x': 3}]
+
+    expected = list(ops.Reduce(reducer, [])(iter(copy.deepcopy(data))))
+    batches = ops.ReduceBatch(reducer, [])(ops.Batch(batch_size)(iter(copy.deepcopy(data))))
+    assert list(ops.Unbatch()(batches)) == expected
+
+
+@pytest.mark.parametrize('batch_size', [1, 2, 65536])
+def test_reducer_batch_changing_columns(batch_size: int) -> None:
+    data = [{'k': 1, 'x': 1}, {'k': 1, 'x': 2, 'y': 0}, {'k': 2, 'x': 3, 'y': 1}, {'k': 2, 'x': 4}]
+
+    for reducer in (ops.Sum('x'), ops.FirstReducer()):
+        expected = list(ops.Reduce(reducer, ['k'])(iter(copy.deepcopy(data))))
+        batches = ops.ReduceBatch(reducer, ['k'])(ops.Batch(batch_size)(iter(copy.deepcopy(data))))
+        assert list(ops.Unbatch()(batches)) == expected
+
+
+def test_top_n_copies_rows() -> None:
+    rows = [{'k': 1, 'x': 1}, {'k': 1, 'x': 2}]
+    for row in ops.HashReduce(ops.TopN('x', 2), ['k'])(iter(rows)):
+        row['x'] = 0
+    assert rows == [{'k': 1, 'x': 1}, {'k': 1, 'x': 2}]
+
+
+def test_reducer_batch_hot_key() -> None:
+    rows = [{'k': 'hot', 'x': 1}] * 50000 + [{'k': 'cold', 'x': 2}]
+
+    batches = ops.ReduceBatch(ops.Sum('x'), ['k'])(ops.Batch(7)(iter(rows)))
+    assert list(ops.Unbatch()(batches)) == [{'k': 'hot', 'x': 50000}, {'k': 'cold', 'x': 2}]
+
+
+@pytest.mark.parametrize('case', [case for case in REDUCE_CASES if isinstance(case.reducer, ops.AlgebraicReducer)])
+@pytest.mark.parametrize('max_groups', [1, 2, 100000])
+def test_hash_reducer(case: ReduceCase, max_groups: int) -> None:
+    assert isinstance(case.reducer, ops.AlgebraicReducer)
+    data = copy.deepcopy(case.data)
+    random.Random(42).shuffle(data)
+
+    key_func = _Key(*case.cmp_keys)
+
+    result = ops.HashReduce(case.reducer, case.reducer_keys, max_groups=max_groups)(iter(data))
+    assert isinstance(result, tp.Iterator)
+    assert sorted(result, key=key_func) == sorted(case.ground_truth, key=key_func)
+
+
+@pytest.mark.parametrize('max_groups', [100000, 1])
+def test_approximate_reducers(max_groups: int) -> None:
+    rng = random.Random(42)
+    rows: list[ops.TRow] = [
+        {'site': 'a', 'user': rng.randrange(30000), 'page': int(rng.paretovariate(1.0)), 'latency': rng.random()}
+        for _ in range(50000)]
+    rows += [{'site': 'b', 'user': user, 'page': 7, 'latency': 1.0} for user in range(10)]
+    rng.shuffle(rows)
+    users = len({row['user'] for row in rows if row['site'] == 'a'})
+
+    def run(reducer: ops.AlgebraicReducer) -> list[ops.TRow]:
+        result = list(ops.HashReduce(reducer, ['site'], max_groups=max_groups)(iter(rows)))
+        return sorted(result, key=_Key('site'))
+
+    distinct = run(ops.ApproxDistinct('user', 'users'))
+    assert distinct[0]['users'] == approx(users, rel=0.05)
+    assert distinct[1] == {'site': 'b', 'users': 10}
+
+    pages = [row for row in rows if row['site'] == 'a']
+    top = sorted(((page, sum(row['page'] == page for row in pages)) for page in (1, 2, 3)), key=lambda x: -x[1])
+    hitters = run(ops.HeavyHitters('page', 3))
+    assert [(row['page'], row['count']) for row in hitters if row['site'] == 'a'] == top
+    assert [row for row in hitters if row['site'] == 'b'] == [{'site': 'b', 'page': 7, 'count': 10}]
+
+    quantiles = run(ops.ApproxQuantiles('latency', {'median': 0.5, 'p99': 0.99, 'max': 1.0}))
+    assert quantiles[0]['median'] == approx(0.5, abs=0.01)
+    assert quantiles[0]['p99'] == approx(0.99, abs=0.002)
+    assert quantiles[0]['max'] == max(row['latency'] for row in pages)
+    assert quantiles[1] == {'site': 'b', 'median': 1.0, 'p99': 1.0, 'max': 1.0}
+
+
+def test_heavy_hitters_sketch_memory() -> None:
+    reducer = ops.HeavyHitters('page', 1, width=256, depth=4)
+    assert reducer.max_groups < ops.AlgebraicReducer.max_groups
+    assert ops.HashReduce(reducer, ['site']).max_groups == reducer.max_groups
+    assert ops.HashReduce(reducer, ['site'], max_groups=7).max_groups == 7
+
+    def state(pages: tp.Iterable[int]) -> tp.Any:
+        result = reducer.initial()
+        for page in pages:
+            result = reducer.update(result, {'page': page})
+        return result
+
+    small = [1, 2, 1]
+    big = range(100, 101 + reducer.exact_limit)
+    assert state(small)[0] is None
+    assert state(big)[0] is not None
+    assert list(reducer.finalize(('site',), ('a',), reducer.merge(state(small), state(small)))) == \
+        [{'site': 'a', 'page': 1, 'count': 4}]
+    for left, right in [(big, small), (small, big)]:
+        [top] = reducer.finalize(('site',), ('a',), reducer.merge(state(left), state(right)))
+        assert top['page'] == 1 and top['count'] >= 2  # sketch may only overestimate
+
+
+@pytest.mark.parametrize('chunk_size, fan_in', [(65536, 64), (3, 2), (1, 2)])
+def test_sort(chunk_size: int, fan_in: int) -> None:
+    data: list[ops.TRow] = [{'key': key, 'value': value} for value, key in enumerate('ddbcaaedbc' * 3)]
+
+    result = ops.Sort(('key',), chunk_size=chunk_size, fan_in=fan_in)(iter(copy.deepcopy(data)))
+    assert isinstance(result, tp.Iterator)
+    assert list(result) == sorted(data, key=lambda row: row['key'])
+
+
+def test_sort_then_reduce() -> None:
+    data = [{'word': word} for word in 'b a c a b a'.split()]
+    ground_truth = [{'word': 'a', 'count': 3}, {'word': 'b', 'count': 2}, {'word': 'c', 'count': 1}]
+
+    sorted_rows = ops.Sort(('word',), chunk_size=2)(iter(data))
+    assert list(ops.Reduce(ops.Count(column='count'), ('word',))(sorted_rows)) == ground_truth
+
+
 @dataclasses.dataclass
 class JoinCase:
     joiner: ops.Joiner
@@ -602,6 +818,455 @@ def test_joiner(case: JoinCase) -> None:
     assert sorted(result, key=key_func) == sorted(case.ground_truth, key=key_func)
 
 
+@pytest.mark.parametrize('case', JOIN_CASES)
+@pytest.mark.parametrize('strategy', ['hash', 'grace'])
+def test_join_strategy(case: JoinCase, strategy: str) -> None:
+    data_left = copy.deepcopy(case.data_left)
+    data_right = copy.deepcopy(case.data_right)
+    random.Random(42).shuffle(data_right)
+
+    key_func = _Key(*case.cmp_keys)
+
+    result = ops.Join(case.joiner, case.join_keys, strategy=strategy, partitions=3)(iter(data_left), iter(data_right))
+    assert isinstance(result, tp.Iterator)
+    assert sorted(result, key=key_func) == sorted(case.ground_truth, key=key_func)
+
+
+@pytest.mark.parametrize('case', JOIN_CASES)
+@pytest.mark.parametrize('left, right', [(ops.Row.from_dict, ops.Row.from_dict), (ops.Row.from_dict, dict)])
+def test_join_schema_rows(case: JoinCase, left: tp.Callable[[ops.TRow], ops.TRow],
+                          right: tp.Callable[[ops.TRow], ops.TRow]) -> None:
+    key_func = _Key(*case.cmp_keys)
+
+    result = ops.Join(case.joiner, case.join_keys)(map(left, case.data_left), map(right, case.data_right))
+    assert sorted(result, key=key_func) == sorted(case.ground_truth, key=key_func)
+
+
+def test_schema_row() -> None:
+    row = ops.Row.from_dict({'key': 1, 'text': 'a', 'count': 2})
+    assert row == {'key': 1, 'text': 'a', 'count': 2}
+    assert list(row) == ['key', 'text', 'count'] and len(row) == 3
+    assert row['text'] == 'a' and row.get('missing') is None and 'count' in row
+
+    other = row.copy()
+    other['text'] = 'b'
+    other['extra'] = 3.5
+    del other['count']
+    assert row == {'key': 1, 'text': 'a', 'count': 2}
+    assert other == {'key': 1, 'text': 'b', 'extra': 3.5}
+    assert isinstance(row | other, ops.Row) and row | other == {'key': 1, 'text': 'b', 'count': 2, 'extra': 3.5}
+    assert {'text': 'c', 'new': 0} | row == {'text': 'a', 'new': 0, 'key': 1, 'count': 2}
+
+    restored = pickle.loads(pickle.dumps(row))
+    assert restored == row and restored._schema is row._schema
+
+    projected = next(ops.Project(['count', 'key'])(row))
+    assert isinstance(projected, ops.Row) and list(projected.items()) == [('count', 2), ('key', 1)]
+
+    rows = [ops.Row.from_dict({'key': i // 2, 'value': i}) for i in range(6)]
+    assert list(ops.Reduce(ops.Sum('value'), ['key'])(iter(rows))) == [
+        {'key': 0, 'value': 1}, {'key': 1, 'value': 5}, {'key': 2, 'value': 9}]
+
+
+def test_join_unknown_strategy() -> None:
+    with pytest.raises(ValueError):
+        ops.Join(ops.InnerJoiner(), ('key',), strategy='nested_loop')
+
+
+@pytest.mark.parametrize('workers, ordered', [(None, True), (2, True), (2, False)])
+def test_read_files(tmp_path: tp.Any, workers: int | None, ordered: bool) -> None:
+    lines = [f'{i}\tline {i}\n' for i in range(1000)]
+    (tmp_path / 'logs').mkdir()
+    (tmp_path / 'logs' / '0.txt').write_text(''.join(lines[:600]))
+    with gzip.open(tmp_path / 'logs' / '1.gz', 'wt') as f:
+        f.writelines(lines[600:900])
+    with bz2.open(tmp_path / 'logs' / '2.bz2', 'wt') as f:
+        f.writelines(lines[900:])
+
+    def parser(line: str) -> ops.TRow:
+        key, text = line.rstrip('\n').split('\t')
+        return {'key': int(key), 'text': text}
+
+    expected = [parser(line) for line in lines]
+    op = ops.ReadFiles(str(tmp_path / 'logs' / '*'), parser, workers=workers, ordered=ordered, split_size=1000)
+    assert len(op.shards()) == -(-len(''.join(lines[:600])) // 1000) + 2
+
+    result = op()
+    assert isinstance(result, tp.Iterator)
+    result_rows = list(result)
+    if not ordered:
+        result_rows.sort(key=_Key('key'))
+        expected.sort(key=_Key('key'))
+    assert result_rows == expected
+
+    with pytest.raises(FileNotFoundError):
+        list(ops.ReadFiles(str(tmp_path / '*.csv'), parser)())
+
+
+def test_binary_round_trip(tmp_path: tp.Any) -> None:
+    rows: list[ops.TRow] = [
+        {'doc_id': 1, 'text': 'hello, мир', 'tf': 0.5, 'ok': True, 'raw': b'\x00\xff'},
+        {'doc_id': -2, 'text': '', 'tf': 3, 'ok': False, 'raw': None},
+        {'doc_id': 3, 'text': None, 'tf': None, 'ok': None, 'raw': b''},
+    ]
+    schema = [('doc_id', int), ('text', str), ('tf', float), ('ok', bool), ('raw', bytes)]
+    filename = str(tmp_path / 'rows.bin')
+
+    assert list(ops.WriteBinary(filename, schema)(iter(rows))) == rows
+    result = ops.ReadBinary(filename)()
+    assert isinstance(result, tp.Iterator)
+    assert list(result) == rows
+
+    assert list(ops.WriteBinary(filename)(iter(rows[:1]))) == rows[:1]
+    assert list(ops.ReadBinary(filename)()) == rows[:1]
+
+    assert list(ops.WriteBinary(filename)(iter([]))) == []
+    assert list(ops.ReadBinary(filename)()) == []
+
+
+def test_binary_schema_errors(tmp_path: tp.Any) -> None:
+    filename = str(tmp_path / 'rows.bin')
+    with pytest.raises(ValueError):
+        list(ops.WriteBinary(filename)(iter([{'a': None}])))
+    with pytest.raises(TypeError):
+        list(ops.WriteBinary(filename, [('a', int)])(iter([{'a': 'one'}])))
+    with pytest.raises(TypeError):
+        list(ops.WriteBinary(filename, [('a', list)])(iter([{'a': []}])))
+
+
+def _word_count_graph(source: graph.Graph) -> graph.Graph:
+    return source.map(ops.FilterPunctuation('text')).map(ops.LowerCase('text')).map(ops.Split('text')) \
+        .sort(['text']).reduce(ops.Count('count'), ['text']).sort(['text'])
+
+
+def test_graph_word_count() -> None:
+    docs = [{'doc_id': 1, 'text': 'hello, my little WORLD'}, {'doc_id': 2, 'text': 'Hello, my little little hell'}]
+    ground_truth = [
+        {'count': 1, 'text': 'hell'},
+        {'count': 2, 'text': 'hello'},
+        {'count': 3, 'text': 'little'},
+        {'count': 2, 'text': 'my'},
+        {'count': 1, 'text': 'world'}
+    ]
+
+    result = _word_count_graph(graph.Graph.from_iter('docs')).run(docs=lambda: iter(copy.deepcopy(docs)))
+    assert isinstance(result, tp.Iterator)
+    assert list(result) == ground_truth
+
+
+def test_graph_plan() -> None:
+    plan, = graph._Planner([_word_count_graph(graph.Graph.from_iter('docs'))]).optimize()
+
+    operations = []
+    node = plan
+    while node.parents:
+        operations.append(node.operation)
+        node = node.parents[0]
+    # maps are fused, last sort is dropped as reduce output is already sorted by 'text'
+    assert [type(operation) for operation in operations] == [ops.Reduce, ops.Sort, ops.Map]
+
+
+def test_graph_fused_maps_stream_rows() -> None:
+    seen = []
+
+    def condition(row: ops.TRow) -> bool:
+        seen.append(row['text'])
+        return True
+
+    rows = graph._MapperChain([ops.Split('text'), ops.Filter(condition), ops.DummyMapper()])({'text': 'a b c'})
+    assert next(rows) == {'text': 'a'} and seen == ['a']
+    assert list(rows) == [{'text': 'b'}, {'text': 'c'}] and seen == ['a', 'b', 'c']
+
+
+def test_graph_push_below_join() -> None:
+    players = graph.Graph.from_iter('players')
+    games = graph.Graph.from_iter('games')
+    joined = games.join(ops.InnerJoiner(), players, ['player_id'], strategy='hash') \
+        .map(ops.Filter(lambda row: row['player_id'] > 1, columns=['player_id'])) \
+        .map(ops.Project(['player_id', 'username']))
+
+    plan, = graph._Planner([joined]).optimize()
+    assert isinstance(plan.parents[0].operation, ops.Join)
+    assert all(isinstance(parent.operation, ops.Map) for parent in plan.parents[0].parents)
+
+    result = joined.run(
+        players=lambda: iter([{'player_id': 1, 'username': 'XeroX'}, {'player_id': 2, 'username': 'jay'}]),
+        games=lambda: iter([{'game_id': 1, 'player_id': 2, 'score': 3}, {'game_id': 2, 'player_id': 1, 'score': 4}])
+    )
+    assert list(result) == [{'player_id': 2, 'username': 'jay'}]
+
+    # pruned schema-bound rows stay schema-bound
+    result = joined.run(
+        players=lambda: map(ops.Row.from_dict, [{'player_id': 2, 'username': 'jay', 'rating': 5}]),
+        games=lambda: map(ops.Row.from_dict, [{'game_id': 1, 'player_id': 2, 'score': 3}])
+    )
+    rows = list(result)
+    assert rows == [{'player_id': 2, 'username': 'jay'}] and type(rows[0]) is ops.Row
+
+
+def test_graph_shared_subgraph() -> None:
+    calls = []
+
+    def docs() -> tp.Iterator[ops.TRow]:
+        calls.append(1)
+        yield from [{'doc_id': 1, 'text': 'a b'}, {'doc_id': 2, 'text': 'b'}]
+
+    words = graph.Graph.from_iter('docs').map(ops.Split('text'))
+    counts = words.sort(['text']).reduce(ops.Count('count'), ['text'])
+    doc_count = graph.Graph.from_iter('docs').map(ops.Split('text')).reduce(ops.Count('docs'), [])
+
+    result = graph.Graph.run_many({'counts': counts, 'total': doc_count}, docs=docs)
+    assert list(result['counts']) == [{'text': 'a', 'count': 1}, {'text': 'b', 'count': 2}]
+    assert list(result['total']) == [{'docs': 3}]
+    assert len(calls) == 1
+
+
+@pytest.mark.parametrize('workers', [None, 2])
+def test_graph_shared_subgraph_mutating_branch(workers: int | None) -> None:
+    rows = [{'text': 'Hello'}, {'text': 'WORLD'}]
+    source = graph.Graph.from_iter('rows')
+    lowered = source.map(ops.LowerCase('text'))
+    kept = source.map(ops.DummyMapper())
+    # independently built graph reading the same source is merged with the others by planner
+    kept_again = graph.Graph.from_iter('rows').map(ops.DummyMapper())
+
+    result = graph.Graph.run_many({'lowered': lowered, 'kept': kept, 'kept_again': kept_again}, workers=workers,
+                                  rows=lambda: iter(copy.deepcopy(rows)))
+    assert list(result['lowered']) == [{'text': 'hello'}, {'text': 'world'}]
+    assert list(result['kept']) == rows
+    assert list(result['kept_again']) == rows
+
+
+@pytest.mark.parametrize('strategy', ops.Join.STRATEGIES)
+def test_graph_parallel(strategy: str) -> None:
+    docs = [{'doc_id': i, 'text': ' '.join(f'w{j % 7}' for j in range(i, 3 * i))} for i in range(50)]
+    words = graph.Graph.from_iter('docs').map(ops.Split('text'))
+    counts = words.sort(['text']).reduce(ops.Count('count'), ['text'])
+    doc_counts = words.hash_reduce(ops.Count('words'), ['doc_id'])
+    joined = words.sort(['text']).join(ops.InnerJoiner(), counts, ['text'], strategy=strategy) \
+        .sort(['doc_id', 'text']).reduce(ops.FirstReducer(), ['doc_id', 'text'])
+    graphs = {'counts': counts, 'doc_counts': doc_counts, 'joined': joined}
+
+    expected = {name: list(rows) for name, rows in graph.Graph.run_many(graphs, docs=lambda: iter(docs)).items()}
+    result = graph.Graph.run_many(graphs, workers=3, docs=lambda: iter(docs))
+
+    assert list(result['counts']) == expected['counts']
+    assert sorted(result['doc_counts'], key=_Key('doc_id')) == sorted(expected['doc_counts'], key=_Key('doc_id'))
+    assert list(result['joined']) == expected['joined']
+
+
+def test_graph_parallel_unconsumed_outputs(tmp_path: tp.Any, monkeypatch: tp.Any) -> None:
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    docs = [{'doc_id': i, 'text': f'w{i % 3} w{i % 5}'} for i in range(20)]
+    words = graph.Graph.from_iter('docs').map(ops.Split('text'))
+    counts = words.sort(['text']).reduce(ops.Count('count'), ['text'])
+    before = set(multiprocessing.active_children())
+
+    # workers are not started until some output is read
+    result = counts.run(workers=2, docs=lambda: iter(docs))
+    assert set(multiprocessing.active_children()) == before
+    del result
+
+    results = graph.Graph.run_many({'counts': counts, 'unused': words.map(ops.DummyMapper())}, workers=2,
+                                   docs=lambda: iter(docs))
+    assert len(list(results['counts'])) == 5
+    # 'unused' is never read, so workers stay until the outputs are collected
+    assert set(multiprocessing.active_children()) != before
+    del results
+    gc.collect()
+    assert set(multiprocessing.active_children()) == before
+    assert not list(tmp_path.iterdir())
+
+
+def test_profiler() -> None:
+    profiler = profiling.Profiler()
+    rows = [{'text': text} for text in 'aaaabbcdddddddd']
+    op = profiler.wrap(ops.Reduce(ops.Count('count'), ['text']))
+
+    assert list(op(iter(rows))) == [{'text': 'a', 'count': 4}, {'text': 'b', 'count': 2},
+                                    {'text': 'c', 'count': 1}, {'text': 'd', 'count': 8}]
+    stats, = profiler.stages
+    assert stats.name == 'Reduce(Count)'
+    assert (stats.rows_in, stats.rows_out) == (15, 4)
+    assert stats.group_sizes() == [(1, 1, 1), (2, 3, 1), (4, 7, 1), (8, 15, 1)]
+    assert stats.wall >= stats.self_wall >= 0
+    assert 'group sizes: 1: 1, 2-3: 1, 4-7: 1, 8-15: 1' in profiler.report()
+
+
+def test_graph_profiler() -> None:
+    docs = [{'doc_id': i, 'text': 'a b c'} for i in range(100)]
+    profiler = profiling.Profiler()
+    counts = graph.Graph.from_iter('docs').map(ops.Split('text')).sort(['text']).reduce(ops.Count('count'), ['text'])
+    assert len(list(counts.run(profiler=profiler, docs=lambda: iter(docs)))) == 3
+
+    assert [(stats.name, stats.rows_in, stats.rows_out) for stats in profiler.stages] == [
+        ('ReadIterFactory', 0, 100), ('Map(Split)', 100, 300), ('Sort', 300, 300), ('Reduce(Count)', 300, 3)]
+    assert profiler.stages[-1].group_sizes() == [(64, 127, 3)]
+    assert all(stats.wall >= stats.self_wall for stats in profiler.stages)
+    for line in profiler.folded().splitlines():
+        stack, weight = line.rsplit(' ', 1)
+        assert stack.startswith('Reduce(Count)') and int(weight) > 0
+
+
+def test_graph_checkpoint(tmp_path: tp.Any) -> None:
+    (tmp_path / 'docs.txt').write_text('hello world\nhello\n')
+    parsed: list[str] = []
+
+    def parser(line: str) -> ops.TRow:
+        parsed.append(line)
+        return {'text': line.strip()}
+
+    store = checkpoints.CheckpointStore(str(tmp_path / 'checkpoints'))
+    words = graph.Graph.from_file(str(tmp_path / 'docs.txt'), parser).map(ops.Split('text')).checkpoint(store)
+    counts = words.sort(['text']).reduce(ops.Count('count'), ['text'])
+    expected = [{'text': 'hello', 'count': 2}, {'text': 'world', 'count': 1}]
+
+    assert list(counts.run()) == expected
+    assert len(parsed) == 2
+    assert list(counts.run()) == expected
+    assert len(parsed) == 2
+
+    with open(tmp_path / 'docs.txt', 'a') as f:
+        f.write('world\n')
+    assert list(counts.run()) == [{'text': 'hello', 'count': 2}, {'text': 'world', 'count': 2}]
+    assert len(parsed) == 5
+
+    other = graph.Graph.from_file(str(tmp_path / 'docs.txt'), parser).map(ops.Split('text', ';')).checkpoint(store)
+    assert len(list(other.run())) == 3
+    assert len(parsed) == 8
+
+
+def test_graph_incremental_reduce(tmp_path: tp.Any) -> None:
+    parsed: list[str] = []
+
+    def parser(line: str) -> ops.TRow:
+        parsed.append(line)
+        return {'text': line.strip()}
+
+    store = checkpoints.CheckpointStore(str(tmp_path / 'checkpoints'))
+    counts = graph.Graph.from_files(str(tmp_path / '*.txt'), parser).map(ops.Split('text')) \
+        .incremental_reduce(ops.Count('count'), ['text'], store)
+
+    (tmp_path / '1.txt').write_text('a b\n')
+    (tmp_path / '2.txt').write_text('b\n')
+    assert list(counts.run()) == [{'text': 'a', 'count': 1}, {'text': 'b', 'count': 2}]
+    assert len(parsed) == 2
+
+    (tmp_path / '3.txt').write_text('c b\n')
+    assert list(counts.run()) == [{'text': 'a', 'count': 1}, {'text': 'b', 'count': 3}, {'text': 'c', 'count': 1}]
+    assert len(parsed) == 3
+
+    (tmp_path / '1.txt').write_text('c\n')
+    assert list(counts.run()) == [{'text': 'b', 'count': 2}, {'text': 'c', 'count': 2}]
+    assert len(parsed) == 6
+
+    with pytest.raises(ValueError):
+        graph.Graph.from_iter('docs').incremental_reduce(ops.Count('count'), ['text'], store)
+
+
+@pytest.mark.parametrize('func_joiner', [ops.InnerJoiner, ops.LeftJoiner, ops.RightJoiner])
+def test_join_spilled_groups(func_joiner: tp.Type[ops.Joiner]) -> None:
+    rows_a = [{'key': key, 'a': i} for key in range(3) for i in range(key * 5)]
+    rows_b = [{'key': key, 'b': i} for key in range(3) for i in range(key * 7)]
+    expected = list(ops.Join(func_joiner(), ['key'])(rows_a, rows_b))
+    assert list(ops.Join(func_joiner(max_group_rows=3), ['key'])(rows_a, rows_b)) == expected
+
+    with ops._GroupBuffer(iter(rows_b), limit=3, chunk_size=2) as group:
+        assert group.spilled and bool(group)
+        iterator = iter(group)
+        assert next(iterator) == rows_b[0]
+        assert list(group) == rows_b  # iterations are independent
+        assert list(iterator) == rows_b[1:]
+
+
+def test_windows() -> None:
+    events = [
+        {'user': 'a', 'time': 1}, {'user': 'b', 'time': 2}, {'user': 'a', 'time': 4},
+        {'user': 'a', 'time': 12}, {'user': 'a', 'time': 9},  # late, but within lateness
+        {'user': 'a', 'time': 15}, {'user': 'a', 'time': 3},  # too late, window [0, 10) is already emitted
+        {'user': 'b', 'time': 25},
+    ]
+    tumbling = ops.TumblingWindow(ops.Count('count'), ['user'], 'time', size=10, lateness=5)
+    assert list(tumbling(iter(events))) == [
+        {'user': 'a', 'count': 3, 'window_start': 0, 'window_end': 10},
+        {'user': 'b', 'count': 1, 'window_start': 0, 'window_end': 10},
+        {'user': 'a', 'count': 2, 'window_start': 10, 'window_end': 20},
+        {'user': 'b', 'count': 1, 'window_start': 20, 'window_end': 30},
+    ]
+
+    sliding = ops.SlidingWindow(ops.Sum('time'), [], 'time', size=10, slide=5)
+    assert list(sliding(iter([{'time': 1}, {'time': 6}, {'time': 12}]))) == [
+        {'time': 1, 'window_start': -5, 'window_end': 5},
+        {'time': 7, 'window_start': 0, 'window_end': 10},
+        {'time': 18, 'window_start': 5, 'window_end': 15},
+        {'time': 12, 'window_start': 10, 'window_end': 20},
+    ]
+
+    # the first row of both windows containing it is the same row
+    sliding = ops.SlidingWindow(ops.FirstReducer(), [], 'time', size=10, slide=5)
+    assert list(sliding(iter([{'time': 2}, {'time': 7}]))) == [
+        {'time': 2, 'window_start': -5, 'window_end': 5},
+        {'time': 2, 'window_start': 0, 'window_end': 10},
+        {'time': 7, 'window_start': 5, 'window_end': 15},
+    ]
+
+    # the last row fills the gap between two sessions, so they are merged
+    sessions = ops.SessionWindow(ops.FirstReducer(), ['user'], 'time', gap=3, lateness=10)
+    rows = [{'user': 'a', 'time': 1}, {'user': 'a', 'time': 6}, {'user': 'b', 'time': 5}, {'user': 'a', 'time': 3.5}]
+    assert list(sessions(iter(rows))) == [
+        {'user': 'b', 'time': 5, 'window_start': 5, 'window_end': 8},
+        {'user': 'a', 'time': 1, 'window_start': 1, 'window_end': 9},
+    ]
+
+    # session [1, 4) of 'a' is emitted before rows at 2 and 3.5 come, they would overlap it
+    sessions = ops.SessionWindow(ops.Count('count'), ['user'], 'time', gap=3, lateness=2)
+    rows = [{'user': 'a', 'time': 1}, {'user': 'b', 'time': 6}, {'user': 'a', 'time': 2}, {'user': 'a', 'time': 3.5},
+            {'user': 'a', 'time': 4.5}]
+    assert list(sessions(iter(rows))) == [
+        {'user': 'a', 'count': 1, 'window_start': 1, 'window_end': 4},
+        {'user': 'a', 'count': 1, 'window_start': 4.5, 'window_end': 7.5},
+        {'user': 'b', 'count': 1, 'window_start': 6, 'window_end': 9},
+    ]
+
+
+def test_windows_unbounded_input() -> None:
+    def events() -> ops.TRowsGenerator:
+        for moment in itertools.count():
+            yield {'user': str(moment % 3), 'time': moment}
+
+    windows = graph.Graph.from_iter('events') \
+        .window(ops.TumblingWindow(ops.Count('count'), ['user'], 'time', size=30, lateness=2))
+    rows = list(itertools.islice(windows.run(events=events), 9))
+    assert rows == [{'user': str(user), 'count': 10, 'window_start': start, 'window_end': start + 30}
+                    for start in (0, 30, 60) for user in range(3)]
+
+    sessions = ops.SessionWindow(ops.Count('count'), ['user'], 'time', gap=100)
+    rows = list(itertools.islice(sessions({'user': 'a', 'time': moment * 200} for moment in itertools.count()), 3))
+    assert [row['window_start'] for row in rows] == [0, 200, 400]
+
+
+def test_benchmark(tmp_path: tp.Any) -> None:
+    rows = list(benchmark.zipf_rows(1000, vocabulary=100, grouped=True))
+    keys = [row['key'] for row in rows]
+    assert len(rows) == 1000 and keys == sorted(keys) and keys.count(keys[0]) > keys.count(keys[-1])
+    left, right = map(list, benchmark.skewed_join(1000, keys=10, hot_share=0.5))
+    assert len(left) == 10 and sum(row['key'] == left[0]['key'] for row in right) == 500
+    assert len(list(benchmark.long_texts(3, words_per_text=10))[2]['text'].split()) == 10
+
+    cases = {case.name: case for case in benchmark.cases(scale=0.001)}
+    results = {name: benchmark.measure(cases[name]) for name in ('map/Split', 'join/InnerJoiner/skewed')}
+    assert results['map/Split'].rows == 2 and results['join/InnerJoiner/skewed'].rows == 102
+    filename = str(tmp_path / 'baseline.json')
+    benchmark.save(results, filename)
+    baseline = benchmark.load(filename)
+    assert baseline == results and benchmark.compare(results, baseline) == []
+
+    slow = {'map/Split': benchmark.Result(rows=2, seconds=results['map/Split'].seconds * 2, peak_memory=0)}
+    assert len(benchmark.compare(slow, baseline)) == 1
+    fat = {'map/Split': dataclasses.replace(results['map/Split'], peak_memory=100 * MiB)}
+    assert len(benchmark.compare(fat, baseline)) == 1
+
+
 # ########## HEAVY TESTS WITH MEMORY TRACKING ##########
 
 
@@ -673,6 +1338,16 @@ def test_heavy_reduce(func_reducer: ops.Reducer, additional_memory: int, baselin
     run_and_track_memory(lambda: next(op), int(baseline_memory + additional_memory))
 
 
+def test_heavy_hash_reduce(baseline_memory: int) -> None:
+    op = ops.HashReduce(ops.Count(column='count'), ('value', ), max_groups=10000)(get_reduce_data())
+    run_and_track_memory(lambda: next(op), baseline_memory + 10 * MiB)
+
+
+def test_heavy_sort(baseline_memory: int) -> None:
+    op = ops.Sort(('value', ))(get_reduce_data())
+    run_and_track_memory(lambda: next(op), baseline_memory + 30 * MiB)
+
+
 @pytest.mark.parametrize('func_joiner, additional_memory', [
     (ops.InnerJoiner(), 100 * MiB),
     (ops.LeftJoiner(), 100 * MiB),
@@ -683,6 +1358,21 @@ def test_heavy_join(func_joiner: ops.Joiner, additional_memory: int, baseline_me
     run_and_track_memory(lambda: next(op), baseline_memory + additional_memory)
 
 
+def get_hot_key_data() -> tp.Generator[dict[str, tp.Any], None, None]:
+    time.sleep(0.1)  # Some sleep for watchdog catch the memory change
+    for i in range(1000000):
+        yield {'key': 'hot', 'value': i}
+
+
+@pytest.mark.parametrize('func_joiner', [
+    ops.InnerJoiner(max_group_rows=10000),
+    ops.LeftJoiner(max_group_rows=10000),
+])
+def test_heavy_skewed_join(func_joiner: ops.Joiner, baseline_memory: int) -> None:
+    op = ops.Join(func_joiner, ('key', ))([{'key': 'hot', 'name': 'a'}], get_hot_key_data())
+    run_and_track_memory(lambda: next(op), baseline_memory + 10 * MiB)
+
+
 def get_complexity_join_data() -> tp.Generator[dict[str, tp.Any], None, None]:
     for n in range(100500):
         yield {'key': n, 'value': n}
@@ -693,5 +1383,6 @@ def get_complexity_join_data() -> tp.Generator[dict[str, tp.Any], None, None]:
     ops.LeftJoiner(),
     ops.RightJoiner()
 ])
-def test_complexity_join(func_joiner: ops.Joiner) -> None:
-    list(ops.Join(func_joiner, ('key', ))(get_complexity_join_data(), get_complexity_join_data()))
+@pytest.mark.parametrize('strategy', ops.Join.STRATEGIES)
+def test_complexity_join(func_joiner: ops.Joiner, strategy: str) -> None:
+    list(ops.Join(func_joiner, ('key', ), strategy=strategy)(get_complexity_join_data(), get_complexity_join_data()))